@@ -0,0 +1,270 @@
+# Copyright 2025 Jedielson da Fonseca
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Author: Jedielson da Fonseca jdfn7@proton.me
+
+"""Benchmarks of the rename engine.
+
+Generates synthetic folders (on tmpfs and on a disk-backed temp dir) and times
+each phase of a batch through the same engine calls the window makes:
+
+    load       listing + sorting, as "Load names"        (FolderLoader)
+    validate   parsing and checking both lists           (_get_and_validate_inputs)
+    conflicts  snapshot, conflict search and suffixes    (_handle_name_conflicts)
+    rename     planning and execution, with the journal  (_execute_rename)
+    undo       reading the history, safety check, undo   (undo)
+
+Results are written as JSON with seconds, files/sec and peak RSS per phase:
+
+    python benchmarks/bench_engine.py --output results.json
+    python benchmarks/bench_engine.py --sizes 1000,10000 --roots tmpfs --compare results.json
+    python benchmarks/bench_engine.py --orders name,natural,mtime --sizes 100000
+
+Everything is seeded, so two runs with the same arguments rename the same names.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import string
+import argparse
+import itertools
+import platform
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import massrenamer_engine as engine
+
+SIZES = (1000, 10000, 100000, 1000000)
+NAME_LENGTHS = (12, 120)
+CONFLICT_RATES = (0.0, 0.05)
+MISSING_RATES = (0.0, 0.05)
+ILLEGAL_RATES = (0.0, 0.05)
+ORDERS = ("name",)
+PHASES = ("load", "validate", "conflicts", "rename", "undo")
+NAME_CHARS = string.ascii_letters + string.digits + "-_ "
+
+
+# --- Peak memory ---
+def reset_peak_rss():
+    """Resets the kernel's high-water mark so the next reading covers one phase (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# --- Synthetic folders ---
+def random_name(rng, length, index, ext=".dat"):
+    # The index keeps names unique whatever the random part is
+    stem = f"{index:07d}_" + "".join(rng.choice(NAME_CHARS) for _ in range(max(0, length - 8 - len(ext))))
+    return stem.strip() + ext
+
+def make_scenario(root, files, name_length, conflict_rate, missing_rate, illegal_rate, seed):
+    """Creates a folder and a mapping. Returns (folder, origs, news)."""
+    rng = random.Random(seed)
+    folder = tempfile.mkdtemp(prefix="massrenamer-bench-", dir=root)
+    origs = [random_name(rng, name_length, i) for i in range(files)]
+    for name in origs:
+        os.close(os.open(os.path.join(folder, name), os.O_CREAT | os.O_WRONLY, 0o644))
+    news = [f"new_{name}" for name in origs]
+
+    # Existing names outside the batch, used as conflicting targets
+    n_conflicts = int(files * conflict_rate)
+    taken = [random_name(rng, name_length, files + i, ".taken") for i in range(n_conflicts // 2)]
+    for name in taken:
+        os.close(os.open(os.path.join(folder, name), os.O_CREAT | os.O_WRONLY, 0o644))
+    picks = rng.sample(range(files), n_conflicts)
+    for k, i in enumerate(picks):
+        # Half point at existing files, half duplicate another new name
+        news[i] = taken[k] if k < len(taken) else news[(i + 1) % files]
+
+    for i in rng.sample(range(files), int(files * missing_rate)):
+        origs[i] = f"missing_{origs[i]}"
+    # New names the sanitizer rejects, so validation also cleans them
+    for i in rng.sample(range(files), int(files * illegal_rate)):
+        news[i] = f"bad:{i}?{news[i]}"
+    return folder, origs, news
+
+
+# --- Phases ---
+def run_scenario(folder, origs, news, work_dir, order="name"):
+    history_path = os.path.join(work_dir, "bench.history")
+    timings = {}
+
+    def phase(name, func):
+        reset_peak_rss()
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        timings[name] = {
+            "seconds": round(seconds, 6),
+            "files_per_sec": round(len(origs) / seconds, 1) if seconds else None,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        return result
+
+    def load():
+        # Times and sizes come with the listing when the order needs them
+        stats = {} if order in ("mtime", "size") else None
+        names = list(engine.iter_files(folder, stats))
+        return engine.FolderListing(folder, names, stats).sorted(order)
+    phase("load", load)
+
+    # The window reads both lists back from the editors as text
+    orig_text, new_text = "\n".join(origs), "\n".join(news)
+    def validate():
+        o, n = engine.parse_names(orig_text), engine.parse_names(new_text)
+        engine.check_folder(folder, work_dir)
+        engine.check_mapping(o, n)
+        sanitizer = engine.sanitizer_for()
+        if sanitizer.check(n):
+            # The window offers to clean the names; accepting is the slower path
+            n = sanitizer.clean(n)
+        return o, n
+    o, n = phase("validate", validate)
+
+    def conflicts():
+        snapshot = engine.take_snapshot(folder, o)
+        found = engine.find_conflicts(o, n, snapshot)
+        return snapshot, engine.resolve_conflicts(o, n, found, snapshot) if found else n
+    snapshot, n = phase("conflicts", conflicts)
+
+    def rename():
+        steps = engine.plan(o, n)
+        return sum(1 for status, *_ in engine.execute(folder, steps, snapshot, history_path) if status == "renamed")
+    renamed = phase("rename", rename)
+
+    def undo():
+        history = engine.load_history(history_path)
+        if not engine.can_undo(history):
+            raise RuntimeError("undo safety check failed")
+        return sum(1 for status, *_ in engine.undo(history) if status == "undone")
+    phase("undo", undo)
+    return timings, renamed
+
+
+# --- Comparison ---
+def compare(results, baseline_path, threshold):
+    """Prints phases slower than threshold times the baseline. Returns the number of regressions."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {scenario_key(r): r for r in json.load(f)["results"]}
+    regressions = 0
+    for r in results:
+        old = baseline.get(scenario_key(r))
+        if not old:
+            continue
+        for name in PHASES:
+            before, after = old["phases"][name]["seconds"], r["phases"][name]["seconds"]
+            if before and after / before > threshold:
+                regressions += 1
+                print(f"REGRESSION {scenario_key(r)} {name}: {before:.4f}s -> {after:.4f}s ({after / before:.2f}x)", file=sys.stderr)
+    return regressions
+
+def scenario_key(r):
+    return (f"{r['root']}/{r['files']}/len{r['name_length']}/c{r['conflict_rate']}/m{r['missing_rate']}"
+            f"/i{r.get('illegal_rate', 0.0)}/{r.get('order', 'name')}")
+
+
+def parse_list(text, cast):
+    return tuple(cast(x) for x in text.split(",") if x.strip())
+
+def default_roots():
+    roots = {}
+    if os.path.isdir("/dev/shm"):
+        roots["tmpfs"] = "/dev/shm"
+    roots["disk"] = os.environ.get("MASSRENAMER_BENCH_DISK", "/var/tmp")
+    return roots
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated file counts")
+    parser.add_argument("--name-lengths", default=",".join(map(str, NAME_LENGTHS)))
+    parser.add_argument("--conflict-rates", default=",".join(map(str, CONFLICT_RATES)))
+    parser.add_argument("--missing-rates", default=",".join(map(str, MISSING_RATES)))
+    parser.add_argument("--illegal-rates", default=",".join(map(str, ILLEGAL_RATES)))
+    parser.add_argument("--orders", default=",".join(ORDERS),
+                        help=f"comma-separated sort orders for the load phase: {', '.join(engine.SORT_ORDERS)}")
+    parser.add_argument("--roots", default="tmpfs,disk", help="tmpfs and/or disk (disk dir: $MASSRENAMER_BENCH_DISK or /var/tmp)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown reported as a regression (default: 1.25)")
+    args = parser.parse_args(argv)
+
+    available = default_roots()
+    roots = [r for r in parse_list(args.roots, str) if r in available]
+    orders = parse_list(args.orders, str)
+    unknown = set(orders) - set(engine.SORT_ORDERS)
+    if unknown:
+        parser.error(f"unknown sort order(s): {', '.join(sorted(unknown))}")
+    results = []
+    grid = itertools.product(roots, parse_list(args.sizes, int), parse_list(args.name_lengths, int),
+                             parse_list(args.conflict_rates, float), parse_list(args.missing_rates, float),
+                             parse_list(args.illegal_rates, float), orders)
+    for root_name, files, name_length, conflict_rate, missing_rate, illegal_rate, order in grid:
+        folder, origs, news = make_scenario(available[root_name], files, name_length,
+                                            conflict_rate, missing_rate, illegal_rate, args.seed)
+        work_dir = tempfile.mkdtemp(prefix="massrenamer-bench-work-")
+        try:
+            timings, renamed = run_scenario(folder, origs, news, work_dir, order)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        result = {"root": root_name, "files": files, "name_length": name_length,
+                  "conflict_rate": conflict_rate, "missing_rate": missing_rate, "illegal_rate": illegal_rate,
+                  "order": order, "renamed": renamed, "phases": timings}
+        results.append(result)
+        print(scenario_key(result), " ".join(f"{p}={timings[p]['seconds']:.3f}s" for p in PHASES),
+              file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "roots": {r: available[r] for r in roots},
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "peak_rss_per_phase": reset_peak_rss(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,28 +14,36 @@
 # Author: Jedielson da Fonseca jdfn7@proton.me
 
 import os
-import json
 import sys
-import shutil
-from collections import Counter
+import time
+_MODULE_STARTED = time.perf_counter()
+import contextlib
+from collections import deque
+
+# A frozen build starts its metadata reader processes with this same executable
+# (freeze_support() does nothing otherwise, so multiprocessing is not imported)
+if __name__ == '__main__' and getattr(sys, 'frozen', False):
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+# Any "--option" means a headless run: dispatch before Qt is imported
+if __name__ == '__main__' and any(arg.startswith('--') for arg in sys.argv[1:]):
+    from massrenamer_cli import main
+    sys.exit(main())
+
+import massrenamer_engine as engine
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QGridLayout, QLabel, QLineEdit,
     QPushButton, QPlainTextEdit, QFileDialog, QMessageBox,
     QHBoxLayout, QMenu, QWidgetAction, QDialog, QVBoxLayout,
-    QTabWidget, QCheckBox, QDialogButtonBox
+    QTabWidget, QCheckBox, QDialogButtonBox, QTableView, QHeaderView, QComboBox
 )
-from PyQt6.QtGui import QIcon, QPainter, QCursor, QFont
-from PyQt6.QtCore import Qt, QRect, QSize, QSettings
-
-# --- Character sets for different OS ---
-# Based on common restrictions. Note that filesystems (like FAT32) can add more.
-ILLEGAL_CHARS_LINUX = set('/')
-ILLEGAL_CHARS_WINDOWS = set('/\\:*?"<>|')
-ILLEGAL_CHARS_MACOS = set('/:')
-ILLEGAL_CHARS_IOS = set('/:') # Similar to macOS
-# Android often uses Windows-like filesystems (FAT32, exFAT) for external storage (SD cards),
-# so it's safest to block the same characters as Windows for broad compatibility.
-ILLEGAL_CHARS_ANDROID = set('/\\:*?"<>|')
+from PyQt6.QtGui import QIcon, QPainter, QCursor, QFont, QTextCursor, QStaticText, QColor, QResizeEvent
+from PyQt6.QtCore import (
+    Qt, QRect, QRectF, QSize, QPointF, QEvent, QSettings, QObject, QThread, QTimer, pyqtSignal,
+    QAbstractTableModel, QModelIndex, QSocketNotifier
+)
+_IMPORTS_DONE = time.perf_counter()
 
 # --- Stylesheets ---
 
@@ -891,8 +899,13 @@ LANG_TEXTS = {
         "log": "Log", "rename": "Rename", "undo": "Undo", "error": "Error", "yes": "Yes", "no": "No",
         "map_error": "Mapping Error", "invalid_chars": "Invalid Characters",
         "invalid_chars_msg": "The following characters are not allowed: {0}\nDo you want to remove them?",
+        "invalid_names_chars": "The following characters are not allowed: {0}",
+        "invalid_names_too_long": "{0} names are longer than 255 bytes",
+        "invalid_names_reserved": "{0} names are reserved by Windows (CON, NUL, COM1...)",
+        "invalid_names_trailing": "{0} names end with a dot or a space",
+        "invalid_names_question": "Do you want to fix them (remove the characters, shorten long names and add \"_\" to reserved ones)?",
         "not_found": "Not found or not a file:", "error_renaming": "Error renaming", "done": "🏁 Done.",
-        "undo_confirm": "Are you sure you want to undo the last renaming operation?",
+        "undo_confirm": "Are you sure you want to undo the last renaming operation?\n\n{0} renames in {1} ({2}).\nEarlier operations that can be undone after this one: {3}.",
         "undo_done": "🏁 Undo completed.",
         "undoing": "⏮︎ Undoing...", "error_undoing": "Error undoing",
         "cannot_list": "Could not list files:", "select_valid_folder": "Select a valid folder.",
@@ -903,9 +916,14 @@ LANG_TEXTS = {
         "conflict_info": (
             "• Click on <b>\"Rename\"</b> to add a numeric suffix (e.g., name_(1).txt) to all conflicting names and continue.<br><br>"
             "• Click on <b>\"List Errors\"</b> to cancel the operation and see the lines with problems in the Log area for manual correction.<br><br>"
+            "• Click on <b>\"Duplicates\"</b> to do the same and also list the files with identical contents.<br><br>"
             "• Click on <b>\"Cancel\"</b> to close this window without doing anything."
         ),
         "conflict_btn_rename": "Rename", "conflict_btn_list": "List Errors", "conflict_btn_cancel": "Cancel",
+        "conflict_btn_duplicates": "Duplicates",
+        "duplicates_none": "No original files have identical contents.",
+        "duplicates_found": "Original files with identical contents ({0} groups):",
+        "duplicates_line": "Lines {0}: {1}",
         "help_text": "<p>1. Select the folder where the files are located.<br>2. Click \"Load names\" or enter the original names manually.<br>3. Enter the new names.<br>4. Click on \"Rename\".</p><p><b>NOTE:</b> The file on line \"1\" of original names will be renamed to the name on line \"1\" of new names, and so on.</p><hr><p>Version: 2.3.1<br>License: <a href=\"https://www.apache.org/licenses/LICENSE-2.0.html\">Apache 2.0</a><br>Author: <a href=\"https://www.instagram.com/jedifonseca/\">Jedielson da Fonseca</a><br><a href=\"https://github.com/JediFonseca/mass_renamer\">Github</a></p>",
         "apply": "Apply", "cancel": "Cancel", "invalid_chars_os": "Disallow invalid characters for:",
         "invalid_chars_windows": "Windows", "invalid_chars_macos": "macOS",
@@ -918,8 +936,44 @@ LANG_TEXTS = {
         "forbidden_dir_msg": "This is the application's configuration directory. Renaming files here is not permitted.",
         "log_saved_rename": "This log has been saved to: {0}\nIt will be overwritten on the next 'Rename' operation.",
         "log_saved_undo": "This log has been saved to: {0}\nIt will be overwritten on the next 'Undo' operation.",
+        "timings": "Timings:",
+        "profile_saved": "Profile saved to: {0}",
         "undo_failed_title": "Undo Not Possible",
-        "undo_failed_msg": "The last rename cannot be undone because the files in the target folder, or their names, have been modified. This is a Mass Renamer safeguard to prevent accidental data overwriting."
+        "undo_failed_msg": "The last rename cannot be undone because {0} of the renamed files were moved, replaced or modified since then. They are listed in the log. This is a Mass Renamer safeguard to prevent accidental data overwriting.",
+        "undo_running": "The last rename is still running in another Mass Renamer window or on the command line. Undo it once it has finished.",
+        "drift_missing": "no longer exists",
+        "drift_replaced": "is now a different file",
+        "drift_modified": "was modified",
+        "resume_title": "Interrupted Renaming",
+        "resume_msg": "A renaming in {0} ({1}) was interrupted before it finished.\n\nFinish it now? Otherwise it can still be undone.",
+        "resuming": "Resuming the renaming in {0}: {1} of {2} steps done, {3} pending, {4} inconsistent.",
+        "resume_missing": "neither the original nor the new name exists",
+        "resume_exists": "both the original and the new name exist",
+        "names_loaded": "{0} names loaded",
+        "recursive": "Include subfolders",
+        "table_view": "Table view",
+        "live_illegal": "{0} invalid names",
+        "live_conflicts": "{0} already exist or are duplicated",
+        "live_count": "{0} original vs {1} new names",
+        "col_original": "Original name", "col_new": "New name", "col_status": "Status",
+        "map_dir_error": "Line {0}: the new name must stay in the same folder as the original.",
+        "rules": "Rules...", "rules_title": "Rename Rules",
+        "rules_help": (
+            "One rule per line, applied in order to each original name (without its extension, unless after \"scope name\"):\n"
+            "replace FIND NEW [i]  ·  regex PATTERN NEW [i]  ·  insert POSITION TEXT  ·  remove POSITION COUNT\n"
+            "counter [START [STEP [DIGITS [POSITION]]]]  ·  case lower|upper|title|capitalize|swap  ·  transliterate\n"
+            "format TEMPLATE, with the tokens {name} {date} {camera} {title} {artist} {album} {track} {year} {mtime} {size} {hash}"
+            " (e.g. \"{date:%Y-%m-%d} {name}\", \"{track:02} - {title}\", \"{hash:.16}\"; {hash} is computed when the rules are applied)\n"
+            "POSITION counts from 0, from the end if negative, or is \"end\". Quote texts with spaces; \"i\" ignores case."
+        ),
+        "rule_syntax": "Rule line {0}: invalid or missing arguments.",
+        "rule_unknown": "Rule line {0}: unknown rule \"{1}\".",
+        "rule_regex": "Rule line {0}: invalid regular expression ({1}).",
+        "rule_field": "Rule line {0}: unknown token \"{{{1}}}\".",
+        "empty_name": "Line {0}: the rules leave \"{1}\" without a name.",
+        "order_name": "Name", "order_natural": "Natural", "order_locale": "Alphabetical",
+        "order_mtime": "Date modified", "order_size": "Size",
+        "order_tooltip": "Order of the loaded names.\nName: by character code. Natural: img2 before img10.\nAlphabetical: by the rules of your language."
     },
     "pt": {
         "title": "Mass Renamer 2.3", "settings": "Ajustes", "help": "Ajuda", "dark": "Escuro", "light": "Claro",
@@ -929,8 +983,13 @@ LANG_TEXTS = {
         "log": "Log", "rename": "Renomear", "undo": "Desfazer", "error": "Erro", "yes": "Sim", "no": "Não",
         "map_error": "Erro de Mapeamento", "invalid_chars": "Caracteres Inválidos",
         "invalid_chars_msg": "Os seguintes caracteres não são permitidos: {0}\nDeseja removê-los?",
+        "invalid_names_chars": "Os seguintes caracteres não são permitidos: {0}",
+        "invalid_names_too_long": "{0} nomes têm mais de 255 bytes",
+        "invalid_names_reserved": "{0} nomes são reservados pelo Windows (CON, NUL, COM1...)",
+        "invalid_names_trailing": "{0} nomes terminam com um ponto ou um espaço",
+        "invalid_names_question": "Deseja corrigi-los (remover os caracteres, encurtar os nomes longos e adicionar \"_\" aos reservados)?",
         "not_found": "Não encontrado ou não é um arquivo:", "error_renaming": "Erro renomeando", "done": "🏁 Concluído.",
-        "undo_confirm": "Tem certeza de que deseja desfazer a última operação de renomeação?",
+        "undo_confirm": "Tem certeza de que deseja desfazer a última operação de renomeação?\n\n{0} renomeações em {1} ({2}).\nOperações anteriores que poderão ser desfeitas depois desta: {3}.",
         "undo_done": "🏁 Desfazer concluído.",
         "undoing": "⏮︎ Desfazendo...", "error_undoing": "Erro desfazendo",
         "cannot_list": "Não foi possível listar arquivos:", "select_valid_folder": "Selecione uma pasta válida.",
@@ -941,9 +1000,14 @@ LANG_TEXTS = {
         "conflict_info": (
             "• Clique em <b>\"Renomear\"</b> para adicionar um sufixo numérico (ex: nome_(1).txt) a todos os nomes conflitantes e continuar.<br><br>"
             "• Clique em <b>\"Listar Erros\"</b> para cancelar a operação e ver as linhas com problemas na área de Log para correção manual.<br><br>"
+            "• Clique em <b>\"Duplicados\"</b> para fazer o mesmo e também listar os arquivos com conteúdo idêntico.<br><br>"
             "• Clique em <b>\"Cancelar\"</b> para fechar esta janela sem fazer nada."
         ),
         "conflict_btn_rename": "Renomear", "conflict_btn_list": "Listar Erros", "conflict_btn_cancel": "Cancelar",
+        "conflict_btn_duplicates": "Duplicados",
+        "duplicates_none": "Nenhum arquivo original tem conteúdo idêntico.",
+        "duplicates_found": "Arquivos originais com conteúdo idêntico ({0} grupos):",
+        "duplicates_line": "Linhas {0}: {1}",
         "help_text": "<p>1. Selecione a pasta onde os arquivos estão.<br>2. Clique em \"Carregar nomes\" ou insira os nomes originais manualmente.<br>3. Indique os novos nomes.<br>4. Clique em \"Renomear\".</p><p><b>OBS.:</b> O arquivo na linha \"1\" dos nomes originais será renomeado para o nome na linha \"1\" dos novos nomes, e assim sucessivamente.</p><hr><p>Versão: 2.3.1<br>Licença: <a href=\"https://www.apache.org/licenses/LICENSE-2.0.html\">Apache 2.0</a><br>Autor: <a href=\"https://www.instagram.com/jedifonseca/\">Jedielson da Fonseca</a><br><a href=\"https://github.com/JediFonseca/mass_renamer\">Github</a></p>",
         "apply": "Aplicar", "cancel": "Cancelar", "invalid_chars_os": "Não permitir caracteres inválidos para:",
         "invalid_chars_windows": "Windows", "invalid_chars_macos": "macOS",
@@ -956,8 +1020,44 @@ LANG_TEXTS = {
         "forbidden_dir_msg": "Este é o diretório de configuração do aplicativo. Não é permitido renomear arquivos aqui.",
         "log_saved_rename": "Este log foi salvo em: {0}\nEle será sobrescrito na próxima operação de 'Renomear'.",
         "log_saved_undo": "Este log foi salvo em: {0}\nEle será sobrescrito na próxima operação de 'Desfazer'.",
+        "timings": "Tempos:",
+        "profile_saved": "Perfil salvo em: {0}",
         "undo_failed_title": "Não é Possível Desfazer",
-        "undo_failed_msg": "A última renomeação não pode ser desfeita porque os arquivos na pasta de destino, ou seus nomes, foram modificados. Esta é uma proteção do Mass Renamer para evitar a sobrescrita acidental de seus dados."
+        "undo_failed_msg": "A última renomeação não pode ser desfeita porque {0} dos arquivos renomeados foram movidos, substituídos ou modificados desde então. Eles estão listados no log. Esta é uma proteção do Mass Renamer para evitar a sobrescrita acidental de seus dados.",
+        "undo_running": "A última renomeação ainda está em andamento em outra janela do Mass Renamer ou na linha de comando. Desfaça-a quando ela terminar.",
+        "drift_missing": "não existe mais",
+        "drift_replaced": "agora é outro arquivo",
+        "drift_modified": "foi modificado",
+        "resume_title": "Renomeação Interrompida",
+        "resume_msg": "Uma renomeação em {0} ({1}) foi interrompida antes de terminar.\n\nConcluí-la agora? Caso contrário, ela ainda pode ser desfeita.",
+        "resuming": "Retomando a renomeação em {0}: {1} de {2} etapas feitas, {3} pendentes, {4} inconsistentes.",
+        "resume_missing": "nem o nome original nem o novo existem",
+        "resume_exists": "tanto o nome original quanto o novo existem",
+        "names_loaded": "{0} nomes carregados",
+        "recursive": "Incluir subpastas",
+        "table_view": "Ver em tabela",
+        "live_illegal": "{0} nomes inválidos",
+        "live_conflicts": "{0} já existem ou estão duplicados",
+        "live_count": "{0} nomes originais vs {1} novos",
+        "col_original": "Nome original", "col_new": "Novo nome", "col_status": "Status",
+        "map_dir_error": "Linha {0}: o novo nome deve ficar na mesma pasta que o original.",
+        "rules": "Regras...", "rules_title": "Regras de Renomeação",
+        "rules_help": (
+            "Uma regra por linha, aplicadas em ordem a cada nome original (sem a extensão, a não ser após \"scope name\"):\n"
+            "replace BUSCAR NOVO [i]  ·  regex PADRÃO NOVO [i]  ·  insert POSIÇÃO TEXTO  ·  remove POSIÇÃO QUANTIDADE\n"
+            "counter [INÍCIO [PASSO [DÍGITOS [POSIÇÃO]]]]  ·  case lower|upper|title|capitalize|swap  ·  transliterate\n"
+            "format MODELO, com os tokens {name} {date} {camera} {title} {artist} {album} {track} {year} {mtime} {size} {hash}"
+            " (ex.: \"{date:%Y-%m-%d} {name}\", \"{track:02} - {title}\", \"{hash:.16}\"; {hash} é calculado ao aplicar as regras)\n"
+            "POSIÇÃO conta a partir de 0, do fim se negativa, ou é \"end\". Use aspas em textos com espaços; \"i\" ignora maiúsculas."
+        ),
+        "rule_syntax": "Regra da linha {0}: argumentos inválidos ou ausentes.",
+        "rule_unknown": "Regra da linha {0}: regra \"{1}\" desconhecida.",
+        "rule_regex": "Regra da linha {0}: expressão regular inválida ({1}).",
+        "rule_field": "Regra da linha {0}: token \"{{{1}}}\" desconhecido.",
+        "empty_name": "Linha {0}: as regras deixam \"{1}\" sem nome.",
+        "order_name": "Nome", "order_natural": "Natural", "order_locale": "Alfabética",
+        "order_mtime": "Data de modificação", "order_size": "Tamanho",
+        "order_tooltip": "Ordem dos nomes carregados.\nNome: pelo código dos caracteres. Natural: img2 antes de img10.\nAlfabética: pelas regras do seu idioma."
     }
 }
 
@@ -973,7 +1073,202 @@ def resource_path(relative_path):
             base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+# --- Startup Timing ---
+# Opt-in startup milestones: any value prints them, "exit" also quits once ready.
+STARTUP_ENV = "MASSRENAMER_STARTUP"
+
+class StartupTimer:
+    """Startup milestones for $MASSRENAMER_STARTUP, in seconds since the process started.
+
+    In the AppImage the process starts as the AppRun script, which execs the
+    app, so its time counts too. imports: this module loaded; window: the main
+    window built; first_paint: its first paint; ready: the work left for after
+    the first paint done and the event loop idle, i.e. ready for input.
+    """
+    def __init__(self, mode):
+        self.mode = mode
+        uptime = _process_uptime()
+        # perf_counter() at the process start (at this module's, where /proc is missing)
+        self._origin = time.perf_counter() - uptime if uptime is not None else _MODULE_STARTED
+        self.marks = {"imports": _IMPORTS_DONE - self._origin}
+
+    def mark(self, name):
+        self.marks[name] = time.perf_counter() - self._origin
+        if name == "ready":
+            print("startup: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in self.marks.items()), file=sys.stderr)
+            if self.mode == "exit":
+                QApplication.instance().quit()
+
+def _process_uptime():
+    """Seconds since this process started, or None."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            # Field 22, counted after the command name, which may hold spaces
+            ticks = int(f.read().rsplit(b")", 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+# --- Background Worker ---
+# Minimum time between two progress/log updates sent from the worker to the window.
+UI_UPDATE_INTERVAL = 0.1
+# The log panel only keeps the most recent lines (QSettings key "log_max_lines");
+# the complete log is always written to rename.log / undo.log.
+LOG_MAX_LINES = 5000
+LOG_FLUSH_INTERVAL_MS = 100
+# Quiet time after an edit before the problem count and highlights are repainted
+LIVE_VALIDATION_DELAY_MS = 150
+# Quiet time after a rule is edited before it is compiled and the preview repainted
+RULES_PREVIEW_DELAY_MS = 250
+# Changes of the selected folder are gathered this long and then applied together
+WATCH_COALESCE_MS = 300
+
+class BatchWorker(QObject):
+    """Runs a rename/undo job off the GUI thread.
+
+    The job is an iterable yielding one (log_line, result) pair per processed file.
+    Log lines and progress are sent to the window in throttled batches, and the
+    collected results (non-None) are delivered by the finished signal. A job
+    that only learns its size as it runs may set total itself. cancel() stops
+    the job at its next item.
+    """
+    progress = pyqtSignal(int)
+    log_lines = pyqtSignal(list)
+    finished = pyqtSignal(list)
+
+    def __init__(self, job, total, profiler=None):
+        super().__init__()
+        self.job = job
+        self.total = max(1, total)
+        self.profiler = profiler
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        with self.profiler.thread() if self.profiler else contextlib.nullcontext():
+            self._run()
+
+    def _run(self):
+        results, pending = [], []
+        last_emit = time.monotonic()
+        last_percentage = 0
+        processed = 0
+        try:
+            for line, result in self.job:
+                if self._cancelled:
+                    break
+                processed += 1
+                if line is not None:
+                    pending.append(line)
+                if result is not None:
+                    results.append(result)
+                now = time.monotonic()
+                if now - last_emit >= UI_UPDATE_INTERVAL:
+                    last_emit = now
+                    if pending:
+                        self.log_lines.emit(pending)
+                        pending = []
+                    percentage = int(processed / self.total * 100)
+                    if percentage != last_percentage:
+                        last_percentage = percentage
+                        self.progress.emit(percentage)
+        except Exception as e:
+            # Never leave the window locked: report the error and deliver what was done
+            pending.append(f"⚠️ {e}")
+        if self._cancelled and hasattr(self.job, "close"):
+            self.job.close()
+        if pending:
+            self.log_lines.emit(pending)
+        self.progress.emit(100)
+        self.finished.emit(results)
+
+# Names sent to the "Original names" editor per chunk while loading a folder.
+LOAD_CHUNK_LINES = 20000
+
+class FolderLoader(QObject):
+    """Lists the files of a folder (or its whole tree) off the GUI thread, streaming names in chunks.
+
+    finished carries the engine.FolderListing, sorted in order (None if
+    cancelled), and whether that order differs from the one already streamed.
+    """
+    chunk = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal(object, bool)
+
+    def __init__(self, folder, recursive=False, order="name"):
+        super().__init__()
+        self.folder = folder
+        self.recursive = recursive
+        self.order = order
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        names, pending = [], []
+        # Times and sizes come with the listing when the order needs them
+        stats = {} if self.order in ("mtime", "size") else None
+        last_emit = time.monotonic()
+        try:
+            names_iter = (engine.iter_tree if self.recursive else engine.iter_files)(self.folder, stats)
+            for name in names_iter:
+                if self._cancelled:
+                    break
+                pending.append(name)
+                now = time.monotonic()
+                if len(pending) >= LOAD_CHUNK_LINES or now - last_emit >= UI_UPDATE_INTERVAL:
+                    last_emit = now
+                    self.chunk.emit(pending)
+                    names.extend(pending)
+                    pending = []
+        except OSError as e:
+            self.failed.emit(str(e))
+        if pending:
+            self.chunk.emit(pending)
+            names.extend(pending)
+        if self._cancelled:
+            self.finished.emit(None, False)
+            return
+        listing = engine.FolderListing(self.folder, names, stats)
+        self.finished.emit(listing, listing.sorted(self.order) != names)
+
+class FolderIndexer(QObject):
+    """Lists a folder into an engine.FolderIndex off the GUI thread.
+
+    finished carries the index, or None if the folder could not be listed.
+    generation tells the window which watch of the folder it was started for.
+    """
+    finished = pyqtSignal(object)
+
+    def __init__(self, folder, generation=0):
+        super().__init__()
+        self.folder = folder
+        self.generation = generation
+
+    def run(self):
+        try:
+            index = engine.FolderIndex(self.folder)
+        except OSError:
+            index = None
+        self.finished.emit(index)
+
+def _runs(rows):
+    """(first, last) of each run of consecutive numbers in ascending rows."""
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
+
 # --- Custom Widgets ---
+# Background of the rows (gutter and table cells) that live validation flags
+PROBLEM_COLOR = QColor(220, 50, 47, 90)
+
 class LineNumberArea(QWidget):
     def __init__(self, editor):
         super().__init__(editor)
@@ -986,35 +1281,107 @@ class LineNumberArea(QWidget):
         self.editor.lineNumberAreaPaintEvent(event)
 
 class CodeEditor(QPlainTextEdit):
+    """Plain text editor with a line number gutter.
+
+    Font measures, the gutter width and one laid-out glyph per digit are
+    cached, so painting the gutter while scrolling never lays out text, and
+    the width is only recomputed when the number of digits changes. A theme
+    change lays the document out at most once (see restyling).
+    """
     def __init__(self, parent=None):
         super().__init__(parent)
         self.lineNumberArea = LineNumberArea(self)
+        self._digits = 0
+        self._gutter_width = 0
+        self._bulk = False
+        self._restyling = False
+        # Callable(line number) -> bool; flagged lines get a highlighted gutter
+        self.lineProblem = None
+        self._updateMetrics()
         self.blockCountChanged.connect(self.updateLineNumberAreaWidth)
         self.updateRequest.connect(self.updateLineNumberArea)
         self.updateLineNumberAreaWidth(0)
 
+    def _updateMetrics(self):
+        metrics = self.fontMetrics()
+        self._digit_width = metrics.horizontalAdvance('9')
+        self._line_height = metrics.height()
+        self._digit_glyphs = []
+        for digit in "0123456789":
+            glyph = QStaticText(digit)
+            glyph.prepare(font=self.font())
+            self._digit_glyphs.append(glyph)
+        self._digits = 0
+
+    def changeEvent(self, event):
+        if self._restyling and event.type() == QEvent.Type.FontChange:
+            return
+        super().changeEvent(event)
+        # A new theme may change the font
+        if event.type() in (QEvent.Type.FontChange, QEvent.Type.StyleChange) and not self._restyling:
+            self._updateMetrics()
+            self.updateLineNumberAreaWidth(0)
+
     def lineNumberAreaWidth(self):
-        digits = 1
-        count = max(1, self.blockCount())
-        while count >= 10:
-            count //= 10
-            digits += 1
-        space = 15 + self.fontMetrics().horizontalAdvance('9') * digits
-        return space
+        return self._gutter_width
 
     def updateLineNumberAreaWidth(self, _):
-        self.setViewportMargins(self.lineNumberAreaWidth(), 0, 0, 0)
+        if self._bulk:
+            return
+        digits = len(str(max(1, self.blockCount())))
+        if digits == self._digits:
+            return
+        self._digits = digits
+        self._gutter_width = 15 + self._digit_width * digits
+        self.setViewportMargins(self._gutter_width, 0, 0, 0)
+        cr = self.contentsRect()
+        self.lineNumberArea.setGeometry(QRect(cr.left(), cr.top(), self._gutter_width, cr.height()))
+
+    @contextlib.contextmanager
+    def bulkInsert(self):
+        """Sizes the gutter once after a large insertion instead of on each block count change."""
+        self._bulk = True
+        try:
+            yield
+        finally:
+            self._bulk = False
+            self.updateLineNumberAreaWidth(0)
+
+    @contextlib.contextmanager
+    def restyling(self):
+        """Lays the document out once after a new stylesheet, if the font or the viewport size changed.
+
+        Restyling unpolishes and polishes each widget several times, and every
+        font and padding change on the way relays out the whole document.
+        """
+        size = self.viewport().size()
+        self._restyling = True
+        try:
+            yield
+        finally:
+            self._restyling = False
+            if self.document().defaultFont() != self.font():
+                self.changeEvent(QEvent(QEvent.Type.FontChange))
+            if self.viewport().size() != size:
+                self.resizeEvent(QResizeEvent(self.viewport().size(), size))
+
+    def insertFromMimeData(self, source):
+        with self.bulkInsert():
+            super().insertFromMimeData(source)
+
+    def setPlainText(self, text):
+        with self.bulkInsert():
+            super().setPlainText(text)
 
     def updateLineNumberArea(self, rect, dy):
         if dy:
             self.lineNumberArea.scroll(0, dy)
         else:
             self.lineNumberArea.update(0, rect.y(), self.lineNumberArea.width(), rect.height())
-        if rect.contains(self.viewport().rect()):
-            self.updateLineNumberAreaWidth(0)
 
     def resizeEvent(self, event):
-        super().resizeEvent(event)
+        if not self._restyling:
+            super().resizeEvent(event)
         cr = self.contentsRect()
         self.lineNumberArea.setGeometry(QRect(cr.left(), cr.top(), self.lineNumberAreaWidth(), cr.height()))
 
@@ -1023,21 +1390,220 @@ class CodeEditor(QPlainTextEdit):
         bg_color = self.lineNumberArea.palette().window().color()
         num_color = self.lineNumberArea.palette().windowText().color()
         painter.fillRect(event.rect(), bg_color)
+        painter.setPen(num_color)
+        painter.setFont(self.font())
+        glyphs, digit_width = self._digit_glyphs, self._digit_width
+        problem = self.lineProblem
+        width = self.lineNumberArea.width()
+        right = width - 5
+        paint_top, paint_bottom = event.rect().top(), event.rect().bottom()
         block = self.firstVisibleBlock()
         blockNumber = block.blockNumber()
         top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
         bottom = top + self.blockBoundingRect(block).height()
-        while block.isValid() and top <= event.rect().bottom():
-            if block.isVisible() and bottom >= event.rect().top():
-                number = str(blockNumber + 1)
-                painter.setPen(num_color)
-                painter.drawText(0, int(top), self.lineNumberArea.width() - 5, self.fontMetrics().height(),
-                                 Qt.AlignmentFlag.AlignRight, number)
+        while block.isValid() and top <= paint_bottom:
+            if block.isVisible() and bottom >= paint_top:
+                if problem is not None and problem(blockNumber):
+                    painter.fillRect(QRectF(0, top, width, bottom - top), PROBLEM_COLOR)
+                # Right-aligned, one cached glyph per digit from the last one
+                number, x = blockNumber + 1, right
+                while number:
+                    number, digit = divmod(number, 10)
+                    x -= digit_width
+                    painter.drawStaticText(QPointF(x, top), glyphs[digit])
             block = block.next()
             top = bottom
             bottom = top + self.blockBoundingRect(block).height()
             blockNumber += 1
 
+class MappingModel(QAbstractTableModel):
+    """Original names, new names and the status of each row, for the table view.
+
+    The names are kept as two plain lists and statuses in a dict of the rows
+    that have one, so a million rows cost little more than the strings; the
+    view only asks for the rows on screen.
+    """
+    ORIGINAL, NEW, STATUS = range(3)
+    # (column, first row, rows removed, new rows) after each edit, like a document's contentsChange
+    linesChanged = pyqtSignal(int, int, int, list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = ([], [])
+        self.status = {}
+        self.headers = ["", "", ""]
+        # Callable(row) -> bool; flagged new names get a highlighted cell
+        self.problem = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else max(len(self.columns[0]), len(self.columns[1]))
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 3
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.BackgroundRole:
+            if index.column() == self.NEW and self.problem is not None and self.problem(index.row()):
+                return PROBLEM_COLOR
+            return None
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return None
+        row, col = index.row(), index.column()
+        if col == self.STATUS:
+            return self.status.get(row, "")
+        names = self.columns[col]
+        return names[row] if row < len(names) else ""
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole or index.column() == self.STATUS:
+            return False
+        col, row = index.column(), index.row()
+        names = self.columns[col]
+        value = value.replace("\n", " ")
+        if row < len(names):
+            names[row] = value
+            self.linesChanged.emit(col, row, 1, [value])
+        else:
+            added = [""] * (row - len(names)) + [value]
+            first = len(names)
+            names.extend(added)
+            self.linesChanged.emit(col, first, 0, added)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def flags(self, index):
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() != self.STATUS:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return section + 1
+
+    def set_headers(self, headers):
+        self.headers = list(headers)
+        self.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, 2)
+
+    def set_column(self, col, names):
+        self.beginResetModel()
+        removed = len(self.columns[col])
+        self.columns[col][:] = names
+        self.status.clear()
+        self.endResetModel()
+        self.linesChanged.emit(col, 0, removed, list(names))
+
+    def append(self, col, names):
+        """Adds names at the end of a column, inserting only the rows that are new."""
+        before = self.rowCount()
+        start = len(self.columns[col])
+        after = max(start + len(names), len(self.columns[1 - col]))
+        if after > before:
+            self.beginInsertRows(QModelIndex(), before, after - 1)
+        self.columns[col].extend(names)
+        if after > before:
+            self.endInsertRows()
+        if start < before:
+            self.dataChanged.emit(self.index(start, col), self.index(before - 1, col))
+        self.linesChanged.emit(col, start, 0, list(names))
+
+    def remove_rows(self, rows):
+        """Removes rows (by ascending row number) from both columns, a run of consecutive rows at a time."""
+        self.status.clear()
+        for first, last in reversed(_runs(rows)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for col, names in enumerate(self.columns):
+                if first < len(names):
+                    removed = len(names[first:last + 1])
+                    del names[first:last + 1]
+                    self.linesChanged.emit(col, first, removed, [])
+            self.endRemoveRows()
+
+    def set_statuses(self, updates):
+        """Sets (row, text) statuses with one repaint of the rows they span."""
+        if not updates:
+            return
+        rows = [row for row, _ in updates]
+        self.status.update(updates)
+        self.dataChanged.emit(self.index(min(rows), self.STATUS), self.index(max(rows), self.STATUS))
+
+    def clear_statuses(self):
+        if self.status:
+            self.status.clear()
+            self.dataChanged.emit(self.index(0, self.STATUS), self.index(self.rowCount() - 1, self.STATUS))
+
+class RulesPreviewModel(QAbstractTableModel):
+    """Original names and what the rules make of them, computed only for the rows the view asks for.
+
+    metadata(names, fields) returns the metadata of files (see engine.MetadataCache.lookup());
+    it is only called for the rows shown, and only for the tokens the rules use.
+    """
+
+    def __init__(self, names, metadata=None, parent=None):
+        super().__init__(parent)
+        self.names = names
+        self.metadata = metadata
+        self.pipeline = engine.RulePipeline()
+        self.headers = ["", ""]
+        # Wording of an EngineError raised by the rules for a name
+        self.error_text = str
+        self._cache = {}
+        self._metadata = {}
+        self._fields = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        row = index.row()
+        if index.column() == 0:
+            return self.names[row]
+        new = self._cache.get(row)
+        if new is None:
+            try:
+                new = self._new_name(row)
+            except engine.EngineError as e:
+                new = f"⚠️ {self.error_text(e)}"
+            except Exception as e:
+                # An exception escaping a Qt virtual method aborts the whole application
+                new = f"⚠️ {e}"
+            self._cache[row] = new
+        return new
+
+    def _new_name(self, row):
+        meta = None
+        if self._fields and self.metadata is not None:
+            meta = self._metadata.get(row)
+            if meta is None:
+                meta = self._metadata[row] = self.metadata([self.names[row]], self._fields)[0]
+        return self.pipeline(self.names[row], row, meta)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self.headers[section] if orientation == Qt.Orientation.Horizontal else section + 1
+
+    def set_pipeline(self, pipeline):
+        """Switches to new rules; the view recomputes the rows on screen only."""
+        self.pipeline = pipeline
+        self._cache.clear()
+        # Hashing whole files would stall typing: {hash} is only filled in when the rules are applied
+        fields = [field for field in engine.METADATA_FIELDS if field in pipeline.fields and field != "hash"]
+        if not set(fields) <= set(self._fields):
+            # The rows read so far lack a token the new rules use
+            self._metadata.clear()
+        self._fields = fields
+        if self.names:
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self.names) - 1, 1))
+
 # --- Settings Dialog ---
 class SettingsDialog(QDialog):
     def __init__(self, parent):
@@ -1202,6 +1768,7 @@ class SettingsDialog(QDialog):
         s.setValue("popular_exts", ",".join(new_exts))
         
         self.parent_window._save_settings()
+        self.parent_window._refresh_live_rules()
         self.accept()
 
     def custom_reject(self):
@@ -1268,11 +1835,122 @@ class SettingsDialog(QDialog):
         menu.exec(self.theme_btn.mapToGlobal(self.theme_btn.rect().bottomLeft()))
 
 
+# --- Rules Dialog ---
+class RulesDialog(QDialog):
+    """Edits the rename rules, with a preview of the new names.
+
+    The rules are compiled once typing pauses, and the preview only computes
+    the rows on screen; the whole list of new names is computed on Apply.
+    """
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.parent_window = parent
+        self.setModal(True)
+        self.setLayout(QVBoxLayout())
+        tr = parent.tr
+        self.setWindowTitle(tr("rules_title"))
+
+        self.help_label = QLabel(tr("rules_help"))
+        self.help_label.setWordWrap(True)
+        self.layout().addWidget(self.help_label)
+
+        self.rules_edit = CodeEditor(self)
+        self.rules_edit.setPlainText(parent.settings.value("rename_rules", ""))
+        self.layout().addWidget(self.rules_edit, 1)
+
+        self.error_label = QLabel()
+        self.layout().addWidget(self.error_label)
+
+        self.preview_model = RulesPreviewModel(parent._names(parent.text_orig), parent._lookup_metadata, self)
+        self.preview_model.headers = [tr("col_original"), tr("col_new")]
+        self.preview_model.error_text = parent._engine_error_text
+        self.preview = QTableView()
+        self.preview.setModel(self.preview_model)
+        self.preview.setWordWrap(False)
+        rows = self.preview.verticalHeader()
+        rows.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        rows.setDefaultSectionSize(self.preview.fontMetrics().height() + 6)
+        self.preview.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.layout().addWidget(self.preview, 2)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Apply | QDialogButtonBox.StandardButton.Cancel)
+        self.apply_button = self.button_box.button(QDialogButtonBox.StandardButton.Apply)
+        self.apply_button.clicked.connect(self.apply_changes)
+        self.button_box.button(QDialogButtonBox.StandardButton.Cancel).clicked.connect(self.reject)
+        self.apply_button.setText(tr("apply"))
+        self.button_box.button(QDialogButtonBox.StandardButton.Cancel).setText(tr("cancel"))
+        self.apply_button.setFixedWidth(150)
+        self.button_box.button(QDialogButtonBox.StandardButton.Cancel).setFixedWidth(150)
+        self.layout().addWidget(self.button_box)
+
+        self._compile_timer = QTimer(self)
+        self._compile_timer.setSingleShot(True)
+        self._compile_timer.setInterval(RULES_PREVIEW_DELAY_MS)
+        self._compile_timer.timeout.connect(self._compile)
+        self.rules_edit.textChanged.connect(self._compile_timer.start)
+
+        self.resize(800, 600)
+        self.setMinimumSize(700, 500)
+        self._compile()
+
+    def _compile(self):
+        try:
+            pipeline = engine.RulePipeline(self.rules_edit.toPlainText())
+        except engine.EngineError as e:
+            # The preview keeps the last rules that compiled
+            self.error_label.setText(self.parent_window._engine_error_text(e))
+            self.apply_button.setEnabled(False)
+            return
+        self.error_label.clear()
+        self.apply_button.setEnabled(True)
+        self.preview_model.set_pipeline(pipeline)
+
+    def apply_changes(self):
+        if self._compile_timer.isActive():
+            self._compile_timer.stop()
+            self._compile()
+        if not self.apply_button.isEnabled():
+            return
+        self.parent_window.settings.setValue("rename_rules", self.rules_edit.toPlainText())
+        self.parent_window.apply_rules(self.preview_model.pipeline)
+        self.accept()
+
 # --- Main Application Window ---
 class MassRenamerApp(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.rename_history = []
+        self._worker_thread = self._worker = None
+        self._loader_thread = self._loader = None
+        self._loading = False
+        self._timer = engine.PhaseTimer()
+        self._profiler = None
+        self._batch = self._undo_batch = None
+        # The worker is hashing files for the duplicates report (see _report_duplicates)
+        self._hashing = False
+        # History entries of the running batch journaled before it started (a resumed batch)
+        self._batch_entries = 0
+        # (row, status) pairs of the table view, filled by the worker and applied with the log
+        self._status_updates = deque()
+        self._status_rows = {}
+        # Last folder listing, and the names of it shown as the original names;
+        # the shown names follow the folder until the original names are edited
+        self._listing = self._listing_mode = None
+        self._listing_shown = None
+        self._orig_edits = 0
+        self._listing_edits = None
+        # Names in the selected folder, kept current by an inotify watcher
+        # (see _watch_folder) and changes of it waiting to be applied
+        self._folder_index = self._watcher = self._watch_notifier = None
+        self._folder_changes = {}
+        # Listing of the folder into the index running off the GUI thread, and the
+        # folder wanted in the index; each watch of a folder is a new generation
+        self._indexer_thread = self._indexer = None
+        self._index_folder = None
+        self._index_generation = 0
+        self._closing = False
+        # Cache of the files' metadata and hashes, read on first use
+        self._metadata = None
+        self.live = engine.LiveValidator()
         self.settings = QSettings("MassRenamer", "MassRenamer")
 
         self.themes = {
@@ -1283,17 +1961,47 @@ class MassRenamerApp(QMainWindow):
             "Breeze": BREEZE_STYLESHEET, "Breeze Dark": BREEZE_DARK_STYLESHEET
         }
 
+        startup = os.environ.get(STARTUP_ENV)
+        self._startup = StartupTimer(startup) if startup else None
+
         self._load_settings()
-        
-        self.config_dir = os.path.expanduser("~/.config/MassRenamer")
+        # Before any widget exists, so each one is styled once, when it is first shown
+        QApplication.instance().setStyleSheet(self.themes.get(self.current_theme, DARK_STYLESHEET))
+
+        self.config_dir = engine.CONFIG_DIR
         os.makedirs(self.config_dir, exist_ok=True)
-        self.history_file_path = os.path.join(self.config_dir, "mass_renamer.history")
-        
+        # Opened after the first paint (see _finish_startup), or when first needed
+        self._history = None
+
         self._init_ui()
-        self._load_history_on_startup()
-        
+
         self.set_language(self.current_lang)
         self.change_theme(self.current_theme, startup=True)
+        # The first paint comes before the rest of the startup work
+        self.installEventFilter(self)
+        if self._startup:
+            self._startup.mark("window")
+
+    def eventFilter(self, obj, event):
+        if obj is self and event.type() == QEvent.Type.Paint:
+            self.removeEventFilter(self)
+            if self._startup:
+                self._startup.mark("first_paint")
+            QTimer.singleShot(0, self._finish_startup)
+        return super().eventFilter(obj, event)
+
+    def _finish_startup(self):
+        self._load_history_on_startup()
+        if self._startup:
+            QTimer.singleShot(0, lambda: self._startup.mark("ready"))
+
+    @property
+    def history(self):
+        if self._history is None:
+            # Only the index of the history is read here; a batch's journal is read when it is undone
+            self._history = engine.HistoryStore.open(self.config_dir, max_bytes=self.history_max_mb * 1024 * 1024,
+                                                     max_age_days=self.history_max_days)
+        return self._history
 
     def _load_settings(self):
         self.current_lang = self.settings.value("language", "pt")
@@ -1301,6 +2009,14 @@ class MassRenamerApp(QMainWindow):
         default_exts = ".jpg, .png, .webp, .txt, .pdf, .docx, .xlsx, .pptx, .ods, .ots, .odt, .ott, .odp, .otp, .mp3, .ogg, .flac, .wav, .mp4, .avi, .mkv, .webm, .zip, .rar, .7z"
         ext_string = self.settings.value("popular_exts", default_exts)
         self.popular_exts = [ext.strip() for ext in ext_string.split(',') if ext.strip()]
+        self.history_commit_interval = self.settings.value("history_commit_interval", engine.HISTORY_COMMIT_INTERVAL, type=int)
+        self.log_max_lines = max(1, self.settings.value("log_max_lines", LOG_MAX_LINES, type=int))
+        self.history_max_mb = self.settings.value("history_max_mb", engine.HISTORY_MAX_BYTES // (1024 * 1024), type=int)
+        self.history_max_days = self.settings.value("history_max_days", engine.HISTORY_MAX_AGE_DAYS, type=int)
+        self.table_mode = self.settings.value("table_view", False, type=bool)
+        self.sort_order = self.settings.value("sort_order", "name")
+        if self.sort_order not in engine.SORT_ORDERS:
+            self.sort_order = "name"
 
     def _save_settings(self):
         self.settings.setValue("language", self.current_lang)
@@ -1331,6 +2047,8 @@ class MassRenamerApp(QMainWindow):
         self.main_layout.setRowStretch(3, 1)
         self.main_layout.setRowStretch(6, 1)
         self.main_layout.setRowStretch(9, 1)
+        self._show_table(self.table_mode)
+        self._init_live_validation()
         
     def _create_top_bar(self):
         self.label_location = QLabel()
@@ -1346,10 +2064,34 @@ class MassRenamerApp(QMainWindow):
 
     def _create_original_names_panel(self):
         self.label_orig = QLabel()
-        self.main_layout.addWidget(self.label_orig, 2, 0, 1, 4)
+        self.main_layout.addWidget(self.label_orig, 2, 0, 1, 3)
+
+        # Order of the names "Load names" brings in
+        self.order_combo = QComboBox()
+        for order in engine.SORT_ORDERS:
+            self.order_combo.addItem("", order)
+        self.order_combo.setCurrentIndex(engine.SORT_ORDERS.index(self.sort_order))
+        self.order_combo.currentIndexChanged.connect(lambda i: self.set_sort_order(engine.SORT_ORDERS[i]))
+        self.order_combo.setFixedWidth(150)
+        self.main_layout.addWidget(self.order_combo, 2, 3)
         
         self.text_orig = CodeEditor(self)
         self.main_layout.addWidget(self.text_orig, 3, 0, 1, 4)
+
+        # Optional table of both lists; it shares the cell of the "Original names" editor
+        self.mapping_model = MappingModel(self)
+        self.mapping_table = QTableView()
+        self.mapping_table.setModel(self.mapping_model)
+        self.mapping_table.setWordWrap(False)
+        # Fixed row heights and column widths: nothing is measured per row, whatever the row count
+        rows = self.mapping_table.verticalHeader()
+        rows.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        rows.setDefaultSectionSize(self.mapping_table.fontMetrics().height() + 6)
+        columns = self.mapping_table.horizontalHeader()
+        columns.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        columns.setSectionResizeMode(MappingModel.STATUS, QHeaderView.ResizeMode.Interactive)
+        columns.resizeSection(MappingModel.STATUS, 200)
+        self.main_layout.addWidget(self.mapping_table, 3, 0, 1, 4)
         
         ext_frame_o = QWidget()
         ext_layout_o = QHBoxLayout(ext_frame_o)
@@ -1371,11 +2113,28 @@ class MassRenamerApp(QMainWindow):
         ext_layout_o.addStretch(1)
         self.main_layout.addWidget(ext_frame_o, 4, 0, 1, 2)
         
+        load_frame = QWidget()
+        load_layout = QHBoxLayout(load_frame)
+        load_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.recursive_check = QCheckBox()
+        self.recursive_check.setChecked(self.settings.value("recursive", False, type=bool))
+        self.recursive_check.toggled.connect(lambda checked: self.settings.setValue("recursive", checked))
+
         self.load_button = QPushButton()
         self.load_button.clicked.connect(self.load_original_names)
         self.load_button.setEnabled(False)
         self.load_button.setFixedWidth(150)
-        self.main_layout.addWidget(self.load_button, 4, 2, 1, 2, Qt.AlignmentFlag.AlignRight)
+
+        self.table_check = QCheckBox()
+        self.table_check.setChecked(self.table_mode)
+        self.table_check.toggled.connect(self.set_table_mode)
+
+        load_layout.addStretch(1)
+        load_layout.addWidget(self.table_check)
+        load_layout.addWidget(self.recursive_check)
+        load_layout.addWidget(self.load_button)
+        self.main_layout.addWidget(load_frame, 4, 2, 1, 2)
 
     def _create_new_names_panel(self):
         self.label_new = QLabel()
@@ -1404,6 +2163,11 @@ class MassRenamerApp(QMainWindow):
         ext_layout_n.addStretch(1)
         self.main_layout.addWidget(ext_frame_n, 7, 0, 1, 2)
 
+        # Running count of the problems found by live validation
+        self.problems_label = QLabel()
+        self.problems_label.setAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        self.main_layout.addWidget(self.problems_label, 7, 2, 1, 2)
+
     def _create_log_panel(self):
         self.label_log = QLabel()
         self.main_layout.addWidget(self.label_log, 8, 0, 1, 4)
@@ -1415,6 +2179,13 @@ class MassRenamerApp(QMainWindow):
 
         self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.setMaximumBlockCount(self.log_max_lines)
+        self._log_buffer = deque(maxlen=self.log_max_lines)
+        self._log_file = None
+        self._log_path = None
+        self._log_timer = QTimer(self)
+        self._log_timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self._log_timer.timeout.connect(self._flush_log)
         log_layout.addWidget(self.log_text, 0, 0)
 
         # Create the progress label and add it to the container's layout
@@ -1438,6 +2209,9 @@ class MassRenamerApp(QMainWindow):
         self.settings_label.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
         self.settings_label.mousePressEvent = self.open_settings_dialog
         
+        self.rules_button = QPushButton()
+        self.rules_button.clicked.connect(self.open_rules_dialog)
+
         self.rename_button = QPushButton()
         self.rename_button.clicked.connect(self.rename)
         
@@ -1445,109 +2219,174 @@ class MassRenamerApp(QMainWindow):
         self.undo_button.setEnabled(False)
         self.undo_button.clicked.connect(self.undo)
         
-        for btn in [self.rename_button, self.undo_button]:
+        for btn in [self.rules_button, self.rename_button, self.undo_button]:
             btn.setFixedWidth(150)
 
         buttons_layout.addWidget(self.settings_label, 0, Qt.AlignmentFlag.AlignLeft)
         buttons_layout.addStretch(1)
+        buttons_layout.addWidget(self.rules_button)
         buttons_layout.addWidget(self.rename_button)
         buttons_layout.addWidget(self.undo_button)
         self.main_layout.addWidget(buttons_frame, 10, 0, 1, 4)
 
     def _load_history_on_startup(self):
-        if os.path.exists(self.history_file_path):
+        if self.history.batches:
+            self.undo_button.setEnabled(True)
+        # A batch whose plan no process holds was cut short by a crash or a power loss
+        interrupted = self.history.interrupted()
+        if interrupted:
+            batch = interrupted[-1]
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(batch["time"]))
+            reply = QMessageBox.question(self, self.tr("resume_title"),
+                                         self.tr("resume_msg").format(batch["folder"], when),
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                         QMessageBox.StandardButton.Yes)
+            if reply == QMessageBox.StandardButton.Yes:
+                self._start_timing("rename")
+                if not self._resume(batch):
+                    self._profiler.stop()
+
+    def _resume(self, batch):
+        """Finishes an interrupted batch. Returns False when it stops before the worker starts."""
+        plan = self.history.claim(batch)
+        if plan is None:
+            return False
+        folder, journal_path = batch["folder"], self.history.journal_path(batch)
+        with self._timer.phase("verification"):
             try:
-                with open(self.history_file_path, "r", encoding="utf-8") as f:
-                    self.rename_history = json.load(f)
-                if self.rename_history:
-                    self.undo_button.setEnabled(True)
-            except (json.JSONDecodeError, IOError):
-                self.rename_history = []
-                try: os.remove(self.history_file_path)
-                except OSError: pass
+                check = engine.check_resume(folder, plan, journal_path, self.config_dir)
+            except engine.EngineError as e:
+                self._show_engine_error(e)
+                return False
+        self.log_text.clear()
+        self._begin_log("rename.log")
+        self._log(*(f"❌ {o} → {n}: {self.tr('resume_' + reason)}" for (_, _, o, n), reason in check.inconsistent),
+                  self.tr("resuming").format(folder, check.done, len(plan["steps"]), len(check.steps),
+                                             len(check.inconsistent)))
+        self.progress_label.setText("0%")
+        self.progress_label.show()
+        self._batch, self._batch_entries = batch, check.journaled
+        self._status_updates.clear()
+        self._status_rows = {}
+        workers = engine.RENAME_WORKERS if plan["recursive"] else 1
+        job = self._rename_job(folder, check.steps, check.snapshot, workers, journal_path, check)
+        self._start_worker(job, len(check.recovered) + len(check.steps), self._on_rename_finished)
+        return True
 
     def rename(self):
-        self.rename_history.clear()
+        # While the duplicates report hashes files, the same button cancels it
+        if self._hashing:
+            self._worker.cancel()
+            return
+        if self._worker_thread is not None or self._loading:
+            return
+        self._start_timing("rename")
+        if not self._run_rename():
+            self._profiler.stop()
+
+    def _run_rename(self):
+        """Validates and starts the batch. Returns False when it stops before the worker starts."""
         self.progress_label.hide()
         QApplication.processEvents()
         
-        validated_data = self._get_and_validate_inputs()
-        if not validated_data: return
+        with self._timer.phase("validation"):
+            validated_data = self._get_and_validate_inputs()
+        if not validated_data: return False
         
         folder, origs, news = validated_data
-        news = self._handle_name_conflicts(news, folder)
-        if news is None: return
+        with self._timer.phase("conflicts"):
+            try:
+                snapshot = self._take_snapshot(folder, origs, self.recursive_check.isChecked())
+            except engine.EngineError as e:
+                self._show_engine_error(e)
+                return False
+            news = self._handle_name_conflicts(origs, news, snapshot)
+        if news is None: return False
         
-        self._execute_rename(folder, origs, news)
+        return self._execute_rename(folder, origs, news, snapshot)
+
+    def _take_snapshot(self, folder, origs, recursive):
+        """The folder contents for a batch: from the watched folder's index when it is current, else listed."""
+        index = self._folder_index
+        if not recursive and self._watcher is not None and index is not None and index.folder == folder:
+            self._read_folder_changes()
+            if not self._watcher.lost:
+                self._apply_folder_changes()
+                return self._folder_index.snapshot()
+        return engine.take_snapshot(folder, origs, recursive)
+
+    def _show_engine_error(self, error):
+        title = {"forbidden_dir_msg": "forbidden_dir_title", "map_error_msg": "map_error",
+                 "map_dir_error": "map_error"}.get(error.key, "error")
+        QMessageBox.critical(self, self.tr(title), self._engine_error_text(error))
+
+    def _engine_error_text(self, error):
+        text = self.tr(error.key)
+        if "{" in text:
+            return text.format(*error.params)
+        return "\n".join([text, *map(str, error.params)])
+
+    def _sanitizer(self):
+        # Cached by the engine: the same settings always give the same Sanitizer
+        return engine.sanitizer_for(
+            windows=self.settings.value("disallow_windows_chars", True, type=bool),
+            macos=self.settings.value("disallow_macos_chars", True, type=bool),
+            ios=self.settings.value("disallow_ios_chars", True, type=bool),
+            android=self.settings.value("disallow_android_chars", True, type=bool))
 
     def _get_and_validate_inputs(self):
         folder = self.entry_local.text().strip()
-        if not folder or not os.path.isdir(folder):
-            QMessageBox.critical(self, self.tr("error"), self.tr("select_valid_folder"))
-            return None
-        
-        # Check if the selected folder is the configuration directory
-        config_path = os.path.normpath(self.config_dir)
-        selected_path = os.path.normpath(folder)
-        if config_path == selected_path:
-            QMessageBox.critical(self, self.tr("forbidden_dir_title"), self.tr("forbidden_dir_msg"))
-            return None
-            
-        origs = [l.strip() for l in self.text_orig.toPlainText().splitlines() if l.strip()]
-        news = [l.strip() for l in self.text_new.toPlainText().splitlines() if l.strip()]
-        if len(origs) != len(news):
-            QMessageBox.critical(self, self.tr("map_error"), self.tr("map_error_msg").format(len(origs), len(news)))
+        origs = self._names(self.text_orig)
+        news = self._names(self.text_new)
+        recursive = self.recursive_check.isChecked()
+        try:
+            engine.check_folder(folder, self.config_dir)
+            engine.check_mapping(origs, news)
+            if recursive:
+                origs, news = engine.normalize_tree_mapping(folder, origs, news, self.config_dir)
+        except engine.EngineError as e:
+            self._show_engine_error(e)
             return None
 
-        # --- Character Validation based on settings ---
-        illegal_chars = ILLEGAL_CHARS_LINUX.copy() # Base for all
-        if self.settings.value("disallow_windows_chars", True, type=bool):
-            illegal_chars.update(ILLEGAL_CHARS_WINDOWS)
-        if self.settings.value("disallow_macos_chars", True, type=bool):
-            illegal_chars.update(ILLEGAL_CHARS_MACOS)
-        if self.settings.value("disallow_ios_chars", True, type=bool):
-            illegal_chars.update(ILLEGAL_CHARS_IOS)
-        if self.settings.value("disallow_android_chars", True, type=bool):
-            illegal_chars.update(ILLEGAL_CHARS_ANDROID)
-
-        found_illegal = {ch for name in news for ch in name if ch in illegal_chars}
+        # --- Name Validation based on settings ---
+        sanitizer = self._sanitizer()
+        # Live validation already checked every new name against the same rules
+        if self.live.illegal_lines or not self.live.in_sync(sanitizer, recursive):
+            problems = sanitizer.check(news, recursive)
+        else:
+            problems = None
 
-        if found_illegal:
+        if problems:
             msg_box = QMessageBox(self)
             msg_box.setWindowTitle(self.tr("invalid_chars"))
-            msg_box.setText(self.tr("invalid_chars_msg").format(" ".join(sorted(found_illegal))))
+            if not (problems.too_long or problems.reserved or problems.trailing):
+                msg_box.setText(self.tr("invalid_chars_msg").format(" ".join(sorted(problems.chars))))
+            else:
+                lines = []
+                if problems.chars:
+                    lines.append(self.tr("invalid_names_chars").format(" ".join(sorted(problems.chars))))
+                for key, found in (("invalid_names_too_long", problems.too_long),
+                                   ("invalid_names_reserved", problems.reserved),
+                                   ("invalid_names_trailing", problems.trailing)):
+                    if found:
+                        lines.append(self.tr(key).format(len(found)))
+                msg_box.setText("\n".join([*lines, "", self.tr("invalid_names_question")]))
             yes_btn = msg_box.addButton(self.tr("yes"), QMessageBox.ButtonRole.YesRole)
             msg_box.addButton(self.tr("no"), QMessageBox.ButtonRole.NoRole)
-            msg_box.exec()
+            with self._timer.excluded():
+                msg_box.exec()
             if msg_box.clickedButton() == yes_btn:
-                news = [''.join(c for c in n if c not in illegal_chars) for n in news]
-                self.text_new.setPlainText("\n".join(news))
+                news = sanitizer.clean(news, recursive)
+                self._set_lines(self.text_new, news)
             else:
                 return None
         return folder, origs, news
 
-    def _handle_name_conflicts(self, news, folder):
-        conflicting_indices = set()
-        
-        # 1. Check for files that already exist in the folder
-        for i, name in enumerate(news):
-            if os.path.exists(os.path.join(folder, name)):
-                conflicting_indices.add(i)
-
-        # 2. Check for duplicate names within the 'news' list itself
-        name_counts = Counter(news)
-        for name, count in name_counts.items():
-            if count > 1:
-                # Find all indices of this duplicated name
-                for i, n in enumerate(news):
-                    if n == name:
-                        conflicting_indices.add(i)
-
-        if not conflicting_indices:
+    def _handle_name_conflicts(self, origs, news, snapshot):
+        conflicts = engine.find_conflicts(origs, news, snapshot)
+        if not conflicts:
             return news
 
-        conflicts = [{'name': news[i], 'index': i, 'line': i + 1} for i in sorted(list(conflicting_indices))]
-
         msg_box = QMessageBox(self)
         msg_box.setWindowTitle(self.tr("conflict_title"))
         msg_box.setText(self.tr("conflict_text").format(len(conflicts)))
@@ -1555,147 +2394,314 @@ class MassRenamerApp(QMainWindow):
         msg_box.setInformativeText(self.tr("conflict_info"))
         rename_btn = msg_box.addButton(self.tr("conflict_btn_rename"), QMessageBox.ButtonRole.YesRole)
         list_btn = msg_box.addButton(self.tr("conflict_btn_list"), QMessageBox.ButtonRole.NoRole)
+        duplicates_btn = msg_box.addButton(self.tr("conflict_btn_duplicates"), QMessageBox.ButtonRole.NoRole)
         cancel_btn = msg_box.addButton(self.tr("conflict_btn_cancel"), QMessageBox.ButtonRole.RejectRole)
-        buttons = [rename_btn, list_btn, cancel_btn]
+        buttons = [rename_btn, list_btn, duplicates_btn, cancel_btn]
         max_width = max(b.sizeHint().width() for b in buttons)
         for b in buttons: b.setFixedWidth(max_width + 10)
-        msg_box.exec()
+        with self._timer.excluded():
+            msg_box.exec()
         clicked = msg_box.clickedButton()
-        if clicked == list_btn:
-            line_numbers = ", ".join(str(c['line']) for c in conflicts)
+        if clicked in (list_btn, duplicates_btn):
+            line_numbers = ", ".join(str(i + 1) for i in conflicts)
             self.log_text.setPlainText(f"Operation canceled. The names on the following lines already exist in the selected folder or are duplicated: {line_numbers}.")
+            if clicked == duplicates_btn:
+                self._report_duplicates(snapshot.folder, origs)
             return None
         elif clicked == cancel_btn: return None
         elif clicked == rename_btn:
-            temp_news = list(news) # Work on a copy
-            for c in conflicts:
-                base, ext = os.path.splitext(c['name'])
-                count = 1
-                while True:
-                    new_name = f"{base}_({count}){ext}"
-                    # Check against both filesystem and the rest of the list
-                    if not os.path.exists(os.path.join(folder, new_name)) and new_name not in temp_news:
-                        temp_news[c['index']] = new_name
-                        break
-                    count += 1
-            self.text_new.setPlainText("\n".join(temp_news))
+            temp_news = engine.resolve_conflicts(origs, news, conflicts, snapshot)
+            self._set_lines(self.text_new, temp_news)
             return temp_news
         return None
 
-    def _execute_rename(self, folder, origs, news):
+    def _report_duplicates(self, folder, origs):
+        """Lists in the log the original files whose contents are byte-identical.
+
+        The files are hashed by the worker; meanwhile the Rename button cancels it.
+        """
+        self.progress_label.setText("0%")
+        self.progress_label.show()
+        self._start_worker(self._duplicates_job(folder, origs), len(origs),
+                           lambda results: self._on_duplicates_finished(origs, results), profile=False)
+        self._hashing = True
+        self.rename_button.setText(self.tr("cancel"))
+        self.rename_button.setEnabled(True)
+
+    def _duplicates_job(self, folder, origs):
+        """Generator run by the worker thread: one item per hashed file, then the groups (or the error)."""
+        try:
+            cache = self._metadata_cache().digests
+            hashed = 0
+            for done, total, groups in cache.iter_duplicates(folder, origs):
+                # The files to hash are known once they are all stat'ed
+                self._worker.total = total + 1
+                for _ in range(done - hashed):
+                    yield None, None
+                hashed = done
+            yield None, groups
+            cache.save()
+        except OSError as e:
+            yield f"\n{self.tr('error')}: {e}", None
+
+    def _on_duplicates_finished(self, origs, results):
+        self._hashing = False
+        self.rename_button.setText(self.tr("rename"))
+        self.progress_label.hide()
+        # No groups when it was cancelled or failed (the error is in the log)
+        groups = results[0] if results else None
+        if groups == []:
+            self._log("", self.tr("duplicates_none"))
+        elif groups:
+            lines = [self.tr("duplicates_found").format(len(groups))]
+            for group in groups:
+                lines.append(self.tr("duplicates_line").format(", ".join(str(i + 1) for i in group),
+                                                               ", ".join(origs[i] for i in group)))
+            self._log("", *lines)
+        self._flush_log()
+
+    def _execute_rename(self, folder, origs, news, snapshot):
         self.log_text.clear()
         
         total_files = len(origs)
         if total_files == 0:
             self.log_text.appendPlainText(f"\n{self.tr('done')}")
-            return
+            return False
             
-        processed_count = 0
+        self._begin_log("rename.log")
         self.progress_label.setText("0%")
         self.progress_label.show()
-
-        try: os.remove(self.history_file_path)
-        except OSError: pass
-        
-        temp_history = []
-        for o, n in zip(origs, news):
-            src, dst = os.path.join(folder, o), os.path.join(folder, n)
-            if not os.path.isfile(src):
-                self.log_text.appendPlainText(f"❌ {self.tr('not_found')} {o}")
+        with self._timer.phase("planning"):
+            steps = engine.plan(origs, news)
+        workers = engine.RENAME_WORKERS if self.recursive_check.isChecked() else 1
+        with self._timer.phase("history"):
+            self._batch = self.history.begin(folder, steps, self.recursive_check.isChecked())
+        self._batch_entries = 0
+        self._status_updates.clear()
+        self._status_rows = {}
+        if self.table_mode:
+            # The validated originals are the non-blank rows of the table, in order
+            self.mapping_model.clear_statuses()
+            rows = (row for row, name in enumerate(self.mapping_model.columns[0]) if name.strip())
+            self._status_rows = dict(zip(origs, rows))
+        job = self._rename_job(folder, steps, snapshot, workers, self.history.journal_path(self._batch))
+        self._start_worker(job, len(steps), self._on_rename_finished)
+        return True
+
+    def _rename_job(self, folder, steps, snapshot, workers, journal_path, resume=None):
+        """Generator run by the worker thread: turns engine events into log lines."""
+        events = engine.execute(folder, steps, snapshot, journal_path, self.history_commit_interval,
+                                workers, self._timer, resume)
+        row_of = self._status_rows.get
+        for status, o, n, detail in events:
+            if status == "renamed":
+                line, result = f"✅ {o} → {n}", detail
+            elif status in ("step", "recovered"):
+                line, result = None, detail
+            elif status == "missing":
+                line, result = f"❌ {self.tr('not_found')} {o}", None
+            elif status == "error":
+                line, result = f"⚠️ {self.tr('error_renaming')} {o}: {detail}", None
             else:
-                try:
-                    shutil.move(src, dst)
-                    temp_history.append((dst, src))
-                    with open(self.history_file_path, "w", encoding="utf-8") as f:
-                        json.dump(temp_history, f)
-                    self.log_text.appendPlainText(f"✅ {o} → {n}")
-                except Exception as e:
-                    self.log_text.appendPlainText(f"⚠️ {self.tr('error_renaming')} {o}: {e}")
-            
-            # Update progress
-            processed_count += 1
-            percentage = int((processed_count / total_files) * 100)
-            self.progress_label.setText(f"{percentage}%")
-            QApplication.processEvents() # Force UI update to show progress
-
-        self.rename_history.extend(temp_history)
-        if self.rename_history: self.undo_button.setEnabled(True)
-        self.log_text.appendPlainText(f"\n{self.tr('done')}")
-
-        # Save the log file
-        rename_log_path = os.path.join(self.config_dir, "rename.log")
-        save_msg = self.tr("log_saved_rename").format(rename_log_path)
-        self.log_text.appendPlainText(f"\n---\n{save_msg}")
-        try:
-            with open(rename_log_path, "w", encoding="utf-8") as f:
-                f.write(self.log_text.toPlainText())
-        except IOError as e:
-            print(f"Could not save rename log: {e}")
+                line, result = None, None
+            row = row_of(o)
+            if line is not None and row is not None:
+                self._status_updates.append((row, line.split(" ", 1)[0] if status == "renamed" else line))
+            yield line, result
+
+    def _on_rename_finished(self, history):
+        self._refresh_live_rules()
+        with self._timer.phase("history"):
+            self.history.finish(self._batch, self._batch_entries + len(history))
+        self.undo_button.setEnabled(bool(self.history.batches))
+        self._log(f"\n{self.tr('done')}")
+        self._log_timings()
+        self._log(f"\n---\n{self.tr('log_saved_rename').format(self._log_path)}")
+        self._end_log()
 
     def undo(self):
         self.progress_label.hide()
-        if not self.rename_history:
+        if self._worker_thread is not None or not self.history.refresh():
             return
-            
+        self._start_timing("undo")
+        if not self._run_undo():
+            self._profiler.stop()
+
+    def _run_undo(self):
+        """Checks the history and starts the undo. Returns False when it stops before the worker starts."""
+        # Batches are undone newest first
+        batch = self.history.top()
+        if self.history.running(batch):
+            QMessageBox.critical(self, self.tr("undo_failed_title"), self.tr("undo_running"))
+            return False
+        with self._timer.phase("history"):
+            history = self.history.load(batch)
+        if not history:
+            # Nothing was journaled (e.g. a crash before the first rename)
+            self.history.pop(batch)
+            self.undo_button.setEnabled(bool(self.history.batches))
+            return False
+
         # --- Undo Safety Check ---
-        all_files_exist = True
-        for new_path, _ in self.rename_history:
-            if not os.path.exists(new_path):
-                all_files_exist = False
-                break
-
-        if not all_files_exist:
-            QMessageBox.critical(self, self.tr("undo_failed_title"), self.tr("undo_failed_msg"))
-            return
+        with self._timer.phase("verification"):
+            drifted = engine.find_drift(history)
+        if drifted:
+            self.log_text.setPlainText("\n".join(f"❌ {path}: {self.tr('drift_' + reason)}" for path, reason in drifted))
+            QMessageBox.critical(self, self.tr("undo_failed_title"), self.tr("undo_failed_msg").format(len(drifted)))
+            return False
         # --- End of Safety Check ---
         
-        reply = QMessageBox.question(self, self.tr("undo"), self.tr("undo_confirm"),
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
-                                     QMessageBox.StandardButton.No)
+        with self._timer.excluded():
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(batch["time"]))
+            text = self.tr("undo_confirm").format(len(history), batch["folder"], when, len(self.history.batches) - 1)
+            reply = QMessageBox.question(self, self.tr("undo"), text,
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                         QMessageBox.StandardButton.No)
         if reply != QMessageBox.StandardButton.Yes:
-            return
+            return False
             
-        self.log_text.clear()
-        self.log_text.appendPlainText(f"{self.tr('undoing')}\n")
-        
-        total_files = len(self.rename_history)
-        if total_files == 0:
-            return
+        self._undo_batch = batch
+        self._begin_log("undo.log")
+        self._log(f"{self.tr('undoing')}\n")
             
-        processed_count = 0
         self.progress_label.setText("0%")
         self.progress_label.show()
-        
-        for dst, src in reversed(self.rename_history):
+        self._start_worker(self._undo_job(history), len(history), self._on_undo_finished)
+        return True
+
+    def _undo_job(self, history):
+        """Generator run by the worker thread: turns engine events into log lines."""
+        # Only a history spanning several directories is actually run in parallel
+        for status, dst, src, error in engine.undo(history, engine.RENAME_WORKERS, self._timer):
+            if status == "undone":
+                yield f"↩️ {os.path.basename(dst)} → {os.path.basename(src)}", None
+            else:
+                yield f"⚠️ {self.tr('error_undoing')} {dst}: {error}", None
+
+    def _on_undo_finished(self, _):
+        self._refresh_live_rules()
+        self._log(f"\n{self.tr('undo_done')}")
+        with self._timer.phase("history"):
+            self.history.pop(self._undo_batch)
+        self.undo_button.setEnabled(bool(self.history.batches))
+
+        self._log_timings()
+        self._log(f"\n---\n{self.tr('log_saved_undo').format(self._log_path)}")
+        self._end_log()
+
+    # --- Timing and profiling ---
+    def _start_timing(self, name):
+        """Starts the phase timer and, if $MASSRENAMER_PROFILE asks for it, the profiler of a batch."""
+        self._timer = engine.PhaseTimer()
+        self._profiler = engine.BatchProfiler(name, self.config_dir)
+        self._profiler.start()
+
+    def _log_timings(self):
+        self._log(f"\n⏱️ {self.tr('timings')}", *(f"   {line}" for line in self._timer.summary()))
+        paths = self._profiler.stop()
+        if paths:
+            self._log(self.tr("profile_saved").format(", ".join(paths)))
+
+    # --- Log output ---
+    def _begin_log(self, file_name):
+        """Clears the log panel and starts streaming the complete log to file_name in the config dir."""
+        self.log_text.clear()
+        self._log_buffer.clear()
+        self._log_path = os.path.join(self.config_dir, file_name)
+        try:
+            self._log_file = open(self._log_path, "w", encoding="utf-8")
+        except IOError as e:
+            self._log_file = None
+            print(f"Could not save log: {e}")
+        self._log_timer.start()
+
+    def _log(self, *lines):
+        """Writes lines to the log file at once; the panel gets them on the next timer flush."""
+        if self._log_file is not None:
             try:
-                shutil.move(dst, src)
-                self.log_text.appendPlainText(f"↩️ {os.path.basename(dst)} → {os.path.basename(src)}")
-            except Exception as e:
-                self.log_text.appendPlainText(f"⚠️ {self.tr('error_undoing')} {dst}: {e}")
-            
-            # Update progress
-            processed_count += 1
-            percentage = int((processed_count / total_files) * 100)
+                self._log_file.write("\n".join(lines) + "\n")
+            except IOError as e:
+                print(f"Could not save log: {e}")
+        # The buffer is capped like the panel, so lines that would scroll off are never laid out
+        self._log_buffer.extend(lines)
+
+    def _flush_log(self):
+        if self._status_updates:
+            with self._timer.phase("gui"):
+                updates = [self._status_updates.popleft() for _ in range(len(self._status_updates))]
+                self.mapping_model.set_statuses(updates)
+        if self._log_buffer:
+            with self._timer.phase("gui"):
+                self.log_text.appendPlainText("\n".join(self._log_buffer))
+                self._log_buffer.clear()
+
+    def _end_log(self):
+        self._log_timer.stop()
+        self._flush_log()
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    # --- Background execution ---
+    def _start_worker(self, job, total, on_finished, profile=True):
+        self._set_busy(True)
+        thread = QThread(self)
+        worker = BatchWorker(job, total, self._profiler if profile else None)
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.progress.connect(self._show_progress)
+        worker.log_lines.connect(lambda lines: self._log(*lines))
+        # Direct: the window may be blocked waiting for the thread (see closeEvent)
+        worker.finished.connect(thread.quit, Qt.ConnectionType.DirectConnection)
+        worker.finished.connect(lambda results: self._on_worker_finished(results, on_finished))
+        thread.finished.connect(thread.deleteLater)
+        self._worker_thread, self._worker = thread, worker
+        thread.start()
+
+    def _show_progress(self, percentage):
+        with self._timer.phase("gui"):
             self.progress_label.setText(f"{percentage}%")
-            QApplication.processEvents() # Force UI update
-                
-        self.log_text.appendPlainText(f"\n{self.tr('undo_done')}")
-        self.rename_history.clear()
-        self.undo_button.setEnabled(False)
-        try:
-            os.remove(self.history_file_path)
-        except OSError:
-            pass
 
-        # Save the log file
-        undo_log_path = os.path.join(self.config_dir, "undo.log")
-        save_msg = self.tr("log_saved_undo").format(undo_log_path)
-        self.log_text.appendPlainText(f"\n---\n{save_msg}")
-        try:
-            with open(undo_log_path, "w", encoding="utf-8") as f:
-                f.write(self.log_text.toPlainText())
-        except IOError as e:
-            print(f"Could not save undo log: {e}")
+    def _on_worker_finished(self, results, on_finished):
+        self._worker_thread.wait()
+        self._worker_thread = self._worker = None
+        self._set_busy(False)
+        on_finished(results)
+
+    def _set_busy(self, busy):
+        """Locks the controls that could start a second batch while one is running."""
+        self.rename_button.setEnabled(not busy)
+        self.undo_button.setEnabled(not busy and bool(self.history.batches))
+        self.load_button.setEnabled(not busy and bool(self.entry_local.text().strip()))
+        self.select_button.setEnabled(not busy)
+        self.recursive_check.setEnabled(not busy)
+        self.table_check.setEnabled(not busy)
+        self.order_combo.setEnabled(not busy)
+
+    def closeEvent(self, event):
+        if self._loader_thread is not None:
+            # The names still queued for the editor would only reach a closed window
+            self._loader.chunk.disconnect()
+            self._loader.finished.disconnect(self._on_load_finished)
+            self._loader.cancel()
+            self._loader_thread.wait()
+            self._loader_thread = self._loader = None
+        if self._hashing:
+            self._worker.cancel()
+        # Let a running batch finish so the files on disk and the history stay consistent
+        if self._worker_thread is not None:
+            self._worker_thread.wait()
+            # Deliver its queued log lines and results: the log is written and the batch finished in the history
+            QApplication.sendPostedEvents()
+            self._end_log()
+        # No folder is listed from now on (hiding the window still ends the path's editing)
+        self._closing = True
+        if self._indexer_thread is not None:
+            self._indexer.finished.disconnect(self._on_folder_indexed)
+            self._indexer_thread.wait()
+            self._indexer_thread = self._indexer = None
+        self._stop_watching()
+        super().closeEvent(event)
 
     def tr(self, key):
         return LANG_TEXTS[self.current_lang].get(key, key)
@@ -1706,7 +2712,13 @@ class MassRenamerApp(QMainWindow):
         self.settings_label.setText(self.tr("settings"))
         self.label_location.setText(self.tr("file_location"))
         self.select_button.setText(self.tr("select_folder"))
-        self.load_button.setText(self.tr("load_original"))
+        self.load_button.setText(self.tr("cancel") if self._loading else self.tr("load_original"))
+        self.recursive_check.setText(self.tr("recursive"))
+        self.table_check.setText(self.tr("table_view"))
+        for i, order in enumerate(engine.SORT_ORDERS):
+            self.order_combo.setItemText(i, self.tr(f"order_{order}"))
+        self.order_combo.setToolTip(self.tr("order_tooltip"))
+        self.mapping_model.set_headers([self.tr("col_original"), self.tr("col_new"), self.tr("col_status")])
         self.label_orig.setText(self.tr("orig_names"))
         self.label_new.setText(self.tr("new_names"))
         self.label_log.setText(self.tr("log"))
@@ -1716,11 +2728,19 @@ class MassRenamerApp(QMainWindow):
         self.ext_label_n.setText(self.tr("add_extension"))
         self.transfer_ext_button.setText(self.tr("transfer_extensions"))
         self.remove_ext_button.setText(self.tr("remove_extension"))
+        self.rules_button.setText(self.tr("rules"))
 
     def change_theme(self, theme_key, startup=False):
         self.current_theme = theme_key
         stylesheet = self.themes.get(theme_key, DARK_STYLESHEET)
-        QApplication.instance().setStyleSheet(stylesheet)
+        app = QApplication.instance()
+        # Setting it again, even unchanged, restyles every widget
+        if app.styleSheet() != stylesheet:
+            with contextlib.ExitStack() as stack:
+                for widget in app.allWidgets():
+                    if isinstance(widget, CodeEditor):
+                        stack.enter_context(widget.restyling())
+                app.setStyleSheet(stylesheet)
         
         # Set progress label color dynamically from the main text color
         palette = self.log_text.palette()
@@ -1741,24 +2761,426 @@ class MassRenamerApp(QMainWindow):
         dialog = SettingsDialog(self)
         dialog.exec()
 
+    def open_rules_dialog(self):
+        if self._worker_thread is not None or self._loading:
+            return
+        RulesDialog(self).exec()
+
+    def apply_rules(self, pipeline):
+        """Replaces the new names with what the rules make of the original names, computed by the worker."""
+        if self._worker_thread is not None:
+            return
+        self.progress_label.setText("0%")
+        self.progress_label.show()
+        job = self._rules_job(pipeline, self.entry_local.text().strip(), self._names(self.text_orig))
+        self._start_worker(job, 1, self._on_rules_finished, profile=False)
+
+    def _rules_job(self, pipeline, folder, origs):
+        """Generator run by the worker thread: the new names, once the files' metadata is read."""
+        # The files are only read when the rules use their metadata
+        metadata = self._lookup_metadata(origs, pipeline.fields, folder) if pipeline.fields else None
+        try:
+            news = pipeline.apply(origs, metadata)
+        except engine.EngineError as e:
+            # The new names are left as they were
+            yield f"⚠️ {self._engine_error_text(e)}", None
+        else:
+            yield None, news
+        if self._metadata is not None:
+            self._metadata.save()
+
+    def _on_rules_finished(self, results):
+        self.progress_label.hide()
+        if results:
+            self._set_lines(self.text_new, results[0])
+        # A failure is in the log
+        self._flush_log()
+
+    def _lookup_metadata(self, names, fields=engine.METADATA_FIELDS, folder=None):
+        """Metadata of names in folder (the selected one by default), through the on-disk cache."""
+        if folder is None:
+            folder = self.entry_local.text().strip()
+        try:
+            return self._metadata_cache().lookup(folder, names, fields=fields)
+        except OSError:
+            # No valid folder yet: the tokens stay empty
+            return [{} for _ in names]
+
+    def _metadata_cache(self):
+        # Opened on first use: only rules with tokens and the duplicates report read it
+        if self._metadata is None:
+            self._metadata = engine.MetadataCache.open(self.config_dir)
+        return self._metadata
+
     def select_folder(self):
         folder = QFileDialog.getExistingDirectory(self, self.tr("select_folder"))
         if folder:
             self.entry_local.setText(folder)
             self.load_button.setEnabled(True)
+            self._refresh_live_rules()
 
     def load_original_names(self):
+        # While loading, the same button cancels the listing
+        if self._loader_thread is not None:
+            self._loader.cancel()
+            return
         folder = self.entry_local.text().strip()
         if not folder or not os.path.isdir(folder):
             QMessageBox.critical(self, self.tr("error"), self.tr("select_valid_folder"))
             return
+
+        self._set_lines(self.text_orig, [])
+        self._set_loading(True)
+        self.progress_label.setText(self.tr("names_loaded").format(0))
+        self.progress_label.show()
+
+        self._listing = self._listing_shown = None
+        thread = QThread(self)
+        loader = FolderLoader(folder, self.recursive_check.isChecked(), self.sort_order)
+        loader.moveToThread(thread)
+        thread.started.connect(loader.run)
+        loader.chunk.connect(self._on_load_chunk)
+        loader.failed.connect(lambda e: QMessageBox.critical(self, self.tr("error"), f"{self.tr('cannot_list')}\n{e}"))
+        # Direct: the window may be blocked waiting for the thread (see closeEvent)
+        loader.finished.connect(thread.quit, Qt.ConnectionType.DirectConnection)
+        loader.finished.connect(self._on_load_finished)
+        thread.finished.connect(thread.deleteLater)
+        self._loader_thread, self._loader = thread, loader
+        self._loaded_count = 0
+        thread.start()
+
+    def _on_load_chunk(self, names):
+        self._loaded_count += len(names)
+        self._append_names(names)
+        self.progress_label.setText(self.tr("names_loaded").format(self._loaded_count))
+
+    def _on_load_finished(self, listing, needs_sorting):
+        self._loader_thread.wait()
+        self._loader_thread = self._loader = None
+        if listing is not None:
+            self._listing, self._listing_mode = listing, self.recursive_check.isChecked()
+            self._listing_shown = names = listing.sorted(self.sort_order)
+        if not needs_sorting:
+            self._set_loading(False)
+            self._listing_edits = self._orig_edits
+            return
+        # The names were shown in directory order while listing; put them in
+        # sorted order a chunk per event loop turn so the window stays usable
+        self._set_lines(self.text_orig, [])
+        chunks = (names[i:i + LOAD_CHUNK_LINES] for i in range(0, len(names), LOAD_CHUNK_LINES))
+        def feed():
+            chunk = next(chunks, None)
+            if chunk is None:
+                self._set_loading(False)
+                self._listing_edits = self._orig_edits
+                return
+            self._append_names(chunk)
+            QTimer.singleShot(0, feed)
+        feed()
+
+    def set_sort_order(self, order):
+        """Reorders the loaded names, unless they were edited since; the order is kept for the next load."""
+        self.sort_order = order
+        self.settings.setValue("sort_order", order)
+        if not self._shows_listing():
+            return
+        # Each order is sorted once per listing; going back to one is a lookup
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            self._listing_shown = self._listing.sorted(order)
+            self._set_lines(self.text_orig, self._listing_shown)
+            self._listing_edits = self._orig_edits
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def _shows_listing(self):
+        """True while the original names are the last listing of the selected folder, not edited since."""
+        listing = self._listing
+        return (not self._loading and listing is not None and listing.folder == self.entry_local.text().strip()
+                and self._listing_mode == self.recursive_check.isChecked()
+                and self._listing_edits == self._orig_edits)
+
+    def _append_names(self, names):
+        """Appends loaded names to the original names, in the editor or in the table."""
+        if self.table_mode:
+            self.mapping_model.append(MappingModel.ORIGINAL, names)
+        else:
+            self._append_lines(self.text_orig, names)
+
+    def _append_lines(self, editor, lines):
+        """Appends lines at the end of the editor without moving the view."""
+        cursor = QTextCursor(editor.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        text = "\n".join(lines)
+        cursor.insertText(f"\n{text}" if editor.document().characterCount() > 1 else text)
+
+    # --- Live validation ---
+    def _init_live_validation(self):
+        """Feeds every edit of the lists to the live validator and refreshes the problem count shortly after."""
+        self._block_counts = [1, 1]
+        for column, editor in enumerate((self.text_orig, self.text_new)):
+            editor.document().contentsChange.connect(
+                lambda position, removed, added, column=column: self._on_editor_change(column, position, added))
+        self.mapping_model.linesChanged.connect(self._on_table_change)
+        self.text_new.lineProblem = self.live.line_problem
+        self.mapping_model.problem = self.live.line_problem
+        self._live_timer = QTimer(self)
+        self._live_timer.setSingleShot(True)
+        self._live_timer.setInterval(LIVE_VALIDATION_DELAY_MS)
+        self._live_timer.timeout.connect(self._show_live_validation)
+        self._watch_timer = QTimer(self)
+        self._watch_timer.setSingleShot(True)
+        self._watch_timer.setInterval(WATCH_COALESCE_MS)
+        self._watch_timer.timeout.connect(self._apply_folder_changes)
+        self.entry_local.editingFinished.connect(self._refresh_live_rules)
+        self.recursive_check.toggled.connect(self._refresh_live_rules)
+        self._refresh_live_rules()
+
+    def _on_editor_change(self, column, position, added):
+        # The lines between the first and last touched blocks replace as many old
+        # lines as there are now, minus the blocks the edit added
+        document = (self.text_orig, self.text_new)[column].document()
+        count = document.blockCount()
+        delta, self._block_counts[column] = count - self._block_counts[column], count
+        if column == 0:
+            self._orig_edits += 1
+        if self.table_mode:
+            return
+        first = document.findBlock(position)
+        last = document.findBlock(min(position + added, document.characterCount() - 1))
+        cursor = QTextCursor(first)
+        cursor.setPosition(last.position() + last.length() - 1, QTextCursor.MoveMode.KeepAnchor)
+        lines = cursor.selectedText().split("\u2029")
+        self.live.replace(column, first.blockNumber(), len(lines) - delta, lines)
+        self._live_timer.start()
+
+    def _on_table_change(self, column, first, removed, lines):
+        if column == 0:
+            self._orig_edits += 1
+        if self.table_mode:
+            self.live.replace(column, first, removed, lines)
+            self._live_timer.start()
+
+    def _reset_live_lines(self):
+        """Reloads both lists into the live validator from the editors or the table, whichever is shown."""
+        for column, editor in enumerate((self.text_orig, self.text_new)):
+            self.live.replace(column, 0, len(self.live.lines[column]), self._lines(editor) or [""])
+        self._live_timer.start()
+
+    def _refresh_live_rules(self):
+        """Takes the current settings and folder contents into account."""
+        recursive = self.recursive_check.isChecked()
+        self.live.set_rules(self._sanitizer(), recursive)
+        # Recursive batches only check names against the lists themselves
+        self._watch_folder("" if recursive else self.entry_local.text().strip())
+        self._live_timer.start()
+
+    # --- Folder watching ---
+    def _watch_folder(self, folder):
+        """Watches folder and lists it into self._folder_index off the GUI thread, unless it already is.
+
+        The live validation gets the folder's names when the listing is done.
+        Without inotify the folder is listed again on every call, as before.
+        """
+        if self._closing or (self._index_folder == folder and self._watcher is not None and not self._watcher.lost):
+            return
+        if self._folder_index is None or self._folder_index.folder != folder:
+            self.live.set_existing(())
+        self._stop_watching()
+        if not folder or not os.path.isdir(folder):
+            return
+        # Watched before it is listed, so changes made while listing are not missed
         try:
-            items = os.listdir(folder)
-            files = sorted(f for f in items if os.path.isfile(os.path.join(folder, f)))
-        except (OSError, PermissionError) as e:
-            QMessageBox.critical(self, self.tr("error"), f"{self.tr('cannot_list')}\\n{e}")
+            self._watcher = engine.FolderWatcher(folder)
+            self._watch_notifier = QSocketNotifier(self._watcher.fileno(), QSocketNotifier.Type.Read, self)
+            self._watch_notifier.activated.connect(self._read_folder_changes)
+        except OSError:
+            pass
+        self._index_folder = folder
+        self._start_indexer()
+
+    def _start_indexer(self):
+        # One listing at a time: a stale one starts the next when it finishes
+        if self._indexer_thread is not None:
+            return
+        thread = QThread(self)
+        indexer = FolderIndexer(self._index_folder, self._index_generation)
+        indexer.moveToThread(thread)
+        thread.started.connect(indexer.run)
+        # Direct: the window may be blocked waiting for the thread (see closeEvent)
+        indexer.finished.connect(thread.quit, Qt.ConnectionType.DirectConnection)
+        indexer.finished.connect(self._on_folder_indexed)
+        thread.finished.connect(thread.deleteLater)
+        self._indexer_thread, self._indexer = thread, indexer
+        thread.start()
+
+    def _on_folder_indexed(self, index):
+        self._indexer_thread.wait()
+        generation = self._indexer.generation
+        self._indexer_thread = self._indexer = None
+        if generation != self._index_generation:
+            # The folder changed, or was watched again, while it was listed
+            if self._index_folder is not None:
+                self._start_indexer()
+            return
+        if index is None:
+            return
+        self._folder_index = index
+        self.live.set_existing(index.names)
+        self._apply_folder_changes()
+        self._live_timer.start()
+
+    def _stop_watching(self):
+        if self._watch_notifier is not None:
+            self._watch_notifier.setEnabled(False)
+            self._watch_notifier.deleteLater()
+        if self._watcher is not None:
+            self._watcher.close()
+        self._folder_index = self._watcher = self._watch_notifier = None
+        self._folder_changes = {}
+        self._index_folder = None
+        self._index_generation += 1
+        self._watch_timer.stop()
+
+    def _read_folder_changes(self):
+        """Gathers the folder's changes; the last one of each name wins and they are applied together."""
+        changes = self._folder_changes
+        for name, is_dir in self._watcher.read():
+            changes[name] = is_dir
+        if self._watcher.lost:
+            # Events were dropped: list the folder again, and stop following it in the original names
+            self._listing_edits = None
+            self._refresh_live_rules()
+        elif changes and not self._watch_timer.isActive():
+            # Not restarted by later changes, so a folder that never settles is still followed
+            self._watch_timer.start()
+
+    def _apply_folder_changes(self):
+        if self._folder_index is None:
+            # Still being listed: the changes are applied to the listing when it is done
+            return
+        changes, self._folder_changes = self._folder_changes, {}
+        if not changes:
             return
-        self.text_orig.setPlainText("\n".join(files))
+        added, removed = self._folder_index.apply(changes.items())
+        if not (added or removed):
+            return
+        self.live.update_existing(added, removed)
+        self._live_timer.start()
+        # The original names only follow the folder while no new names are paired with them:
+        # removing a line would move every new name below it to another file
+        if self._shows_listing() and not self.live.names[1] and self._worker_thread is None:
+            files = self._folder_index.files
+            self._update_listed_names([name for name in added if name in files], removed)
+
+    def _update_listed_names(self, added, removed):
+        """Removes the lines of removed names from the original names and appends the added ones."""
+        self._listing.update(added, removed)
+        shown = self._listing_shown
+        if removed:
+            gone = set(removed)
+            rows = [row for row, name in enumerate(shown) if name in gone]
+            if self.table_mode:
+                self.mapping_model.remove_rows(rows)
+            else:
+                self._remove_lines(self.text_orig, rows)
+            shown = [name for name in shown if name not in gone]
+        if added:
+            self._append_names(added)
+            shown = shown + added
+        self._listing_shown = shown
+        self._listing_edits = self._orig_edits
+
+    def _remove_lines(self, editor, rows):
+        """Removes lines (by ascending row number) from an editor, a run of consecutive lines at a time."""
+        document = editor.document()
+        for first, last in reversed(_runs(rows)):
+            start, end = document.findBlockByNumber(first), document.findBlockByNumber(last)
+            cursor = QTextCursor(document)
+            if end.next().isValid():
+                cursor.setPosition(start.position())
+                cursor.setPosition(end.next().position(), QTextCursor.MoveMode.KeepAnchor)
+            else:
+                # The last lines: take the line break before them instead
+                cursor.setPosition(max(0, start.position() - 1))
+                cursor.setPosition(end.position() + end.length() - 1, QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+
+    def _show_live_validation(self):
+        live = self.live
+        problems = []
+        if live.illegal_lines:
+            problems.append(self.tr("live_illegal").format(live.illegal_lines))
+        if live.conflict_lines:
+            problems.append(self.tr("live_conflicts").format(live.conflict_lines))
+        if live.mismatch:
+            problems.append(self.tr("live_count").format(*live.names))
+        self.problems_label.setText(f"⚠️ {' · '.join(problems)}" if problems else "")
+        self.text_new.lineNumberArea.update()
+        self.mapping_table.viewport().update()
+
+    # --- Table view ---
+    def set_table_mode(self, enabled):
+        """Moves the names between the two editors and the table, and shows the one in use."""
+        if enabled == self.table_mode:
+            return
+        shows_listing = self._shows_listing()
+        if enabled:
+            origs, news = self.text_orig.toPlainText().splitlines(), self.text_new.toPlainText().splitlines()
+            self.text_orig.clear()
+            self.text_new.clear()
+            self.mapping_model.set_column(MappingModel.ORIGINAL, origs)
+            self.mapping_model.set_column(MappingModel.NEW, news)
+        else:
+            origs, news = self.mapping_model.columns
+            self.text_orig.setPlainText("\n".join(origs))
+            self.text_new.setPlainText("\n".join(news))
+            self.mapping_model.set_column(MappingModel.ORIGINAL, [])
+            self.mapping_model.set_column(MappingModel.NEW, [])
+        self.table_mode = enabled
+        self.settings.setValue("table_view", enabled)
+        self._show_table(enabled)
+        self._reset_live_lines()
+        if shows_listing:
+            self._listing_edits = self._orig_edits
+
+    def _show_table(self, shown):
+        self.mapping_table.setVisible(shown)
+        self.text_orig.setVisible(not shown)
+        self.label_new.setVisible(not shown)
+        self.text_new.setVisible(not shown)
+        # The table takes the room of both editors
+        self.main_layout.setRowStretch(6, 0 if shown else 1)
+        self.main_layout.setRowStretch(3, 2 if shown else 1)
+
+    def _lines(self, editor):
+        """Lines of the original (text_orig) or new (text_new) names, wherever they are shown."""
+        if self.table_mode:
+            return list(self.mapping_model.columns[editor is self.text_new])
+        return editor.toPlainText().splitlines()
+
+    def _set_lines(self, editor, lines):
+        if self.table_mode:
+            self.mapping_model.set_column(int(editor is self.text_new), lines)
+        else:
+            editor.setPlainText("\n".join(lines))
+
+    def _names(self, editor):
+        """The non-blank names of a list, stripped (see engine.parse_names)."""
+        if self.table_mode:
+            return [n.strip() for n in self.mapping_model.columns[editor is self.text_new] if n.strip()]
+        return engine.parse_names(editor.toPlainText())
+
+    def _set_loading(self, loading):
+        self._loading = loading
+        self.load_button.setText(self.tr("cancel") if loading else self.tr("load_original"))
+        self.rename_button.setEnabled(not loading)
+        self.select_button.setEnabled(not loading)
+        self.recursive_check.setEnabled(not loading)
+        self.table_check.setEnabled(not loading)
+        self.order_combo.setEnabled(not loading)
+        if not loading:
+            self.progress_label.hide()
         
     def show_extension_menu(self, button, text_widget):
         menu = QMenu(self)
@@ -1771,13 +3193,13 @@ class MassRenamerApp(QMainWindow):
         menu.exec(button_pos)
         
     def add_extension_to_widget(self, text_widget, ext):
-        lines = [l.rstrip() for l in text_widget.toPlainText().splitlines()]
+        lines = [l.rstrip() for l in self._lines(text_widget)]
         new_lines = [f"{l}{ext}" if l else "" for l in lines]
-        text_widget.setPlainText("\n".join(new_lines))
+        self._set_lines(text_widget, new_lines)
 
     def transfer_extensions(self):
-        orig_lines = self.text_orig.toPlainText().splitlines()
-        new_lines = self.text_new.toPlainText().splitlines()
+        orig_lines = self._lines(self.text_orig)
+        new_lines = self._lines(self.text_new)
         num_lines_to_process = min(len(orig_lines), len(new_lines))
         result_lines = list(new_lines)
         for i in range(num_lines_to_process):
@@ -1786,13 +3208,13 @@ class MassRenamerApp(QMainWindow):
             orig_ext = os.path.splitext(orig_lines[i])[1]
             if orig_ext:
                 result_lines[i] = result_lines[i] + orig_ext
-        self.text_new.setPlainText("\n".join(result_lines))
+        self._set_lines(self.text_new, result_lines)
 
 
     def remove_extension(self):
-        lines = self.text_new.toPlainText().splitlines()
+        lines = self._lines(self.text_new)
         new_lines = [os.path.splitext(line)[0] for line in lines]
-        self.text_new.setPlainText("\n".join(new_lines))
+        self._set_lines(self.text_new, new_lines)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
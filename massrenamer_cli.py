@@ -0,0 +1,313 @@
+# Copyright 2025 Jedielson da Fonseca
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Author: Jedielson da Fonseca jdfn7@proton.me
+
+"""Headless command line of Mass Renamer. Never imports Qt.
+
+    massrenamer --folder X --map mapping.tsv
+    massrenamer --undo
+    massrenamer --resume
+    massrenamer --folder X --map mapping.tsv --duplicates
+
+The mapping file has one "original<TAB>new" pair per line ("-" reads stdin);
+with --rules, the new names are computed from the originals instead and the
+lines only need the original names.
+The history is shared with the window, so a batch run here can be undone
+from the GUI and vice versa; each --undo reverts the newest batch left, and
+--resume finishes the newest batch that was interrupted (the app or the
+machine died while it ran).
+"""
+
+import os
+import sys
+import argparse
+
+import massrenamer_engine as engine
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED_ENTRIES = 1
+EXIT_INVALID = 2
+
+# English wording of the engine error keys
+ERROR_TEXTS = {
+    "select_valid_folder": "Select a valid folder.",
+    "forbidden_dir_msg": "This is the application's configuration directory. Renaming files here is not permitted.",
+    "map_error_msg": "Mapping error: {0} original names vs {1} new names",
+    "cannot_list": "Could not list files: {0}",
+    "map_dir_error": "Mapping line {0}: the new name must stay in the same folder as the original.",
+    "empty_name": "Mapping line {0}: the rules leave \"{1}\" without a name.",
+}
+
+DRIFT_TEXTS = {
+    "missing": "no longer exists",
+    "replaced": "is now a different file",
+    "modified": "was modified",
+}
+
+RULE_ERROR_TEXTS = {
+    "rule_syntax": "invalid or missing arguments",
+    "rule_unknown": "unknown rule \"{0}\"",
+    "rule_regex": "invalid regular expression ({0})",
+    "rule_field": "unknown token \"{{{0}}}\"",
+}
+
+RESUME_TEXTS = {
+    "missing": "neither the original nor the new name exists",
+    "exists": "both the original and the new name exist",
+}
+
+PLATFORMS = ("windows", "macos", "ios", "android")
+
+
+def read_mapping(path, originals_only=False):
+    """Returns (origs, news) from a tab-separated mapping file (news is empty with originals_only)."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    origs, news = [], []
+    try:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if originals_only:
+                origs.append(line.split("\t", 1)[0].strip())
+                continue
+            if "\t" not in line:
+                raise engine.EngineError("map_line", number)
+            o, n = line.split("\t", 1)
+            origs.append(o.strip())
+            news.append(n.strip())
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return origs, news
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="massrenamer", description="Rename files in a folder from a mapping, without the GUI.")
+    parser.add_argument("--folder", help="folder with the files to rename")
+    parser.add_argument("--map", help="tab-separated 'original<TAB>new' mapping file, or - for stdin")
+    parser.add_argument("--rules", help="file of rename rules (as in the window's Rules dialog) that compute the new names "
+                                          "from the mapping's original names")
+    parser.add_argument("--undo", action="store_true", help="undo the newest batch (from the CLI or the GUI); repeat to go further back")
+    parser.add_argument("--resume", action="store_true",
+                        help="finish the newest interrupted batch: only the renames it had not made yet are run")
+    parser.add_argument("--on-conflict", choices=("abort", "suffix"), default="abort",
+                        help="what to do with names that exist or are duplicated (default: abort)")
+    parser.add_argument("--on-illegal", choices=("abort", "strip"), default="abort",
+                        help="what to do with invalid names: characters not allowed, longer than 255 bytes, "
+                             "reserved by Windows or ending with a dot or space (default: abort)")
+    parser.add_argument("--platforms", default=",".join(PLATFORMS),
+                        help="comma-separated systems whose name rules apply "
+                             "(windows, macos, ios, android; '' for Linux only)")
+    parser.add_argument("--recursive", action="store_true",
+                        help="originals are paths relative to --folder; files and folders in subfolders are renamed in place")
+    parser.add_argument("--workers", type=int, default=engine.RENAME_WORKERS,
+                        help=f"folders renamed in parallel in a recursive batch (default: {engine.RENAME_WORKERS})")
+    parser.add_argument("--dry-run", action="store_true", help="print the planned steps and exit")
+    parser.add_argument("--duplicates", action="store_true",
+                        help="print the groups of original files with identical contents and exit")
+    parser.add_argument("--quiet", action="store_true", help="only print errors and the summary")
+    parser.add_argument("--config-dir", default=engine.CONFIG_DIR, help=argparse.SUPPRESS)
+    return parser
+
+
+def error_text(error):
+    if error.key == "map_line":
+        return f"Mapping line {error.params[0]} has no tab separator"
+    if error.key.startswith("rule_"):
+        return f"Rule line {error.params[0]}: " + RULE_ERROR_TEXTS[error.key].format(*error.params[1:])
+    return ERROR_TEXTS.get(error.key, error.key).format(*error.params)
+
+
+def problem_texts(problems):
+    texts = []
+    if problems.chars:
+        texts.append(f"Invalid characters in new names: {' '.join(sorted(problems.chars))}")
+    for found, what in ((problems.too_long, "longer than 255 bytes"),
+                        (problems.reserved, "reserved by Windows (CON, NUL, COM1...)"),
+                        (problems.trailing, "ending with a dot or a space")):
+        if found:
+            texts.append(f"New names {what} on mapping lines: {', '.join(str(i + 1) for i in found)}")
+    return texts
+
+
+def run_duplicates(args, log):
+    origs, _ = read_mapping(args.map, originals_only=True)
+    engine.check_folder(args.folder, args.config_dir)
+    cache = engine.DigestCache.open(args.config_dir)
+    groups = cache.duplicates(args.folder, origs)
+    cache.save()
+    for group in groups:
+        log("\t".join(origs[i] for i in group))
+    log(f"{len(groups)} groups of identical files.", summary=True)
+    return EXIT_OK
+
+
+def run_rename(args, log):
+    if args.duplicates:
+        return run_duplicates(args, log)
+    origs, news = read_mapping(args.map, originals_only=bool(args.rules))
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            pipeline = engine.RulePipeline(f.read())
+        metadata = None
+        if pipeline.fields:
+            engine.check_folder(args.folder, args.config_dir)
+            cache = engine.MetadataCache.open(args.config_dir)
+            metadata = cache.lookup(args.folder, origs, fields=pipeline.fields)
+            cache.save()
+        news = pipeline.apply(origs, metadata)
+    platforms = {p.strip() for p in args.platforms.split(",") if p.strip()}
+    unknown = platforms - set(PLATFORMS)
+    if unknown:
+        log(f"Unknown platform(s): {', '.join(sorted(unknown))}", error=True)
+        return EXIT_INVALID
+    sanitizer = engine.sanitizer_for(**{p: p in platforms for p in PLATFORMS})
+
+    # Absolute, so the history can be undone or resumed from any directory
+    folder = os.path.abspath(args.folder)
+    validation = engine.validate(folder, origs, news, sanitizer, args.config_dir, args.recursive)
+    origs, news = validation.origs, validation.news
+    if validation.illegal:
+        if args.on_illegal != "strip":
+            for text in problem_texts(validation.illegal):
+                log(text, error=True)
+            return EXIT_INVALID
+        news = sanitizer.clean(news, args.recursive)
+        validation.conflicts = engine.find_conflicts(origs, news, validation.snapshot)
+    if validation.conflicts:
+        if args.on_conflict != "suffix":
+            lines = ", ".join(str(i + 1) for i in validation.conflicts)
+            log(f"Names already exist in the folder or are duplicated on mapping lines: {lines}", error=True)
+            return EXIT_INVALID
+        news = engine.resolve_conflicts(origs, news, validation.conflicts, validation.snapshot)
+
+    steps = engine.plan(origs, news)
+    if args.dry_run:
+        for s, d, _, _ in steps:
+            log(f"{s}\t{d}")
+        return EXIT_OK
+
+    store = engine.HistoryStore.open(args.config_dir)
+    batch = store.begin(folder, steps, args.recursive)
+    workers = args.workers if args.recursive else 1
+    events = engine.execute(folder, steps, validation.snapshot, store.journal_path(batch), workers=workers)
+    return run_batch(store, batch, events, log)
+
+
+def run_resume(args, log):
+    store = engine.HistoryStore.open(args.config_dir)
+    batches = store.interrupted()
+    plan = store.claim(batches[-1]) if batches else None
+    if plan is None:
+        log("Nothing to resume.", summary=True)
+        return EXIT_OK
+    batch = batches[-1]
+    folder, steps = batch["folder"], plan["steps"]
+    check = engine.check_resume(folder, plan, store.journal_path(batch), args.config_dir)
+    for (_, _, o, n), reason in check.inconsistent:
+        log(f"❌ {o} → {n}: {RESUME_TEXTS[reason]}", error=True)
+    log(f"Resuming the batch in {folder}: {check.done} of {len(steps)} steps done, "
+        f"{len(check.steps)} pending, {len(check.inconsistent)} inconsistent.")
+    workers = args.workers if plan["recursive"] else 1
+    events = engine.execute(folder, check.steps, check.snapshot, store.journal_path(batch), workers=workers,
+                            resume=check)
+    return run_batch(store, batch, events, log, check.journaled)
+
+
+def run_batch(store, batch, events, log, entries=0):
+    """Logs the events of a running batch, then records it in the history (entries: already journaled)."""
+    renamed = failed = 0
+    for status, o, n, detail in events:
+        if status in ("renamed", "step", "recovered"):
+            entries += 1
+        if status == "renamed":
+            renamed += 1
+            log(f"✅ {o} → {n}")
+        elif status == "missing":
+            failed += 1
+            log(f"❌ Not found or not a file: {o}", error=True)
+        elif status == "error":
+            failed += 1
+            log(f"⚠️ Error renaming {o}: {detail}", error=True)
+    store.finish(batch, entries)
+    log(f"{renamed} renamed, {failed} failed.", summary=True)
+    return EXIT_FAILED_ENTRIES if failed else EXIT_OK
+
+
+def run_undo(args, log):
+    store = engine.HistoryStore.open(args.config_dir)
+    batch = store.top()
+    if batch and store.running(batch):
+        log("The newest batch is still running in another process; undo it once it has finished.", error=True)
+        return EXIT_INVALID
+    history = store.load(batch) if batch else []
+    if not history:
+        if batch:
+            store.pop(batch)
+        log("Nothing to undo.", summary=True)
+        return EXIT_OK
+    drifted = engine.find_drift(history)
+    if drifted:
+        for path, reason in drifted:
+            log(f"❌ {path}: {DRIFT_TEXTS[reason]}", error=True)
+        log(f"The last rename cannot be undone because {len(drifted)} of the renamed files were moved, replaced or modified since then.", error=True)
+        return EXIT_INVALID
+    undone = failed = 0
+    for status, dst, src, error in engine.undo(history, args.workers):
+        if status == "undone":
+            undone += 1
+            log(f"↩️ {os.path.basename(dst)} → {os.path.basename(src)}")
+        else:
+            failed += 1
+            log(f"⚠️ Error undoing {dst}: {error}", error=True)
+    store.pop(batch)
+    log(f"{undone} undone, {failed} failed. Batches left to undo: {len(store.batches)}.", summary=True)
+    return EXIT_FAILED_ENTRIES if failed else EXIT_OK
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if args.undo + args.resume + bool(args.folder or args.map) != 1:
+        parser.error("use either --undo, --resume, or --folder with --map")
+    if (args.folder or args.map) and not (args.folder and args.map):
+        parser.error("--folder and --map are both required to rename")
+
+    def log(line, error=False, summary=False):
+        if error:
+            print(line, file=sys.stderr)
+        elif summary or not args.quiet:
+            print(line)
+
+    os.makedirs(args.config_dir, exist_ok=True)
+    try:
+        if args.undo:
+            return run_undo(args, log)
+        return run_resume(args, log) if args.resume else run_rename(args, log)
+    except engine.EngineError as e:
+        log(error_text(e), error=True)
+        return EXIT_INVALID
+    except OSError as e:
+        log(str(e), error=True)
+        return EXIT_INVALID
+
+
+if __name__ == '__main__':
+    # A frozen build starts its metadata reader processes with this same executable
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
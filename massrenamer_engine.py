@@ -0,0 +1,2483 @@
+# Copyright 2025 Jedielson da Fonseca
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# Author: Jedielson da Fonseca jdfn7@proton.me
+
+"""Rename engine of Mass Renamer.
+
+Everything that touches the files lives here: validation, conflict handling,
+planning, execution, history and undo. It only uses the standard library, so
+the command line (massrenamer_cli.py) can run a batch without loading Qt; the
+window in massrenamer.py is just another client of this module.
+"""
+
+import os
+import re
+import gc
+import json
+import errno
+import fcntl
+import time
+import stat
+import shlex
+import locale
+import string
+import struct
+import datetime
+import unicodedata
+import queue
+import threading
+import itertools
+import functools
+import contextlib
+import ctypes
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+# Imported where they are used, as few runs need them and they would add a
+# third to the import time of the window and the command line: hashlib
+# (content hashes), multiprocessing (metadata reader processes), cProfile,
+# pstats and tracemalloc (profiling)
+
+# --- Character sets for different OS ---
+# Based on common restrictions. Note that filesystems (like FAT32) can add more.
+ILLEGAL_CHARS_LINUX = set('/')
+ILLEGAL_CHARS_WINDOWS = set('/\\:*?"<>|')
+ILLEGAL_CHARS_MACOS = set('/:')
+ILLEGAL_CHARS_IOS = set('/:') # Similar to macOS
+# Android often uses Windows-like filesystems (FAT32, exFAT) for external storage (SD cards),
+# so it's safest to block the same characters as Windows for broad compatibility.
+ILLEGAL_CHARS_ANDROID = set('/\\:*?"<>|')
+# Longest name, in bytes of UTF-8, on Linux filesystems (and NTFS/exFAT in UTF-16 units, which is never less)
+NAME_MAX = 255
+# Device names Windows refuses as a file name, with any extension and in any case (a regex alternation)
+WINDOWS_RESERVED_NAMES = "CON|PRN|AUX|NUL|COM[1-9]|LPT[1-9]"
+
+# --- Files ---
+CONFIG_DIR = os.path.expanduser("~/.config/MassRenamer")
+HISTORY_FILE_NAME = "mass_renamer.history" # single-batch history of older versions
+HISTORY_DIR_NAME = "history"
+
+
+class EngineError(Exception):
+    """A batch cannot go on.
+
+    key is an entry of the GUI translation table (LANG_TEXTS) and args are
+    the values for its placeholders, so each client can word the message.
+    """
+    def __init__(self, key, *args):
+        super().__init__(key, *args)
+        self.key = key
+        self.params = args
+
+# --- Timing and Profiling ---
+class PhaseTimer:
+    """Wall-clock time spent in each phase of a batch. Safe to share between threads."""
+    def __init__(self):
+        self.phases = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._excluded = 0.0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start, excluded = time.perf_counter(), self._excluded
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start - (self._excluded - excluded))
+
+    @contextlib.contextmanager
+    def excluded(self):
+        """Leaves the time spent here (waiting for the user) out of the enclosing phase and the total."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._excluded += time.perf_counter() - start
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def summary(self):
+        """One "name: seconds" line per phase, then the total wall time."""
+        total = time.perf_counter() - self._started - self._excluded
+        return [f"{name}: {seconds:.3f} s" for name, seconds in self.phases.items()] + [f"total: {total:.3f} s"]
+
+# Opt-in profiling of a batch: "cprofile", "tracemalloc" or both, comma-separated ("all" for both).
+PROFILE_ENV = "MASSRENAMER_PROFILE"
+
+class BatchProfiler:
+    """Runs a batch under cProfile and/or tracemalloc when $MASSRENAMER_PROFILE asks for it.
+
+    Results go to out_dir as <name>.prof (pstats), <name>.prof.txt and <name>.tracemalloc.txt.
+    """
+    def __init__(self, name, out_dir, spec=None):
+        spec = os.environ.get(PROFILE_ENV, "") if spec is None else spec
+        kinds = {k.strip().lower() for k in spec.split(",") if k.strip()}
+        if kinds & {"1", "all", "yes", "true"}:
+            kinds = {"cprofile", "tracemalloc"}
+        self.name = name
+        self.out_dir = out_dir
+        self.use_cprofile = "cprofile" in kinds
+        self.use_tracemalloc = "tracemalloc" in kinds
+        self._profiles = []
+        self._main = None
+
+    @property
+    def enabled(self):
+        return self.use_cprofile or self.use_tracemalloc
+
+    def start(self):
+        """Starts tracing memory and profiling the calling thread."""
+        if self.use_tracemalloc:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        if self.use_cprofile:
+            self._main = self._new_profile()
+            self._main.enable()
+
+    @contextlib.contextmanager
+    def thread(self):
+        """Profiles the code run in the block; cProfile only sees the thread that enables it."""
+        if not self.use_cprofile:
+            yield
+            return
+        profile = self._new_profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def _new_profile(self):
+        import cProfile
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        return profile
+
+    def stop(self):
+        """Stops profiling and writes the results. Returns the paths written."""
+        paths = []
+        if self._main is not None:
+            self._main.disable()
+            self._main = None
+        if self.use_cprofile and self._profiles:
+            import pstats
+            path = os.path.join(self.out_dir, f"{self.name}.prof")
+            stats = pstats.Stats(*self._profiles)
+            stats.dump_stats(path)
+            with open(f"{path}.txt", "w", encoding="utf-8") as f:
+                pstats.Stats(path, stream=f).sort_stats("cumulative").print_stats(60)
+            paths += [path, f"{path}.txt"]
+            self._profiles = []
+        if self.use_tracemalloc:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                path = os.path.join(self.out_dir, f"{self.name}.tracemalloc.txt")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(f"current: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n")
+                    for top in snapshot.statistics("lineno")[:40]:
+                        f.write(f"{top}\n")
+                paths.append(path)
+        return paths
+
+# --- Rename Journal ---
+# The history file is an append-only journal: one JSON record [dst, src] per line.
+# Records are buffered and committed (flushed + fsync'ed) in groups, so a crash
+# can lose at most HISTORY_COMMIT_INTERVAL records or HISTORY_COMMIT_SECONDS
+# worth of records, whichever comes first. Files renamed in that window are not
+# lost, they just can't be undone automatically (they are still listed in rename.log).
+HISTORY_COMMIT_INTERVAL = 256
+HISTORY_COMMIT_SECONDS = 1.0
+
+class RenameJournal:
+    """Append-only, group-committed journal of completed renames. Safe to share between threads."""
+    def __init__(self, path, commit_interval=HISTORY_COMMIT_INTERVAL, commit_seconds=HISTORY_COMMIT_SECONDS):
+        self.path = path
+        self.commit_interval = max(1, int(commit_interval))
+        self.commit_seconds = commit_seconds
+        self._file = None
+        self._pending = 0
+        self._last_commit = 0.0
+        self._lock = threading.Lock()
+
+    def open(self, keep=0):
+        """Starts a new journal, discarding any previous one, or continues it after its first keep bytes.
+
+        keep is the length of the complete records of an interrupted run (see
+        read_complete()); a torn record after them is cut off.
+        """
+        if keep:
+            self._file = open(self.path, "a", encoding="utf-8", buffering=1024 * 1024)
+            self._file.truncate(keep)
+        else:
+            self._file = open(self.path, "w", encoding="utf-8", buffering=1024 * 1024)
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        return self
+
+    def append(self, dst, src, fingerprint=None):
+        record = json.dumps([dst, src] if fingerprint is None else [dst, src, fingerprint], ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(record)
+            self._pending += 1
+            if self._pending >= self.commit_interval or time.monotonic() - self._last_commit >= self.commit_seconds:
+                self._commit()
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if self._file is None or not self._pending:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def read(path):
+        """Returns the journal as a list of (dst, src, fingerprint) entries.
+
+        A torn last line (crash during a write) is ignored. The old history
+        formats (a single JSON list of pairs, entries without a fingerprint)
+        are still accepted, with None as the fingerprint.
+        """
+        history = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record and isinstance(record[0], list):
+                    history.extend(_history_entry(r) for r in record)
+                else:
+                    history.append(_history_entry(record))
+        return history
+
+    @staticmethod
+    def read_complete(path):
+        """Returns (history, length): the entries of the complete records and their size in bytes.
+
+        Reading stops at the first record that is torn or not newline-terminated,
+        so a journal continued after length bytes stays readable.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        length = data.rfind(b"\n") + 1
+        try:
+            # Records never hold a raw newline, so the complete ones parse as one array
+            records = json.loads(b"[" + data[:length - 1].replace(b"\n", b",") + b"]") if length else []
+            return [_history_entry(r) for r in records], length
+        except ValueError:
+            pass
+        history, length = [], 0
+        for line in data.split(b"\n")[:-1]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            history.append(_history_entry(record))
+            length += len(line) + 1
+        return history, length
+
+def _history_entry(record):
+    dst, src = record[0], record[1]
+    return dst, src, record[2] if len(record) > 2 else None
+
+def fingerprint(st):
+    """[dev, inode, size, mtime_ns] of a renamed entry, from its stat result.
+
+    Adding or renaming files inside a directory changes its size and mtime, so
+    a directory is only identified by device and inode.
+    """
+    if stat.S_ISDIR(st.st_mode):
+        return [st.st_dev, st.st_ino, None, None]
+    return [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+
+# --- History Store ---
+# Past batches are kept until the store holds more than HISTORY_MAX_BYTES or a
+# batch is older than HISTORY_MAX_AGE_DAYS; the oldest go first, the newest
+# batch is always kept.
+HISTORY_MAX_BYTES = 256 * 1024 * 1024
+HISTORY_MAX_AGE_DAYS = 90
+
+class HistoryStore:
+    """Stack of past batches, undone newest first.
+
+    Each batch is a RenameJournal file in the store directory; a small JSON
+    index lists them (id, folder, time, entries, bytes) oldest first. Opening
+    the store only reads the index: a journal is read when its batch is undone.
+    The index is re-read before every change, so the window and the command
+    line can share the store; every read-modify-write of the index holds an
+    flock on index.lock, so two processes never drop each other's change.
+
+    A batch also saves its plan until it finishes, locked (flock) by the
+    process running it. A plan left unlocked with no entry count is a batch
+    that was interrupted, and can be resumed from it; a locked one is still
+    running elsewhere, and is neither undone nor popped.
+    """
+    INDEX_NAME = "index.json"
+    LOCK_NAME = "index.lock"
+
+    def __init__(self, directory, max_bytes=HISTORY_MAX_BYTES, max_age_days=HISTORY_MAX_AGE_DAYS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(directory, exist_ok=True)
+        self.batches = self._read_index()
+        # Locked plan files of the batches this process runs, by batch id
+        self._plans = {}
+        # Held index.lock and how many nested changes hold it (finish() evicts, for one)
+        self._index_lock = None
+        self._lock_depth = 0
+        self._import_legacy()
+
+    @classmethod
+    def open(cls, config_dir=CONFIG_DIR, **limits):
+        return cls(os.path.join(config_dir, HISTORY_DIR_NAME), **limits)
+
+    def journal_path(self, batch):
+        return os.path.join(self.directory, f"{batch['id']}.history")
+
+    def plan_path(self, batch):
+        return os.path.join(self.directory, f"{batch['id']}.plan")
+
+    def refresh(self):
+        self.batches = self._read_index()
+        return self.batches
+
+    def top(self):
+        """The batch the next undo reverts, or None."""
+        return self.batches[-1] if self.batches else None
+
+    def begin(self, folder, steps=None, recursive=False):
+        """Registers a new batch before it runs, so a crash still leaves it undoable.
+
+        With its steps, the plan is saved first, so a crash also leaves it
+        resumable; it is read back by claim() as {"recursive", "steps", "starts"}
+        (see cycle_starts()).
+        """
+        batch = {"id": f"{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(3).hex()}",
+                 "folder": folder, "time": time.time(), "entries": None, "bytes": 0}
+        if steps is not None:
+            f = open(self.plan_path(batch), "w", encoding="utf-8")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            plan = {"recursive": recursive, "steps": steps, "starts": cycle_starts(folder, steps)}
+            f.write(json.dumps(plan, ensure_ascii=False))
+            f.flush()
+            os.fsync(f.fileno())
+            self._plans[batch["id"]] = f
+        with self._locked():
+            self.refresh()
+            self.batches.append(batch)
+            self._write_index()
+        return batch
+
+    def finish(self, batch, entries):
+        """Records the size of a completed batch (dropped if it renamed nothing) and evicts old ones."""
+        with self._locked():
+            # Unlocked with the index held, so no other process sees it neither running nor finished
+            self._release(batch["id"])
+            self.refresh()
+            if not entries:
+                self._remove(batch["id"])
+            else:
+                for b in self.batches:
+                    if b["id"] == batch["id"]:
+                        b["entries"] = entries
+                        b["bytes"] = _file_size(self.journal_path(b))
+            self.evict()
+
+    def load(self, batch):
+        """The (dst, src, fingerprint) entries of a batch."""
+        return load_history(self.journal_path(batch))
+
+    def interrupted(self):
+        """The batches whose run stopped before finishing (the app or the machine died), oldest first."""
+        found = []
+        for batch in self.refresh():
+            if batch["entries"] is not None or batch["id"] in self._plans:
+                continue
+            try:
+                with open(self.plan_path(batch), "rb") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # No plan (older versions), or another process is running it
+                continue
+            found.append(batch)
+        return found
+
+    def claim(self, batch):
+        """Locks the plan of an interrupted batch to resume it, and returns it (see begin()).
+
+        Returns None if another process holds it or it cannot be read. finish()
+        releases it like the plan of a new batch.
+        """
+        try:
+            f = open(self.plan_path(batch), "r", encoding="utf-8")
+        except OSError:
+            return None
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            plan = json.loads(f.read())
+        except (OSError, ValueError):
+            f.close()
+            return None
+        self._plans[batch["id"]] = f
+        return plan
+
+    def running(self, batch):
+        """True if another process is still running the batch (or resuming it): it holds its plan locked."""
+        if batch["id"] in self._plans:
+            return False
+        try:
+            with open(self.plan_path(batch), "rb") as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def pop(self, batch):
+        """Forgets a batch once it has been undone. Returns False, keeping it, while another process runs it."""
+        with self._locked():
+            if self.running(batch):
+                return False
+            self.refresh()
+            self._remove(batch["id"])
+            self._write_index()
+        return True
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        oldest = now - self.max_age_days * 86400
+        with self._locked():
+            total = sum(b["bytes"] for b in self.batches)
+            while len(self.batches) > 1 and (self.batches[0]["time"] < oldest or total > self.max_bytes):
+                total -= self.batches[0]["bytes"]
+                self._remove(self.batches[0]["id"])
+            self._write_index()
+
+    def _remove(self, batch_id):
+        for b in [b for b in self.batches if b["id"] == batch_id]:
+            self.batches.remove(b)
+            clear_history(self.journal_path(b))
+            self._release(batch_id)
+            clear_history(self.plan_path(b))
+
+    def _release(self, batch_id):
+        """Deletes the plan of a batch this process ran, then unlocks it."""
+        f = self._plans.pop(batch_id, None)
+        if f is not None:
+            clear_history(f.name)
+            f.close()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds index.lock while the index is re-read, changed and written back."""
+        if not self._lock_depth:
+            f = open(os.path.join(self.directory, self.LOCK_NAME), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            except OSError:
+                f.close()
+                raise
+            self._index_lock = f
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if not self._lock_depth:
+                # Closing the file releases the lock
+                self._index_lock.close()
+                self._index_lock = None
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, self.INDEX_NAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _write_index(self):
+        # Written aside and renamed over the old index, so it is never half written
+        path = os.path.join(self.directory, self.INDEX_NAME)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.batches, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def _import_legacy(self):
+        """Moves the single-batch history of older versions to the top of the store."""
+        legacy = os.path.join(os.path.dirname(self.directory), HISTORY_FILE_NAME)
+        if not os.path.exists(legacy):
+            return
+        with self._locked():
+            # Read under the lock: another process may have imported it meanwhile
+            history = load_history(legacy)
+            if not history:
+                return
+            batch = {"id": f"legacy-{os.urandom(3).hex()}", "folder": os.path.dirname(history[0][1]),
+                     "time": os.path.getmtime(legacy), "entries": len(history), "bytes": _file_size(legacy)}
+            os.replace(legacy, self.journal_path(batch))
+            self.refresh()
+            self.batches.append(batch)
+            self._write_index()
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+# --- Folder Snapshot ---
+class FolderSnapshot:
+    """Names in a folder, read with a single os.scandir pass.
+
+    Every preflight check of a batch (missing sources, existing targets, free
+    "_(n)" suffixes) is a set lookup here instead of one stat call per name.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.names = set()
+        self.files = set()
+        self.dirs = set()
+        self._next_suffix = {}
+        self._scan("")
+        # Only regular files are renamed in a single folder batch
+        self.renamable = self.files
+
+    def _scan(self, reldir):
+        prefix = reldir + os.sep if reldir else ""
+        with os.scandir(os.path.join(self.folder, reldir)) as it:
+            for entry in it:
+                name = prefix + entry.name
+                self.names.add(name)
+                try:
+                    # Uses d_type, so only symlinks cost an extra stat
+                    if entry.is_file():
+                        self.files.add(name)
+                    elif entry.is_dir(follow_symlinks=False):
+                        self.dirs.add(name)
+                except OSError:
+                    pass
+
+    def free_suffixed_name(self, name, taken):
+        """Returns the first "base_(n).ext" that is neither in the folder nor in taken."""
+        base, ext = os.path.splitext(name)
+        count = self._next_suffix.get((base, ext), 1)
+        while True:
+            candidate = f"{base}_({count}){ext}"
+            count += 1
+            if candidate not in self.names and candidate not in taken:
+                # Later conflicts on the same stem resume from here
+                self._next_suffix[(base, ext)] = count
+                return candidate
+
+class TreeSnapshot(FolderSnapshot):
+    """FolderSnapshot of the directories a recursive batch touches.
+
+    Names are paths relative to folder, and directories can be renamed too.
+    With missing_ok, directories that no longer exist are left out.
+    """
+    def __init__(self, folder, reldirs, missing_ok=False):
+        self.folder = folder
+        self.names = set()
+        self.files = set()
+        self.dirs = set()
+        self._next_suffix = {}
+        for reldir in reldirs:
+            try:
+                self._scan(reldir)
+            except FileNotFoundError:
+                if not missing_ok:
+                    raise
+        self.renamable = self.files | self.dirs
+
+# --- Folder Watching ---
+# inotify(7) flags: names appearing in and leaving the watched folder, and
+# the events after which it can no longer be followed
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR
+_WATCH_LOST = _IN_Q_OVERFLOW | _IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF
+# struct inotify_event without its name: wd, mask, cookie, len
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    init.argtypes = [ctypes.c_int]
+    init.restype = ctypes.c_int
+    add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    add_watch.restype = ctypes.c_int
+    return init, add_watch
+
+_inotify = _load_inotify()
+
+class FolderWatcher:
+    """Names appearing in and leaving a folder, from inotify (Linux only).
+
+    fileno() is readable while changes wait; read() takes them without
+    blocking. lost turns True when the kernel dropped events (its queue
+    overflowed) or the folder itself was moved or deleted: from then on
+    only a new listing tells what the folder holds.
+    """
+    def __init__(self, folder):
+        if _inotify is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        init, add_watch = _inotify
+        fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        if add_watch(fd, os.fsencode(folder), _WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(error, os.strerror(error), folder)
+        self.folder = folder
+        self.lost = False
+        self._fd = fd
+
+    def fileno(self):
+        return self._fd
+
+    def read(self):
+        """Changes waiting, oldest first: (name, is_dir) for a name that appeared, (name, None) for one that left."""
+        changes = []
+        while self._fd >= 0:
+            try:
+                data = os.read(self._fd, 1024 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, pos)
+                pos += _INOTIFY_EVENT.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+                pos += length
+                if mask & _WATCH_LOST:
+                    self.lost = True
+                elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                    changes.append((name, bool(mask & _IN_ISDIR)))
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    changes.append((name, None))
+        return changes
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+class FolderIndex(FolderSnapshot):
+    """FolderSnapshot kept current with FolderWatcher changes, so a folder that keeps changing is listed once."""
+    def apply(self, changes):
+        """Takes (name, is_dir) changes as read() returns them. Returns the names (added, removed)."""
+        was_present = {}
+        for name, is_dir in changes:
+            if name not in was_present:
+                was_present[name] = name in self.names
+            if is_dir is None:
+                self.names.discard(name)
+                self.files.discard(name)
+                self.dirs.discard(name)
+            else:
+                self.names.add(name)
+                (self.dirs if is_dir else self.files).add(name)
+                (self.files if is_dir else self.dirs).discard(name)
+        added = [name for name, was in was_present.items() if not was and name in self.names]
+        removed = [name for name, was in was_present.items() if was and name not in self.names]
+        return added, removed
+
+    def snapshot(self):
+        """A FolderSnapshot of the folder as it is now, for a batch."""
+        snapshot = FolderSnapshot.__new__(FolderSnapshot)
+        snapshot.folder = self.folder
+        snapshot.names, snapshot.files, snapshot.dirs = set(self.names), set(self.files), set(self.dirs)
+        snapshot._next_suffix = {}
+        snapshot.renamable = snapshot.files
+        return snapshot
+
+# --- Rename Planner ---
+def plan_renames(origs, news):
+    """Orders a batch so that no rename overwrites a file that is still waiting to be renamed.
+
+    Each file name is the source of at most one rename and the target of at most
+    one, so the batch is a set of disjoint chains and cycles. Chains are run from
+    their free end (a→b, b→c runs b→c first). Each cycle (swaps, rotations) is
+    broken with a single temporary name: a→b, b→c, c→a becomes a→tmp, c→a, b→c, tmp→b.
+
+    Returns a list of steps (src, dst, orig, new), where orig/new is the pair the
+    user asked for and dst differs from new only for the move to a temporary name.
+    Identity renames are dropped; repeated sources are kept at the end, unordered.
+    """
+    by_src, dst_to_src, extra = {}, {}, []
+    for o, n in zip(origs, news):
+        if o == n:
+            continue
+        if o in by_src:
+            extra.append((o, n, o, n))
+            continue
+        by_src[o] = n
+        dst_to_src[n] = o
+
+    steps = []
+    done = set()
+
+    def walk_back(name):
+        # Emits the renames that target `name`, then the ones that target their sources, etc.
+        while name in dst_to_src and dst_to_src[name] not in done:
+            src = dst_to_src[name]
+            done.add(src)
+            steps.append((src, name, src, name))
+            name = src
+
+    # Chains: start from renames whose target is not the source of another rename
+    for o, n in by_src.items():
+        if n not in by_src:
+            walk_back(n)
+
+    # Whatever is left are pure cycles
+    tmp_prefix = f".massrenamer-{os.urandom(6).hex()}-"
+    for o, n in by_src.items():
+        if o in done:
+            continue
+        # In a recursive batch the temporary name stays in the cycle's directory
+        tmp = os.path.join(os.path.dirname(o), f"{tmp_prefix}{len(steps)}")
+        done.add(o)
+        steps.append((o, tmp, o, n))
+        walk_back(o)
+        steps.append((tmp, n, o, n))
+
+    steps.extend(extra)
+    return steps
+
+# --- Safe Renames ---
+# renameat2(2) refuses to replace an existing target when given RENAME_NOREPLACE,
+# closing the window between "the target is free" and the rename itself.
+# Where it is missing (old kernel or libc) or not supported by the filesystem,
+# link + unlink gives the same guarantee; filesystems without hard links (FAT,
+# exFAT) and directories fall back to a check right before a plain rename.
+RENAME_NOREPLACE = 1
+
+def _load_renameat2():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return None
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    renameat2.restype = ctypes.c_int
+    return renameat2
+
+_renameat2 = _load_renameat2()
+
+def rename_noreplace(src_dir_fd, src, dst_dir_fd, dst):
+    """Renames src to dst (names relative to the directory fds) without ever replacing dst.
+
+    Raises FileExistsError if dst exists.
+    """
+    global _renameat2
+    if _renameat2 is not None:
+        if _renameat2(src_dir_fd, os.fsencode(src), dst_dir_fd, os.fsencode(dst), RENAME_NOREPLACE) == 0:
+            return
+        err = ctypes.get_errno()
+        if err == errno.ENOSYS:
+            _renameat2 = None
+        elif err != errno.EINVAL:
+            raise OSError(err, os.strerror(err), dst)
+    try:
+        os.link(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd, follow_symlinks=False)
+    except FileExistsError:
+        raise
+    except OSError:
+        # No hard links here (or src is a directory)
+        try:
+            os.stat(dst, dir_fd=dst_dir_fd, follow_symlinks=False)
+        except FileNotFoundError:
+            os.rename(src, dst, src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+            return
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    os.unlink(src, dir_fd=src_dir_fd)
+
+class DirectoryFds:
+    """Directory file descriptors opened once per directory and reused for every rename in it."""
+    def __init__(self, base=None):
+        self.base = base
+        self._fds = {}
+
+    def get(self, directory):
+        fd = self._fds.get(directory)
+        if fd is None:
+            path = os.path.join(self.base, directory) if self.base else directory
+            fd = self._fds[directory] = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        return fd
+
+    def rename(self, src, dst):
+        """Renames src to dst (paths relative to base) without replacing dst."""
+        src_dir, src_name = os.path.split(src)
+        dst_dir, dst_name = os.path.split(dst)
+        rename_noreplace(self.get(src_dir), src_name, self.get(dst_dir), dst_name)
+
+    def stat(self, path):
+        directory, name = os.path.split(path)
+        return os.stat(name, dir_fd=self.get(directory), follow_symlinks=False)
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# --- Validation ---
+def parse_names(text):
+    """One name per line; blank lines are ignored and surrounding spaces stripped."""
+    return [l.strip() for l in text.splitlines() if l.strip()]
+
+def illegal_chars_for(windows=True, macos=True, ios=True, android=True):
+    """Characters to refuse in new names, given the systems the files must work on."""
+    illegal_chars = ILLEGAL_CHARS_LINUX.copy() # Base for all
+    if windows: illegal_chars.update(ILLEGAL_CHARS_WINDOWS)
+    if macos: illegal_chars.update(ILLEGAL_CHARS_MACOS)
+    if ios: illegal_chars.update(ILLEGAL_CHARS_IOS)
+    if android: illegal_chars.update(ILLEGAL_CHARS_ANDROID)
+    return illegal_chars
+
+def check_folder(folder, config_dir=CONFIG_DIR):
+    """Raises EngineError unless folder is a directory the batch may run in."""
+    if not folder or not os.path.isdir(folder):
+        raise EngineError("select_valid_folder")
+    # The configuration directory holds the history and the logs
+    if os.path.normpath(config_dir) == os.path.normpath(folder):
+        raise EngineError("forbidden_dir_msg")
+
+def check_mapping(origs, news):
+    if len(origs) != len(news):
+        raise EngineError("map_error_msg", len(origs), len(news))
+
+def find_illegal_chars(news, illegal_chars, recursive=False):
+    return Sanitizer(illegal_chars, windows_rules=False).check(news, recursive).chars
+
+def strip_illegal_chars(news, illegal_chars, recursive=False):
+    return Sanitizer(illegal_chars, windows_rules=False).strip(news, recursive)
+
+# --- Name Sanitizer ---
+class NameProblems:
+    """What Sanitizer.check() found: the refused characters, and the indices of the names breaking each rule."""
+    def __init__(self, chars=(), too_long=(), reserved=(), trailing=()):
+        self.chars = set(chars)
+        self.too_long = list(too_long)
+        self.reserved = list(reserved)
+        self.trailing = list(trailing)
+
+    def __bool__(self):
+        return bool(self.chars or self.too_long or self.reserved or self.trailing)
+
+class Sanitizer:
+    """Checks and cleans new names.
+
+    Names are refused for a character of illegal_chars or for being longer than
+    NAME_MAX bytes; with windows_rules, also for a reserved device name (CON,
+    NUL, COM1...) or a trailing dot or space. Everything is compiled once (see
+    sanitizer_for()) and a list is handled as one joined string: a str.translate
+    table and a few C-level searches replace a Python loop per character, and
+    only the names that break a rule are looked at one by one.
+    """
+    def __init__(self, illegal_chars, windows_rules=True):
+        self.illegal_chars = frozenset(illegal_chars)
+        self.windows_rules = windows_rules
+        self._table = str.maketrans("", "", "".join(sorted(self.illegal_chars)))
+        # Names are matched between newlines of the joined list
+        self._reserved = re.compile(r"\n(?:%s)(?=[.\n])" % WINDOWS_RESERVED_NAMES, re.IGNORECASE)
+
+    def check(self, names, recursive=False):
+        if recursive:
+            names = _basenames(names)
+        return self._check_joined("\n" + "\n".join(names) + "\n", names)
+
+    def _check_joined(self, joined, names):
+        # joined is names between newlines, ready for the searches
+        problems = NameProblems()
+        if len(joined.translate(self._table)) != len(joined):
+            problems.chars = {c for c in self.illegal_chars if c in joined}
+        # A character takes at most 4 bytes, and 1 in an ASCII-only list
+        longest = max(map(len, names), default=0)
+        if longest > NAME_MAX or (longest > NAME_MAX // 4 and not joined.isascii()):
+            problems.too_long = [i for i, n in enumerate(names) if _too_long(n)]
+        if self.windows_rules:
+            if self._reserved.search(joined):
+                problems.reserved = [i for i, n in enumerate(names) if self.is_reserved(n)]
+            if ".\n" in joined or " \n" in joined:
+                problems.trailing = [i for i, n in enumerate(names) if n[-1:] in (".", " ")]
+        return problems
+
+    def is_reserved(self, name):
+        return self._reserved.match(f"\n{name}\n") is not None
+
+    def is_valid(self, name, recursive=False):
+        """check() for a single name."""
+        if recursive:
+            name = os.path.basename(name)
+        if not self.illegal_chars.isdisjoint(name) or _too_long(name):
+            return False
+        return not (self.windows_rules and (name[-1:] in (".", " ") or self.is_reserved(name)))
+
+    def strip(self, names, recursive=False):
+        """Copy of names without the refused characters."""
+        if recursive:
+            return [os.path.join(os.path.dirname(n), b) for n, b in zip(names, self.strip(_basenames(names)))]
+        if not names:
+            return []
+        # Splitting a million names makes as many objects; the collector has nothing to find in them
+        with _gc_paused():
+            return "\n".join(names).translate(self._table).split("\n")
+
+    def clean(self, names, recursive=False):
+        """Copy of names that passes check().
+
+        Refused characters are removed, trailing dots and spaces dropped,
+        reserved names get a "_" after the device name (CON.txt -> CON_.txt)
+        and long names are cut to NAME_MAX bytes, keeping the extension.
+        """
+        if recursive:
+            return [os.path.join(os.path.dirname(n), b) for n, b in zip(names, self.clean(_basenames(names)))]
+        if not names:
+            return []
+        stripped = "\n".join(names).translate(self._table)
+        with _gc_paused():
+            cleaned = stripped.split("\n")
+        stripped = f"\n{stripped}\n"
+        problems = self._check_joined(stripped, cleaned)
+        fix = set(problems.too_long) | set(problems.reserved) | set(problems.trailing)
+        # Names made only of refused characters
+        if "\n\n" in stripped:
+            fix.update(i for i, n in enumerate(cleaned) if not n)
+        for i in fix:
+            cleaned[i] = self._fix(cleaned[i])
+        return cleaned
+
+    def _fix(self, name):
+        if not name:
+            return "_"
+        for _ in range(3):
+            if self.windows_rules:
+                name = name.rstrip(". ") or "_"
+                if self.is_reserved(name):
+                    stem, dot, ext = name.partition(".")
+                    name = f"{stem}_{dot}{ext}"
+            if _too_long(name):
+                stem, ext = os.path.splitext(name)
+                budget = NAME_MAX - len(ext.encode("utf-8"))
+                if budget < 1:
+                    stem, ext, budget = name, "", NAME_MAX
+                name = stem.encode("utf-8")[:budget].decode("utf-8", "ignore") + ext
+            elif not self.windows_rules or name[-1:] not in (".", " "):
+                break
+        return name
+
+@functools.lru_cache(maxsize=16)
+def sanitizer_for(windows=True, macos=True, ios=True, android=True):
+    """The Sanitizer of a combination of target systems, built once.
+
+    Android storage is often FAT32/exFAT, which has the Windows name rules.
+    """
+    return Sanitizer(illegal_chars_for(windows, macos, ios, android), windows_rules=windows or android)
+
+def _basenames(names):
+    # Recursive batches hold relative paths: only the last component is a new name
+    return [os.path.basename(n) for n in names]
+
+def _too_long(name):
+    return len(name) > NAME_MAX // 4 and len(name.encode("utf-8", "surrogatepass")) > NAME_MAX
+
+@contextlib.contextmanager
+def _gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def normalize_tree_mapping(folder, origs, news, config_dir=CONFIG_DIR):
+    """Turns a recursive mapping into paths relative to folder.
+
+    Original names are relative paths. A new name is either a bare name, which
+    is renamed in place, or a relative path in the same directory as the
+    original; anything else (moving, leaving the folder) raises EngineError.
+    """
+    config_dir = os.path.normpath(config_dir)
+    norm_origs, norm_news = [], []
+    for line, (o, n) in enumerate(zip(origs, news), 1):
+        o = os.path.normpath(o)
+        parent = os.path.dirname(o)
+        n = os.path.normpath(n) if os.sep in n else os.path.join(parent, n)
+        if os.path.isabs(o) or o.split(os.sep)[0] == os.pardir or os.path.dirname(n) != parent:
+            raise EngineError("map_dir_error", line)
+        path = os.path.join(folder, o)
+        if path == config_dir or path.startswith(config_dir + os.sep):
+            raise EngineError("forbidden_dir_msg")
+        norm_origs.append(o)
+        norm_news.append(n)
+    return norm_origs, norm_news
+
+def find_conflicts(origs, news, snapshot):
+    """Indices of new names that already exist in the folder or are duplicated in the list.
+
+    Names that are renamed away in the same batch are free targets (swaps, shifts).
+    """
+    sources = set(origs)
+    name_counts = Counter(news)
+    return [i for i, name in enumerate(news)
+            if name_counts[name] > 1 or (name in snapshot.names and name not in sources)]
+
+def resolve_conflicts(origs, news, conflicts, snapshot):
+    """Returns a copy of news where each conflicting name gets a free "_(n)" suffix."""
+    resolved = list(news)
+    # Check against both the folder and the rest of the list
+    taken = set(news) | set(origs)
+    for i in conflicts:
+        new_name = snapshot.free_suffixed_name(news[i], taken)
+        taken.add(new_name)
+        resolved[i] = new_name
+    return resolved
+
+class Validation:
+    """What validate() found: the snapshot, invalid new names (NameProblems) and conflicting lines.
+
+    origs/news are the names the batch must use (relative paths in a recursive batch).
+    """
+    def __init__(self, origs, news, snapshot, illegal, conflicts):
+        self.origs = origs
+        self.news = news
+        self.snapshot = snapshot
+        self.illegal = illegal
+        self.conflicts = conflicts
+
+    @property
+    def ok(self):
+        return not self.illegal and not self.conflicts
+
+def take_snapshot(folder, origs, recursive=False):
+    """One scan of what the batch touches: the folder, or each directory holding an original."""
+    try:
+        if recursive:
+            return TreeSnapshot(folder, {os.path.dirname(o) for o in origs})
+        return FolderSnapshot(folder)
+    except OSError as e:
+        raise EngineError("cannot_list", e)
+
+def validate(folder, origs, news, sanitizer=None, config_dir=CONFIG_DIR, recursive=False):
+    """Runs every preflight check of a batch.
+
+    Hard errors (bad folder, mapping mismatch, unreadable folder) raise
+    EngineError; invalid names and conflicts are reported in the result so
+    the caller can decide to clean/suffix them or to stop.
+    """
+    check_folder(folder, config_dir)
+    check_mapping(origs, news)
+    if recursive:
+        origs, news = normalize_tree_mapping(folder, origs, news, config_dir)
+    if sanitizer is None:
+        sanitizer = sanitizer_for()
+    snapshot = take_snapshot(folder, origs, recursive)
+    return Validation(origs, news, snapshot, sanitizer.check(news, recursive),
+                      find_conflicts(origs, news, snapshot))
+
+def plan(origs, news):
+    return plan_renames(origs, news)
+
+# --- Live Validation ---
+class LiveValidator:
+    """Problems of the two name lists, kept up to date line by line while they are edited.
+
+    lines holds the raw lines of each list (0: originals, 1: new names), blank
+    ones included, so an edit only re-checks the lines it touched. Per-name
+    counters tell whether a new name is duplicated or taken in the folder, and
+    the totals are adjusted as those counters change instead of recounted.
+    The rules are the ones of Sanitizer.check() and find_conflicts().
+    """
+    def __init__(self, sanitizer=None, existing=(), recursive=False):
+        self.lines = ([""], [""])
+        self.names = (0, 0)
+        self._counts = (Counter(), Counter())
+        self.sanitizer = sanitizer or Sanitizer((), windows_rules=False)
+        self.recursive = recursive
+        # Recursive batches hold relative paths; only the top folder's names are known
+        self.existing = set() if recursive else set(existing)
+        self.illegal_lines = 0
+        self.conflict_lines = 0
+
+    def replace(self, column, first, removed, lines):
+        """Replaces removed lines from line first of a column with lines."""
+        old = self.lines[column][first:first + removed]
+        self.lines[column][first:first + removed] = lines
+        for line in old:
+            self._count(column, line.strip(), -1)
+        for line in lines:
+            self._count(column, line.strip(), 1)
+
+    def _count(self, column, name, delta):
+        if not name:
+            return
+        self.names = (self.names[0] + delta, self.names[1]) if column == 0 else (self.names[0], self.names[1] + delta)
+        if column == 1 and self._has_illegal(name):
+            self.illegal_lines += delta
+        before = self._conflicts(name)
+        counts = self._counts[column]
+        counts[name] += delta
+        if not counts[name]:
+            del counts[name]
+        self.conflict_lines += self._conflicts(name) - before
+
+    def _has_illegal(self, name):
+        return not self.sanitizer.is_valid(name, self.recursive)
+
+    def _conflicts(self, name):
+        """How many new-name lines holding name find_conflicts() would report."""
+        count = self._counts[1][name]
+        if count > 1 or (count and name in self.existing and not self._counts[0][name]):
+            return count
+        return 0
+
+    def set_rules(self, sanitizer, recursive):
+        """Re-checks every new name when the name rules or the mode change."""
+        if self.in_sync(sanitizer, recursive):
+            return
+        self.sanitizer, self.recursive = sanitizer, recursive
+        self.illegal_lines = sum(count for name, count in self._counts[1].items() if self._has_illegal(name))
+        if recursive:
+            self.set_existing(())
+
+    def set_existing(self, names):
+        self.existing = set() if self.recursive else set(names)
+        self.conflict_lines = sum(self._conflicts(name) for name in self._counts[1])
+
+    def update_existing(self, added=(), removed=()):
+        """Takes names that appeared in or left the folder, re-checking only the new names equal to them."""
+        if self.recursive:
+            return
+        for names, present in ((removed, False), (added, True)):
+            for name in names:
+                if (name in self.existing) == present:
+                    continue
+                before = self._conflicts(name)
+                if present:
+                    self.existing.add(name)
+                else:
+                    self.existing.discard(name)
+                self.conflict_lines += self._conflicts(name) - before
+
+    def line_problem(self, line):
+        """True if new-name line number line is an invalid name or a conflict."""
+        lines = self.lines[1]
+        name = lines[line].strip() if line < len(lines) else ""
+        return bool(name) and (self._has_illegal(name) or self._conflicts(name) > 0)
+
+    def in_sync(self, sanitizer, recursive):
+        return sanitizer is self.sanitizer and recursive == self.recursive
+
+    @property
+    def mismatch(self):
+        return self.names[0] != self.names[1]
+
+# --- Rename Rules ---
+RULE_CASES = {"lower": str.lower, "upper": str.upper, "title": str.title,
+              "capitalize": str.capitalize, "swap": str.swapcase}
+# Letters that Unicode does not decompose into an ASCII letter and accents
+TRANSLITERATIONS = {"ß": "ss", "Æ": "AE", "æ": "ae", "Œ": "OE", "œ": "oe", "Ø": "O", "ø": "o",
+                    "Ł": "L", "ł": "l", "Đ": "D", "đ": "d", "Þ": "Th", "þ": "th", "ð": "d", "ı": "i"}
+
+class _Transliteration(dict):
+    """str.translate table filled one character at a time, the first time it is met."""
+    def __missing__(self, code):
+        char = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        self[code] = base or char
+        return self[code]
+
+_TRANSLITERATION = _Transliteration({ord(k): v for k, v in TRANSLITERATIONS.items()})
+
+class RulePipeline:
+    """New names computed from the originals by a list of rules.
+
+    The rules are written one per line; blank lines and lines starting with
+    "#" are skipped, and arguments with spaces are quoted ("a b"):
+
+        replace FIND REPLACEMENT [i]     plain text; i ignores case
+        regex PATTERN REPLACEMENT [i]    re.sub(), \\1 or \\g<name> in the replacement
+        insert POSITION TEXT             POSITION from 0, negative from the end, or "end"
+        remove POSITION COUNT
+        counter [START [STEP [WIDTH [POSITION]]]]   zero-padded, at the end by default
+        case lower|upper|title|capitalize|swap
+        transliterate                    é -> e, ß -> ss...
+        format TEMPLATE                  replaces the text with TEMPLATE, where {name} is the text
+                                         and {date:%Y-%m-%d}, {artist}... are tokens (METADATA_FIELDS)
+        scope stem|name                  later rules change the name without (default) or with its extension
+
+    The text is compiled once into a list of functions (regexes included), so
+    a name goes through the whole list in one call and a preview can compute
+    just the names it shows. In a recursive batch only the last component of
+    a path is changed. A bad line raises EngineError with its number, and so
+    does a name the rules leave empty (or with an extension only).
+
+    fields holds the tokens the rules use; when it is not empty, each name
+    needs its file's metadata (see MetadataCache.lookup()).
+    """
+    def __init__(self, text=""):
+        self.text = text
+        # (whole name, [function(text, index, metadata)]) for each run of rules with the same scope
+        self.groups = []
+        self.fields = set()
+        whole = False
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                lexer = shlex.shlex(line, posix=True)
+                lexer.whitespace_split = True
+                lexer.commenters = ""
+                # Backslashes belong to the regexes
+                lexer.escape = ""
+                name, *args = list(lexer)
+            except ValueError:
+                raise EngineError("rule_syntax", number)
+            if name == "scope":
+                if args not in (["stem"], ["name"]):
+                    raise EngineError("rule_syntax", number)
+                whole = args == ["name"]
+                continue
+            compile_rule = _RULES.get(name)
+            if compile_rule is None:
+                raise EngineError("rule_unknown", number, name)
+            try:
+                if name == "format":
+                    func = _rule_format(number, self.fields, *args)
+                else:
+                    func = compile_rule(*args)
+            except re.error as e:
+                raise EngineError("rule_regex", number, str(e))
+            except (TypeError, ValueError, KeyError, IndexError):
+                raise EngineError("rule_syntax", number)
+            if not self.groups or self.groups[-1][0] != whole:
+                self.groups.append((whole, []))
+            self.groups[-1][1].append(func)
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def __call__(self, name, index=0, metadata=None):
+        """New name of the original name on line index (counted from 0), with its file's metadata."""
+        folder, sep, base = name.rpartition("/")
+        for whole, funcs in self.groups:
+            if whole:
+                for func in funcs:
+                    base = func(base, index, metadata)
+                stem = base
+            else:
+                stem, ext = _split_ext(base)
+                for func in funcs:
+                    stem = func(stem, index, metadata)
+                base = stem + ext
+            # An empty token or a removal that takes it all would give "" or a bare ".txt"
+            if not stem:
+                raise EngineError("empty_name", index + 1, name)
+        return folder + sep + base
+
+    def apply(self, names, metadata=None):
+        """New names of names; metadata is the list of their files' metadata, when fields is not empty."""
+        if metadata is None:
+            return [self(name, index) for index, name in enumerate(names)]
+        return [self(name, index, meta) for index, (name, meta) in enumerate(zip(names, metadata))]
+
+def _split_ext(name):
+    # os.path.splitext() for a name without folders, at a fraction of the cost
+    dot = name.rfind(".")
+    if dot > 0 and name[:dot].lstrip("."):
+        return name[:dot], name[dot:]
+    return name, ""
+
+def _position(value):
+    return None if value == "end" else int(value)
+
+def _inserter(text, position):
+    if position is None:
+        return lambda s, i, m: s + text(i)
+    return lambda s, i, m: s[:position] + text(i) + s[position:]
+
+def _rule_replace(find, replacement, flags=""):
+    if flags not in ("", "i"):
+        raise ValueError(flags)
+    if not flags:
+        return lambda s, i, m: s.replace(find, replacement)
+    return _rule_regex(re.escape(find), replacement.replace("\\", "\\\\"), flags)
+
+def _rule_regex(pattern, replacement, flags=""):
+    if flags not in ("", "i"):
+        raise ValueError(flags)
+    sub = re.compile(pattern, re.IGNORECASE if flags else 0).sub
+    # Parses the replacement now, so a bad group reference is reported with its line
+    sub(replacement, "")
+    return lambda s, i, m: sub(replacement, s)
+
+def _rule_insert(position, text):
+    return _inserter(lambda i: text, _position(position))
+
+def _rule_remove(position, count):
+    position, count = int(position), int(count)
+    if count < 0:
+        raise ValueError(count)
+    if position >= 0:
+        return lambda s, i, m: s[:position] + s[position + count:]
+    def remove(s, i, m):
+        start = max(len(s) + position, 0)
+        return s[:start] + s[start + count:]
+    return remove
+
+def _rule_counter(start="1", step="1", width="1", position="end"):
+    start, step, width = int(start), int(step), int(width)
+    return _inserter(lambda i: f"{start + i * step:0{width}d}", _position(position))
+
+def _rule_case(mode):
+    change = RULE_CASES[mode]
+    return lambda s, i, m: change(s)
+
+def _rule_transliterate():
+    return lambda s, i, m: s if s.isascii() else s.translate(_TRANSLITERATION)
+
+def _rule_format(number, fields, template):
+    used = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+    # Only bare tokens: {date.year} or {title[0]} would fail on the files without that tag
+    unknown = used - set(METADATA_FIELDS) - {"name"}
+    if unknown:
+        raise EngineError("rule_field", number, sorted(unknown)[0])
+    # Fails here, with the line number, on a format spec that does not suit its token
+    template.format_map(_Tokens("", METADATA_SAMPLE))
+    fields.update(used - {"name"})
+    def format_name(s, i, m):
+        try:
+            return template.format_map(_Tokens(s, m))
+        except (ValueError, TypeError):
+            # The spec suits the sample but not this file's tag ({track:02d} of "A1")
+            return template.format_map(_Tokens(s, m, tolerant=True))
+    return format_name
+
+class _Tokens:
+    """Values of a format template: {name} and the metadata, with missing tokens written as nothing.
+
+    With tolerant, a value its format spec does not suit is written as a missing token too.
+    """
+    def __init__(self, name, metadata, tolerant=False):
+        self.name = name
+        self.metadata = metadata or {}
+        self.tolerant = tolerant
+
+    def __getitem__(self, key):
+        value = self.name if key == "name" else self.metadata.get(key)
+        if value is None:
+            return _MISSING
+        return _Tolerant(value) if self.tolerant else value
+
+class _Tolerant:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __format__(self, spec):
+        try:
+            return format(self.value, spec)
+        except (ValueError, TypeError):
+            return format(_MISSING, spec)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+class _Missing:
+    def __format__(self, spec):
+        return ""
+
+    def __str__(self):
+        # {title!s} and {title!r} convert before formatting
+        return ""
+
+    __repr__ = __str__
+
+_MISSING = _Missing()
+
+_RULES = {"replace": _rule_replace, "regex": _rule_regex, "insert": _rule_insert, "remove": _rule_remove,
+          "counter": _rule_counter, "case": _rule_case, "transliterate": _rule_transliterate, "format": _rule_format}
+
+# --- File Metadata ---
+# Tokens of the "format" rule. date and camera come from EXIF (JPEG, TIFF and
+# TIFF-based raws), title to year from ID3 (MP3) or Vorbis comments (FLAC,
+# Ogg, Opus), mtime and size from the file system, hash from the contents.
+METADATA_FIELDS = ("date", "camera", "title", "artist", "album", "track", "year", "mtime", "size", "hash")
+METADATA_SAMPLE = {"date": datetime.datetime(2000, 1, 1), "mtime": datetime.datetime(2000, 1, 1),
+                   "camera": "", "title": "", "artist": "", "album": "", "track": 1, "year": 2000, "size": 0,
+                   "hash": ""}
+# Fields that do not need the files' tags
+_FILE_FIELDS = {"mtime", "size", "hash"}
+METADATA_CACHE_NAME = "metadata.json"
+# Files cached at most; the least recently used are dropped first
+METADATA_CACHE_MAX_ENTRIES = 500000
+# Below this many files to read, a process pool costs more than it saves
+METADATA_POOL_MIN = 256
+# Longest tag block read (Vorbis comments often carry the cover picture)
+METADATA_MAX_BLOCK = 1024 * 1024
+
+def read_metadata(path):
+    """Reads the tags of a file from its header. Returns {} when it has none or cannot be read.
+
+    Values are strings (date as "YYYY-MM-DDTHH:MM:SS"), as stored in the cache.
+    Only the standard library is used, and only the header blocks are read.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(4)
+            f.seek(0)
+            if magic[:2] == b"\xff\xd8":
+                return _read_jpeg(f)
+            if magic in (b"II*\0", b"MM\0*"):
+                return _parse_tiff(lambda offset, size: (f.seek(offset), f.read(size))[1])
+            if magic == b"fLaC":
+                return _read_flac(f)
+            if magic == b"OggS":
+                return _read_ogg(f)
+            if magic[:3] == b"ID3" or path.lower().endswith(".mp3"):
+                return _read_id3(f)
+    except (OSError, ValueError, struct.error, IndexError, UnicodeDecodeError):
+        pass
+    return {}
+
+def _read_jpeg(f):
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return {}
+        kind, length = marker[1], int.from_bytes(marker[2:], "big")
+        # Start of scan or end of image: the image data never comes before EXIF
+        if kind in (0xDA, 0xD9):
+            return {}
+        if kind == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(b"Exif\0\0"):
+                tiff = data[6:]
+                return _parse_tiff(lambda offset, size: tiff[offset:offset + size])
+        else:
+            f.seek(length - 2, 1)
+
+# EXIF tags: IFD0 Make, Model, DateTime and the EXIF IFD pointer; DateTimeOriginal in the EXIF IFD
+_EXIF_MAKE, _EXIF_MODEL, _EXIF_DATETIME, _EXIF_IFD, _EXIF_ORIGINAL = 0x010F, 0x0110, 0x0132, 0x8769, 0x9003
+
+def _parse_tiff(read):
+    """Fields of a TIFF structure; read(offset, size) returns its bytes."""
+    header = read(0, 8)
+    order = {b"II*\0": "<", b"MM\0*": ">"}.get(header[:4])
+    if order is None:
+        return {}
+    tags = _tiff_ifd(read, order, struct.unpack(order + "I", header[4:])[0])
+    if _EXIF_IFD in tags:
+        tags.update(_tiff_ifd(read, order, tags[_EXIF_IFD]))
+    fields = {}
+    date = _exif_date(tags.get(_EXIF_ORIGINAL) or tags.get(_EXIF_DATETIME))
+    if date:
+        fields["date"] = date
+    make, model = tags.get(_EXIF_MAKE, ""), tags.get(_EXIF_MODEL, "")
+    # Most models already start with the make ("Canon EOS 5D")
+    camera = model if model.lower().startswith(make.lower()) else f"{make} {model}"
+    if camera.strip():
+        fields["camera"] = camera.strip()
+    return fields
+
+def _tiff_ifd(read, order, offset):
+    """The ASCII and LONG tags of one IFD that the fields above use."""
+    tags = {}
+    count = struct.unpack(order + "H", read(offset, 2))[0]
+    entries = read(offset + 2, count * 12)
+    for i in range(0, len(entries) - 11, 12):
+        tag, kind, n = struct.unpack(order + "HHI", entries[i:i + 8])
+        if tag not in (_EXIF_MAKE, _EXIF_MODEL, _EXIF_DATETIME, _EXIF_IFD, _EXIF_ORIGINAL):
+            continue
+        value = entries[i + 8:i + 12]
+        if kind == 2:
+            if n > 4:
+                value = read(struct.unpack(order + "I", value)[0], n)
+            tags[tag] = value[:n].split(b"\0")[0].decode("latin-1").strip()
+        elif kind == 4:
+            tags[tag] = struct.unpack(order + "I", value)[0]
+    return tags
+
+def _exif_date(text):
+    try:
+        return datetime.datetime.strptime(text or "", "%Y:%m:%d %H:%M:%S").isoformat()
+    except ValueError:
+        # Cameras without a clock write "0000:00:00 00:00:00"
+        return None
+
+# ID3v2 frames (2.3/2.4 and 2.2) and Vorbis comment keys of each field
+_ID3_FRAMES = {"TIT2": "title", "TT2": "title", "TPE1": "artist", "TP1": "artist", "TALB": "album", "TAL": "album",
+               "TRCK": "track", "TRK": "track", "TYER": "year", "TYE": "year", "TDRC": "year"}
+_VORBIS_KEYS = {"TITLE": "title", "ARTIST": "artist", "ALBUM": "album", "TRACKNUMBER": "track", "DATE": "year"}
+_ID3_ENCODINGS = ("latin-1", "utf-16", "utf-16-be", "utf-8")
+
+def _read_id3(f):
+    header = f.read(10)
+    if header[:3] != b"ID3":
+        return _read_id3v1(f)
+    major, flags = header[3], header[5]
+    data = f.read(_syncsafe(header[6:]))
+    if flags & 0x80 and major < 4:
+        # Unsynchronisation: every 0xFF 0x00 stands for 0xFF
+        data = data.replace(b"\xff\x00", b"\xff")
+    pos = 0
+    if flags & 0x40:
+        # Extended header; its size counts itself in 2.4 only
+        size = _syncsafe(data[:4]) if major >= 4 else struct.unpack(">I", data[:4])[0] + 4
+        pos = size
+    id_size, head_size = (3, 6) if major == 2 else (4, 10)
+    fields = {}
+    while pos + head_size <= len(data) and data[pos] != 0:
+        frame_id = data[pos:pos + id_size].decode("latin-1")
+        raw = data[pos + id_size:pos + id_size + (3 if major == 2 else 4)]
+        size = int.from_bytes(raw, "big") if major < 4 else _syncsafe(raw)
+        body = data[pos + head_size:pos + head_size + size]
+        pos += head_size + size
+        field = _ID3_FRAMES.get(frame_id)
+        if field and body and field not in fields:
+            encoding = _ID3_ENCODINGS[body[0]] if body[0] < 4 else "latin-1"
+            text = body[1:].decode(encoding, "replace").split("\0")[0].strip()
+            if text:
+                fields[field] = text
+    return _tidy_tags(fields) or _read_id3v1(f)
+
+def _read_id3v1(f):
+    f.seek(0, os.SEEK_END)
+    if f.tell() < 128:
+        return {}
+    f.seek(-128, os.SEEK_END)
+    tag = f.read(128)
+    if tag[:3] != b"TAG":
+        return {}
+    fields = {field: tag[start:end].split(b"\0")[0].decode("latin-1").strip()
+              for field, start, end in (("title", 3, 33), ("artist", 33, 63), ("album", 63, 93), ("year", 93, 97))}
+    # ID3v1.1 keeps the track number in the last byte of the comment
+    if tag[125] == 0 and tag[126]:
+        fields["track"] = str(tag[126])
+    return _tidy_tags({k: v for k, v in fields.items() if v})
+
+def _syncsafe(raw):
+    return (raw[0] << 21) | (raw[1] << 14) | (raw[2] << 7) | raw[3]
+
+def _read_flac(f):
+    f.seek(4)
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return {}
+        kind, size = header[0] & 0x7F, int.from_bytes(header[1:], "big")
+        if kind == 4:
+            return _parse_vorbis_comment(f.read(min(size, METADATA_MAX_BLOCK)))
+        if header[0] & 0x80:
+            return {}
+        f.seek(size, 1)
+
+def _read_ogg(f):
+    """Vorbis comments of an Ogg Vorbis or Opus file: the second packet of the stream."""
+    packets, packet = 0, b""
+    while True:
+        header = f.read(27)
+        if len(header) < 27 or header[:4] != b"OggS":
+            return {}
+        for lacing in f.read(header[26]):
+            packet += f.read(lacing)
+            if lacing == 255 and len(packet) < METADATA_MAX_BLOCK:
+                continue
+            packets += 1
+            if packets == 2:
+                for magic in (b"\x03vorbis", b"OpusTags"):
+                    if packet.startswith(magic):
+                        return _parse_vorbis_comment(packet[len(magic):])
+                return {}
+            packet = b""
+
+def _parse_vorbis_comment(data):
+    """Fields of a Vorbis comment block; a block cut short (see METADATA_MAX_BLOCK) gives what it holds."""
+    fields = {}
+    pos = 4 + struct.unpack("<I", data[:4])[0]
+    count = struct.unpack("<I", data[pos:pos + 4])[0]
+    pos += 4
+    for _ in range(count):
+        if pos + 4 > len(data):
+            break
+        size = struct.unpack("<I", data[pos:pos + 4])[0]
+        key, _, value = data[pos + 4:pos + 4 + size].decode("utf-8", "replace").partition("=")
+        pos += 4 + size
+        field = _VORBIS_KEYS.get(key.upper())
+        if field and value.strip() and field not in fields:
+            fields[field] = value.strip()
+    return _tidy_tags(fields)
+
+def _tidy_tags(fields):
+    # "3/12" -> "3", "2021-05-04" -> "2021"
+    if "track" in fields:
+        fields["track"] = fields["track"].split("/")[0].strip()
+    if "year" in fields:
+        fields["year"] = fields["year"][:4]
+    return {k: v for k, v in fields.items() if v}
+
+def _read_metadata_chunk(paths):
+    return [read_metadata(path) for path in paths]
+
+class _StatCache:
+    """Values read from files, kept on disk keyed by (dev, inode, size, mtime).
+
+    A file that was not changed or replaced since it was read is never
+    opened again, so a second pass over a folder costs one stat per file.
+    Subclasses name the file and read the files missing from it.
+    """
+    file_name = None
+    header = {"version": 1}
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = {}
+        self._dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if all(data.get(k) == v for k, v in self.header.items()):
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    @classmethod
+    def open(cls, config_dir=CONFIG_DIR, **limits):
+        return cls(os.path.join(config_dir, cls.file_name), **limits)
+
+    def _values(self, folder, names, stats, keys, workers):
+        """Cached values of names, reading the regular files missing from the cache; None where there is none."""
+        entries = self.entries
+        missing = [i for i, (key, st) in enumerate(zip(keys, stats))
+                   if key and key not in entries and stat.S_ISREG(st.st_mode)]
+        if missing:
+            # In inode order, which is close to the order on disk
+            missing.sort(key=lambda i: stats[i].st_ino)
+            paths = [os.path.join(folder, names[i]) for i in missing]
+            for i, value in zip(missing, self._read(paths, [stats[i] for i in missing], workers)):
+                if value is not None:
+                    entries[keys[i]] = value
+            self._dirty = True
+            # Oldest first: entries are moved to the end when used
+            for key in list(itertools.islice(entries, max(0, len(entries) - self.max_entries))):
+                del entries[key]
+
+        values = []
+        for key in keys:
+            value = entries.get(key) if key else None
+            if value is not None:
+                entries[key] = entries.pop(key)
+            values.append(value)
+        return values
+
+    def _read(self, paths, stats, workers):
+        raise NotImplementedError
+
+    def save(self):
+        """Writes the cache if lookups added to it."""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({**self.header, "entries": self.entries}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{self.path}.tmp", self.path)
+        self._dirty = False
+
+def _stat_keys(folder, names):
+    """(stats, keys) of names in folder: os.stat() results and "dev:ino:size:mtime" cache keys, None if missing."""
+    stats, keys = [], []
+    fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        for name in names:
+            try:
+                st = os.stat(name, dir_fd=fd)
+            except OSError:
+                st = None
+            stats.append(st)
+            keys.append(f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}" if st else None)
+    finally:
+        os.close(fd)
+    return stats, keys
+
+class MetadataCache(_StatCache):
+    """read_metadata() results kept on disk, keyed by (dev, inode, size, mtime).
+
+    Files not in the cache are read by a process pool when there are many.
+    The {hash} token comes from a DigestCache kept next to it.
+    """
+    file_name = METADATA_CACHE_NAME
+
+    def __init__(self, path, max_entries=METADATA_CACHE_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+        self._digests = None
+
+    @property
+    def digests(self):
+        # Loaded on first use: only the {hash} token needs it
+        if self._digests is None:
+            self._digests = DigestCache(os.path.join(os.path.dirname(self.path), DIGEST_CACHE_NAME))
+        return self._digests
+
+    def lookup(self, folder, names, workers=None, fields=METADATA_FIELDS):
+        """Token values (METADATA_FIELDS) of names in folder, in the same order; {} for unreadable files.
+
+        Only the files' tags, contents or both are read, depending on the fields asked for.
+        """
+        stats, keys = _stat_keys(folder, names)
+        fields = set(fields)
+        none = [None] * len(names)
+        tags = self._values(folder, names, stats, keys, workers) if fields - _FILE_FIELDS else none
+        hashes = self.digests._values(folder, names, stats, keys, workers) if "hash" in fields else none
+        values = []
+        for st, found, digest in zip(stats, tags, hashes):
+            if st is None:
+                values.append({})
+                continue
+            value = _token_values(found or {}, st)
+            if digest:
+                value["hash"] = digest
+            values.append(value)
+        return values
+
+    def _read(self, paths, stats, workers):
+        if len(paths) < METADATA_POOL_MIN:
+            return _read_metadata_chunk(paths)
+        workers = workers or os.cpu_count() or 1
+        chunk = max(16, len(paths) // (workers * 8))
+        chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: forking a process that runs Qt (or any other threads) is not safe
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return [fields for result in pool.map(_read_metadata_chunk, chunks) for fields in result]
+
+    def save(self):
+        super().save()
+        if self._digests is not None:
+            self._digests.save()
+
+def _token_values(fields, st):
+    values = {"mtime": datetime.datetime.fromtimestamp(st.st_mtime_ns / 1e9), "size": st.st_size}
+    for key, value in fields.items():
+        if key == "date":
+            value = datetime.datetime.fromisoformat(value)
+        elif key in ("track", "year") and value.isdigit():
+            value = int(value)
+        values[key] = value
+    return values
+
+# --- Content Hashes ---
+# Digests of the {hash} token and of the duplicates report. The reads and
+# hashlib both release the GIL, so a thread pool keeps several disks or a
+# fast SSD busy; files are read with a reused buffer rather than mapped, as
+# a mapped file truncated while it is hashed would crash the process.
+HASH_ALGORITHM = "sha256"
+HASH_BLOCK = 1024 * 1024
+HASH_WORKERS = 4
+# Bytes given to a pool thread at a time, so many small files share a task
+HASH_TASK_BYTES = 64 * 1024 * 1024
+DIGEST_CACHE_NAME = "digests.json"
+DIGEST_CACHE_MAX_ENTRIES = 1000000
+
+_hash_buffers = threading.local()
+
+def file_digest(path, algorithm=HASH_ALGORITHM):
+    """Hex digest of a file's contents."""
+    buffer = getattr(_hash_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _hash_buffers.buffer = bytearray(HASH_BLOCK)
+    view = memoryview(buffer)
+    import hashlib
+    digest = hashlib.new(algorithm)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+def _digest_task(paths):
+    digests = []
+    for path in paths:
+        try:
+            digests.append(file_digest(path))
+        except OSError:
+            digests.append(None)
+    return digests
+
+class DigestCache(_StatCache):
+    """Content hashes (HASH_ALGORITHM, in hex) kept on disk, keyed by (dev, inode, size, mtime)."""
+    file_name = DIGEST_CACHE_NAME
+    header = {"version": 1, "algorithm": HASH_ALGORITHM}
+
+    def __init__(self, path, max_entries=DIGEST_CACHE_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def lookup(self, folder, names, workers=None):
+        """Digests of names in folder, in the same order; None for missing or unreadable files."""
+        stats, keys = _stat_keys(folder, names)
+        return self._values(folder, names, stats, keys, workers)
+
+    def duplicates(self, folder, names, workers=None):
+        """Groups of indexes of names with the same contents, in line order.
+
+        Only files that share their size with another one are read.
+        """
+        for _, _, groups in self.iter_duplicates(folder, names, workers):
+            pass
+        return groups
+
+    def iter_duplicates(self, folder, names, workers=None):
+        """duplicates() a part at a time, so a caller can show progress and stop between parts.
+
+        Yields (done, total, groups) after each part of the files to read (about
+        HASH_TASK_BYTES per worker): done of the total files are hashed. groups
+        is None until the last item.
+        """
+        stats, keys = _stat_keys(folder, names)
+        by_size = {}
+        for i, st in enumerate(stats):
+            if st is not None and stat.S_ISREG(st.st_mode):
+                by_size.setdefault(st.st_size, []).append(i)
+        candidates = sorted(i for group in by_size.values() if len(group) > 1 for i in group)
+        part_bytes = HASH_TASK_BYTES * (workers or HASH_WORKERS)
+        digests, start, size = [], 0, 0
+        for end, i in enumerate(candidates, 1):
+            size += stats[i].st_size
+            if size >= part_bytes or end == len(candidates):
+                part = candidates[start:end]
+                digests += self._values(folder, [names[j] for j in part], [stats[j] for j in part],
+                                        [keys[j] for j in part], workers)
+                start, size = end, 0
+                if end < len(candidates):
+                    yield end, len(candidates), None
+        groups = {}
+        for i, digest in zip(candidates, digests):
+            if digest:
+                groups.setdefault(digest, []).append(i)
+        yield len(candidates), len(candidates), sorted((group for group in groups.values() if len(group) > 1),
+                                                       key=lambda group: group[0])
+
+    def _read(self, paths, stats, workers):
+        tasks, task, size = [], [], 0
+        for path, st in zip(paths, stats):
+            task.append(path)
+            size += st.st_size
+            if size >= HASH_TASK_BYTES:
+                tasks.append(task)
+                task, size = [], 0
+        if task:
+            tasks.append(task)
+        if len(tasks) == 1:
+            return _digest_task(tasks[0])
+        with ThreadPoolExecutor(workers or HASH_WORKERS) as pool:
+            return [digest for result in pool.map(_digest_task, tasks) for digest in result]
+
+# --- Sort Orders ---
+# Orders of the names loaded from a folder: code point, natural (img2 before
+# img10), locale collation, modification time and size
+SORT_ORDERS = ("name", "natural", "locale", "mtime", "size")
+_DIGIT_RUNS = re.compile(r"(\d+)")
+
+def natural_key(name):
+    """Runs of digits compare as numbers and letters without case: img2 < IMG10.
+
+    The key is a plain string, so sorting compares it in C: each number is
+    written with its digit count in front ("img2" -> "img0012").
+    """
+    parts = _DIGIT_RUNS.split(name.casefold())
+    for i in range(1, len(parts), 2):
+        digits = str(int(parts[i]))
+        parts[i] = f"{len(digits):03d}{digits}"
+    return "".join(parts)
+
+def locale_key(name):
+    """Collation key of the current LC_COLLATE (set by Qt in the window)."""
+    try:
+        return locale.strxfrm(name)
+    except ValueError:
+        # Undecodable names (surrogate escapes) or embedded NULs
+        return name
+
+class FolderListing:
+    """Names loaded from a folder (directory order) and the same names in each sort order.
+
+    An order is sorted once, each key computed once per name, and kept, so
+    switching back to it is a lookup. File times and sizes come from the
+    listing's scandir pass when it was asked for them (see iter_files());
+    otherwise they are read once, the first time an order needs them.
+    """
+    def __init__(self, folder, names, stats=None):
+        self.folder = folder
+        self.names = names
+        self.stats = stats
+        self._sorted = {}
+
+    def sorted(self, order="name"):
+        names = self._sorted.get(order)
+        if names is None:
+            if order == "name":
+                names = sorted(self.names)
+            else:
+                # A stable sort of the name order: equal keys stay by name
+                names = sorted(self.sorted("name"), key=self._key(order))
+            self._sorted[order] = names
+        return names
+
+    def update(self, added, removed):
+        """Takes names that appeared in or left the folder; each order is sorted again when next asked for."""
+        if removed:
+            gone = set(removed)
+            self.names = [name for name in self.names if name not in gone]
+            if self.stats is not None:
+                for name in gone:
+                    self.stats.pop(name, None)
+        self.names.extend(added)
+        if self.stats is not None and added:
+            self.stats.update(self._stat_names(added))
+        self._sorted.clear()
+
+    def _key(self, order):
+        if order == "natural":
+            return natural_key
+        if order == "locale":
+            return locale_key
+        if order not in ("mtime", "size"):
+            raise ValueError(order)
+        stats = self._read_stats()
+        field = 0 if order == "mtime" else 1
+        # Names that could not be read sort first
+        return lambda n: stats[n][field] if n in stats else -1
+
+    def _read_stats(self):
+        if self.stats is None:
+            self.stats = self._stat_names(self.names)
+        return self.stats
+
+    def _stat_names(self, names):
+        stats = {}
+        fd = os.open(self.folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            for name in names:
+                try:
+                    stats[name] = _stat_key(os.stat(name, dir_fd=fd))
+                except OSError:
+                    continue
+        finally:
+            os.close(fd)
+        return stats
+
+# --- Execution ---
+# Directories renamed in parallel by a recursive batch.
+RENAME_WORKERS = 8
+
+def iter_files(folder, stats=None):
+    """Yields the names of the regular files in folder, in directory order.
+
+    With a stats dict, also fills it with the (mtime_ns, size) of each name.
+    """
+    with os.scandir(folder) as it:
+        for entry in it:
+            try:
+                # Uses d_type, so only symlinks cost an extra stat
+                if entry.is_file():
+                    if stats is not None:
+                        stats[entry.name] = _stat_key(entry.stat())
+                    yield entry.name
+            except OSError:
+                continue
+
+def iter_tree(folder, stats=None):
+    """Yields the relative paths of the files and directories below folder.
+
+    Symlinked directories are not followed and unreadable subdirectories are
+    skipped. stats is filled as in iter_files().
+    """
+    stack = [""]
+    while stack:
+        reldir = stack.pop()
+        prefix = reldir + os.sep if reldir else ""
+        try:
+            it = os.scandir(os.path.join(folder, reldir))
+        except OSError:
+            if not reldir:
+                raise
+            continue
+        with it:
+            for entry in it:
+                path = prefix + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(path)
+                    elif not entry.is_file():
+                        continue
+                    if stats is not None:
+                        stats[path] = _stat_key(entry.stat())
+                    yield path
+                except OSError:
+                    continue
+
+def _stat_key(st):
+    return st.st_mtime_ns, st.st_size
+
+def _depth(path):
+    return path.count(os.sep) + 1 if path else 0
+
+def _run_sharded(shards, run_shard, workers, deepest_first, level_done=None):
+    """Runs the shards of each directory level in parallel, one level at a time.
+
+    shards maps a directory to its work; run_shard(work, put) reports events
+    through put. Yields the events as they come. level_done(), if given, is
+    called after each level.
+    """
+    levels = {}
+    for directory, work in shards.items():
+        levels.setdefault(_depth(directory), []).append(work)
+    events = queue.Queue()
+    done = object()
+
+    def task(work):
+        try:
+            run_shard(work, events.put)
+        finally:
+            events.put(done)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for depth in sorted(levels, reverse=deepest_first):
+            futures = [pool.submit(task, work) for work in levels[depth]]
+            remaining = len(futures)
+            while remaining:
+                event = events.get()
+                if event is done:
+                    remaining -= 1
+                else:
+                    yield event
+            for future in futures:
+                future.result()
+            if level_done is not None:
+                level_done()
+
+def execute(folder, steps, snapshot, history_path, commit_interval=HISTORY_COMMIT_INTERVAL, workers=1, timer=None,
+            resume=None):
+    """Runs a plan, yielding one (status, orig, new, detail) event per step.
+
+    status is "renamed" (detail is the (dst, src) history entry), "step" for
+    the move to a temporary name of a cycle (detail as for "renamed"),
+    "missing", "error" (detail is the exception) or "skipped" for the closing
+    step of a cycle whose first step failed. Every move is appended to the
+    journal at history_path, which is started afresh. Renames never replace
+    an existing file (see rename_noreplace).
+
+    To finish an interrupted batch, steps are the pending ones of the
+    ResumeCheck given as resume: its journal is continued instead, and the
+    moves it lost are journaled first, with a "recovered" event each.
+
+    Steps in subfolders are sharded by directory and run deepest level first,
+    so the contents of a directory are renamed before the directory itself;
+    with workers > 1, directories of the same depth run in parallel.
+
+    A PhaseTimer given as timer gets the time spent in the "moves" and
+    "history" (journal) phases.
+    """
+    journal = RenameJournal(history_path, commit_interval)
+    # Folder contents as the batch goes, kept from the snapshot instead of stat calls.
+    # Shards only touch names of their own directory, so they can share these sets.
+    present = set(snapshot.names)
+    failed = set()
+
+    def run_step(step):
+        s, d, o, n = step
+        if o in failed:
+            return "skipped", o, n, None
+        if s not in present or (s == o and s not in snapshot.renamable):
+            failed.add(o)
+            return "missing", o, n, None
+        try:
+            if d in present:
+                # The file this one replaces could not be moved away
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), d)
+            t0 = time.perf_counter()
+            fds.rename(s, d)
+            t1 = time.perf_counter()
+            present.discard(s)
+            present.add(d)
+            src, dst = os.path.join(folder, s), os.path.join(folder, d)
+            # Renaming keeps inode, size and mtime, so this identifies the file at undo time
+            entry = dst, src, fingerprint(fds.stat(d))
+            journal.append(*entry)
+            if timer is not None:
+                timer.add("moves", t1 - t0)
+                timer.add("history", time.perf_counter() - t1)
+            return ("renamed" if d == n else "step"), o, n, entry
+        except Exception as e:
+            failed.add(o)
+            return "error", o, n, e
+
+    shards = {}
+    if workers > 1 or any(os.sep in step[0] for step in steps):
+        for step in steps:
+            shards.setdefault(os.path.dirname(step[0]), []).append(step)
+    # Each directory is opened once; renames resolve only the last path component.
+    # A shard opens its own directory, so threads never share a cache entry.
+    fds = DirectoryFds(folder)
+    with contextlib.closing(journal.open(resume.journal_length if resume else 0)), fds:
+        for (s, d, o, n), now in zip(resume.recovered, _recovered_locations(resume.recovered)) if resume else ():
+            try:
+                entry = os.path.join(folder, d), os.path.join(folder, s), fingerprint(fds.stat(now))
+            except OSError as e:
+                yield "error", o, n, e
+                continue
+            journal.append(*entry)
+            yield "recovered", o, n, entry
+        if len(shards) <= 1:
+            for step in steps:
+                yield run_step(step)
+            return
+        if workers <= 1:
+            # The same order as the shards below, one directory at a time
+            depth = None
+            for directory in sorted(shards, key=_depth, reverse=True):
+                if depth is not None and _depth(directory) != depth:
+                    journal.commit()
+                depth = _depth(directory)
+                for step in shards[directory]:
+                    yield run_step(step)
+            return
+        def run_shard(shard, put):
+            for step in shard:
+                put(run_step(step))
+        # Committing each level keeps a crash from losing the records of a directory's
+        # contents once the directory itself is renamed: resuming could not find them
+        yield from _run_sharded(shards, run_shard, workers, deepest_first=True, level_done=journal.commit)
+
+def _recovered_locations(steps):
+    """Where the file of each recovered step is now: later steps (or renames of its directories) may have moved it."""
+    locations = []
+    for i, (s, d, o, n) in enumerate(steps):
+        now = d
+        for later in steps[i + 1:]:
+            if now == later[0]:
+                now = later[1]
+            elif now.startswith(later[0] + os.sep):
+                now = later[1] + now[len(later[0]):]
+        locations.append(now)
+    return locations
+
+def load_history(history_path):
+    """The (dst, src, fingerprint) entries of the last batch, or [] if there is none or it is unreadable."""
+    if not os.path.exists(history_path):
+        return []
+    try:
+        return RenameJournal.read(history_path)
+    except (json.JSONDecodeError, TypeError, IndexError, IOError):
+        clear_history(history_path)
+        return []
+
+def clear_history(history_path):
+    try: os.remove(history_path)
+    except OSError: pass
+
+def final_paths(history):
+    """Where everything a batch moved should be now, as {path: fingerprint}.
+
+    Replays the history: temporary names used to break cycles are gone by the
+    end of the batch, and entries inside a directory that was renamed later
+    follow their directory.
+    """
+    groups = {}      # parent directory -> {name expected in it: fingerprint}
+    ancestors = set() # every directory above a key of groups
+    for dst, src, fp in history:
+        src_parent, src_name = os.path.split(src)
+        if src_parent in groups:
+            groups[src_parent].pop(src_name, None)
+        dst_parent, dst_name = os.path.split(dst)
+        groups.setdefault(dst_parent, {})[dst_name] = fp
+        ancestors.update(_parents(dst_parent))
+        if src in groups or src in ancestors:
+            # A directory was renamed: move the groups recorded below it
+            prefix = src + os.sep
+            for parent in [p for p in groups if p == src or p.startswith(prefix)]:
+                moved = dst + parent[len(src):]
+                groups.setdefault(moved, {}).update(groups.pop(parent))
+                ancestors.update(_parents(moved))
+    return {os.path.join(parent, name): fp for parent, names in groups.items() for name, fp in names.items()}
+
+def _parents(path):
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return
+        yield parent
+        path = parent
+
+def find_drift(history):
+    """Entries of a batch that changed since it ran, as (path, reason) pairs.
+
+    reason is "missing" (nothing at the path), "replaced" (another file or
+    folder holds the name) or "modified" (same file, different size or mtime).
+    Each directory is read with one os.scandir pass; the inode comes with the
+    listing, so only the entries of the batch are stat()ed. Entries of an old
+    history without a fingerprint only need to exist.
+    """
+    expected = {}
+    for path, fp in final_paths(history).items():
+        parent, name = os.path.split(path)
+        expected.setdefault(parent, {})[name] = fp
+    drifted = []
+    for parent, names in expected.items():
+        names = dict(names)
+        try:
+            with os.scandir(parent) as it:
+                for entry in it:
+                    if entry.name not in names:
+                        continue
+                    reason = _drift(entry, names.pop(entry.name))
+                    if reason:
+                        drifted.append((entry.path, reason))
+        except OSError:
+            pass
+        drifted.extend((os.path.join(parent, name), "missing") for name in names)
+    return drifted
+
+def _drift(entry, fp):
+    if fp is None:
+        return None
+    dev, ino, size, mtime_ns = fp
+    try:
+        if entry.inode() != ino:
+            return "replaced"
+        st = entry.stat(follow_symlinks=False)
+    except OSError:
+        return "missing"
+    if st.st_dev != dev:
+        return "replaced"
+    if size is not None and (st.st_size != size or st.st_mtime_ns != mtime_ns):
+        return "modified"
+    return None
+
+def can_undo(history):
+    """True if every file the batch left behind is still where it was put, unchanged."""
+    return not find_drift(history)
+
+def undo(history, workers=1, timer=None):
+    """Reverts a batch, last step first, yielding one (status, dst, src, error) event per step.
+
+    status is "undone" or "error". With workers > 1 the history is sharded by
+    directory like execute(), shallowest level first, so a renamed directory
+    gets its old name back before its contents are reverted. A PhaseTimer
+    given as timer gets the time spent in the "moves" phase.
+    """
+    def revert(dst, src):
+        try:
+            t0 = time.perf_counter()
+            fds.rename(dst, src)
+            if timer is not None:
+                timer.add("moves", time.perf_counter() - t0)
+            return "undone", dst, src, None
+        except Exception as e:
+            return "error", dst, src, e
+
+    shards = {}
+    if workers > 1:
+        for dst, src, _ in history:
+            shards.setdefault(os.path.dirname(dst), []).append((dst, src))
+    with DirectoryFds() as fds:
+        if len(shards) <= 1:
+            for dst, src, _ in reversed(history):
+                yield revert(dst, src)
+            return
+        def run_shard(shard, put):
+            for dst, src in reversed(shard):
+                put(revert(dst, src))
+        yield from _run_sharded(shards, run_shard, workers, deepest_first=False)
+
+# --- Resuming ---
+class ResumeCheck:
+    """What check_resume() found in an interrupted batch.
+
+    steps are the steps still to run, in plan order, and snapshot the folder
+    contents they were checked against. Done steps were either journaled
+    (counted in journaled) or made without being journaled, in the last moments
+    before the interruption (recovered). inconsistent lists (step, reason)
+    pairs for steps that are neither done nor can run: reason is "missing"
+    (neither name exists) or "exists" (both do).
+    """
+    def __init__(self, steps, snapshot, journaled, recovered, inconsistent, journal_length):
+        self.steps = steps
+        self.snapshot = snapshot
+        self.journaled = journaled
+        self.recovered = recovered
+        self.inconsistent = inconsistent
+        self.journal_length = journal_length
+
+    @property
+    def done(self):
+        return self.journaled + len(self.recovered)
+
+def cycle_starts(folder, steps):
+    """{source: [dev, inode]} of the first step of each cycle, the move to a temporary name.
+
+    A cycle that ran to the end leaves the same names as one that never
+    started; only which file holds them changes.
+    """
+    starts = {}
+    for s, d, o, n in steps:
+        if d != n:
+            try:
+                st = os.stat(os.path.join(folder, s), follow_symlinks=False)
+            except OSError:
+                continue
+            starts[s] = [st.st_dev, st.st_ino]
+    return starts
+
+def _cycle_started(folder, name, start):
+    if start is None:
+        return False
+    try:
+        st = os.stat(os.path.join(folder, name), follow_symlinks=False)
+    except OSError:
+        return True
+    return [st.st_dev, st.st_ino] != start
+
+def check_resume(folder, plan, history_path, config_dir=CONFIG_DIR):
+    """Sorts the steps of an interrupted batch (its plan, see HistoryStore.claim()) into done, pending and inconsistent.
+
+    Journaled steps are done without looking at the folder. The others are
+    checked against one scan of their directories. A step whose original is
+    gone but whose new name exists was made, and its journal record lost:
+    these are looked for from the end of the plan, each one reverted in the
+    scan, so the step before it sees the folder as it was when it ran (in
+    a→b after b→c, b is taken again once both ran). Such a step only counts if
+    the step that freed its new name ran too, and the last step of a cycle
+    only if the first file of the cycle was moved. The rest are checked in
+    plan order, with the scan updated as the pending ones would run, so a name
+    that an earlier pending step frees counts as free.
+    """
+    check_folder(folder, config_dir)
+    # The journal and the plan make a million objects; the collector has nothing to find in them
+    with _gc_paused():
+        return _check_resume(folder, plan, history_path)
+
+def _check_resume(folder, plan, history_path):
+    steps, starts = plan["steps"], plan.get("starts", {})
+    try:
+        history, length = RenameJournal.read_complete(history_path)
+    except FileNotFoundError:
+        history, length = [], 0
+    cut = len(os.path.join(folder, ""))
+    journaled = {(src[cut:], dst[cut:]) for dst, src, _ in history}
+    rest = [step for step in steps if (step[0], step[1]) not in journaled]
+    try:
+        if plan["recursive"]:
+            snapshot = TreeSnapshot(folder, {os.path.dirname(step[0]) for step in rest}, missing_ok=True)
+        else:
+            snapshot = FolderSnapshot(folder)
+    except OSError as e:
+        raise EngineError("cannot_list", e)
+
+    present = set(snapshot.names)
+    made = set()
+    for i in range(len(rest) - 1, -1, -1):
+        s, d, o, n = rest[i]
+        if d not in present or s in present:
+            continue
+        if s != o and (o, s) not in journaled and not _cycle_started(folder, o, starts.get(o)):
+            continue
+        made.add(i)
+        present.discard(d)
+        present.add(s)
+    source = {step[0]: i for i, step in enumerate(rest)}
+    for i, step in enumerate(rest):
+        j = source.get(step[1])
+        if i in made and j is not None and j < i and j not in made:
+            made.discard(i)
+
+    present = set(snapshot.names)
+    pending, recovered, inconsistent = [], [], []
+    for i, step in enumerate(rest):
+        s, d = step[0], step[1]
+        if i in made:
+            recovered.append(step)
+        elif s not in present:
+            inconsistent.append((step, "missing"))
+        elif d in present:
+            inconsistent.append((step, "exists"))
+        else:
+            pending.append(step)
+            present.discard(s)
+            present.add(d)
+    return ResumeCheck(pending, snapshot, len(history), recovered, inconsistent, length)
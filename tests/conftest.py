@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The engine is a top-level module of the repository, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
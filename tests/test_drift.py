@@ -0,0 +1,32 @@
+import os
+
+import massrenamer_engine as engine
+from test_execute import make_tree, rename
+
+
+def test_find_drift_reports_missing_replaced_and_modified(tmp_path):
+    folder = tmp_path / "files"
+    make_tree(folder, ["a", "b", "c", "d"])
+    rename(str(folder), ["a", "b", "c", "d"], ["a2", "b2", "c2", "d2"], str(tmp_path / "journal"))
+    history = engine.load_history(str(tmp_path / "journal"))
+    assert engine.find_drift(history) == []
+
+    # The new b2 exists before the old one goes, so it cannot reuse its inode
+    make_tree(folder, ["new"])
+    os.replace(folder / "new", folder / "b2")
+    os.remove(folder / "a2")
+    with open(folder / "c2", "a") as f:
+        f.write("more")
+
+    drift = dict(engine.find_drift(history))
+    assert drift == {str(folder / "a2"): "missing", str(folder / "b2"): "replaced",
+                     str(folder / "c2"): "modified"}
+    assert not engine.can_undo(history)
+
+
+def test_folder_renamed_with_its_contents_is_not_drift(tmp_path):
+    folder = tmp_path / "files"
+    make_tree(folder, ["d/a"])
+    rename(str(folder), ["d/a", "d"], ["d/b", "e"], str(tmp_path / "journal"), recursive=True)
+
+    assert engine.find_drift(engine.load_history(str(tmp_path / "journal"))) == []
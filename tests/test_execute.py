@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import massrenamer_engine as engine
+
+
+def make_tree(root, paths):
+    """Creates paths under root: names ending in "/" are folders, the others files holding their own path."""
+    for path in paths:
+        full = os.path.join(root, path)
+        if path.endswith("/"):
+            os.makedirs(full, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(full, "w") as f:
+                f.write(path)
+
+def contents(root):
+    """{relative path: contents} of the files under root."""
+    found = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            with open(path) as f:
+                found[os.path.relpath(path, root)] = f.read()
+    return found
+
+def rename(folder, origs, news, history_path, workers=1, recursive=False):
+    steps = engine.plan(origs, news)
+    snapshot = engine.take_snapshot(folder, origs, recursive)
+    return list(engine.execute(folder, steps, snapshot, history_path, workers=workers))
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_recursive_batch_renames_contents_before_their_folder(tmp_path, workers):
+    folder = tmp_path / "files"
+    make_tree(folder, ["a/x", "a/sub/f", "c/q"])
+    before = contents(folder)
+    origs = ["a", "a/x", "a/sub", "a/sub/f", "c/q"]
+    news = ["b", "a/y", "a/sub2", "a/sub/g", "c/r"]
+
+    events = rename(str(folder), origs, news, str(tmp_path / "journal"), workers, recursive=True)
+
+    assert [status for status, *_ in events] == ["renamed"] * 5
+    assert contents(folder) == {"b/y": "a/x", "b/sub2/g": "a/sub/f", "c/r": "c/q"}
+    history = engine.load_history(str(tmp_path / "journal"))
+    assert engine.can_undo(history)
+    assert all(status == "undone" for status, *_ in engine.undo(history, workers))
+    assert contents(folder) == before
+
+
+@pytest.mark.parametrize("origs, news", [
+    (["a", "b"], ["b", "a"]),
+    (["a", "b", "c"], ["b", "c", "a"]),
+    (["a", "b", "c"], ["b", "c", "d"]),
+    (["a", "b", "c", "d"], ["b", "a", "d", "c"]),
+])
+def test_swaps_rotations_and_chains_round_trip(tmp_path, origs, news):
+    folder = tmp_path / "files"
+    make_tree(folder, origs)
+    before = contents(folder)
+
+    events = rename(str(folder), origs, news, str(tmp_path / "journal"))
+
+    assert not [e for e in events if e[0] not in ("renamed", "step")]
+    assert contents(folder) == {n: o for o, n in zip(origs, news)}
+    history = engine.load_history(str(tmp_path / "journal"))
+    assert engine.can_undo(history)
+    assert all(status == "undone" for status, *_ in engine.undo(history))
+    assert contents(folder) == before
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_recursive_rotation_round_trip(tmp_path, workers):
+    folder = tmp_path / "files"
+    make_tree(folder, ["d1/a", "d1/b", "d1/c", "d2/x", "d2/y", "d2/deep/z"])
+    before = contents(folder)
+    origs = ["d1/a", "d1/b", "d1/c", "d2/x", "d2/y", "d2/deep", "d2/deep/z"]
+    news = ["d1/b", "d1/c", "d1/a", "d2/y", "d2/x", "d2/deeper", "d2/deep/w"]
+
+    rename(str(folder), origs, news, str(tmp_path / "journal"), workers, recursive=True)
+
+    assert contents(folder) == {"d1/b": "d1/a", "d1/c": "d1/b", "d1/a": "d1/c",
+                                "d2/y": "d2/x", "d2/x": "d2/y", "d2/deeper/w": "d2/deep/z"}
+    history = engine.load_history(str(tmp_path / "journal"))
+    assert all(status == "undone" for status, *_ in engine.undo(history, workers))
+    assert contents(folder) == before
+
+
+def test_source_removed_after_the_snapshot_fails_alone(tmp_path):
+    folder = tmp_path / "files"
+    make_tree(folder, ["a", "b"])
+    snapshot = engine.take_snapshot(str(folder), ["a", "b"])
+    os.remove(folder / "a")
+
+    events = list(engine.execute(str(folder), engine.plan(["a", "b"], ["x", "y"]), snapshot,
+                                 str(tmp_path / "journal")))
+
+    assert sorted(status for status, *_ in events) == ["error", "renamed"]
+    assert contents(folder) == {"y": "b"}
+
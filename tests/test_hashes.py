@@ -0,0 +1,90 @@
+import hashlib
+
+import pytest
+
+import massrenamer_engine as engine
+
+
+@pytest.fixture
+def folder(tmp_path):
+    files = {"a": b"same", "b": b"other", "c": b"same", "d": b"diff", "e": b"", "f": b""}
+    root = tmp_path / "files"
+    root.mkdir()
+    for name, data in files.items():
+        (root / name).write_bytes(data)
+    (root / "dir").mkdir()
+    return root
+
+
+def test_lookup_hashes_the_contents(folder, tmp_path):
+    cache = engine.DigestCache(str(tmp_path / "digests.json"))
+
+    digests = cache.lookup(str(folder), ["a", "b", "missing", "dir"])
+
+    assert digests == [hashlib.sha256(b"same").hexdigest(), hashlib.sha256(b"other").hexdigest(), None, None]
+
+
+def test_duplicates_groups_equal_files_in_line_order(folder, tmp_path):
+    cache = engine.DigestCache(str(tmp_path / "digests.json"))
+    names = ["f", "a", "b", "c", "d", "e", "dir"]
+
+    assert cache.duplicates(str(folder), names) == [[0, 5], [1, 3]]
+
+
+def test_saved_digests_are_not_read_again(folder, tmp_path, monkeypatch):
+    path = str(tmp_path / "digests.json")
+    cache = engine.DigestCache(path)
+    first = cache.lookup(str(folder), ["a", "b"])
+    cache.save()
+    read = []
+    monkeypatch.setattr(engine, "file_digest", lambda p: read.append(p) or "x")
+
+    assert engine.DigestCache(path).lookup(str(folder), ["a", "b"]) == first
+    assert read == []
+
+    # A changed file is read again
+    (folder / "b").write_bytes(b"changed, and longer")
+    assert engine.DigestCache(path).lookup(str(folder), ["a", "b"]) == [first[0], "x"]
+    assert read == [str(folder / "b")]
+
+
+def test_many_tasks_keep_the_order(folder, tmp_path, monkeypatch):
+    # One file per pool task
+    monkeypatch.setattr(engine, "HASH_TASK_BYTES", 1)
+    names = [f"n{i}" for i in range(50)]
+    for i, name in enumerate(names):
+        (folder / name).write_bytes(str(i).encode())
+    cache = engine.DigestCache(str(tmp_path / "digests.json"))
+
+    assert cache.lookup(str(folder), names, workers=4) == [hashlib.sha256(str(i).encode()).hexdigest()
+                                                          for i in range(50)]
+
+
+def test_iter_duplicates_reports_progress_then_the_groups(folder, tmp_path, monkeypatch):
+    # One file per part with one worker
+    monkeypatch.setattr(engine, "HASH_TASK_BYTES", 1)
+    cache = engine.DigestCache(str(tmp_path / "digests.json"))
+    names = ["f", "a", "b", "c", "d", "e", "dir"]
+
+    items = list(cache.iter_duplicates(str(folder), names, workers=1))
+
+    # Only the files sharing their size are read: a, c, d (4 bytes) and e, f (empty, so in a's part)
+    assert [(done, total) for done, total, _ in items] == [(2, 5), (3, 5), (4, 5), (5, 5)]
+    assert [groups for _, _, groups in items[:-1]] == [None] * 3
+    assert items[-1][2] == cache.duplicates(str(folder), names) == [[0, 5], [1, 3]]
+
+
+def test_iter_duplicates_without_candidates(folder, tmp_path):
+    cache = engine.DigestCache(str(tmp_path / "digests.json"))
+
+    assert list(cache.iter_duplicates(str(folder), ["a", "b", "dir"])) == [(0, 0, [])]
+
+
+def test_stopped_iter_duplicates_keeps_what_it_read(folder, tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "HASH_TASK_BYTES", 1)
+    cache = engine.DigestCache(str(tmp_path / "digests.json"))
+    items = cache.iter_duplicates(str(folder), ["a", "b", "c", "d"], workers=1)
+
+    assert next(items)[:2] == (1, 3)
+    items.close()
+    assert len(cache.entries) == 1
@@ -0,0 +1,71 @@
+import multiprocessing
+
+import massrenamer_engine as engine
+
+
+def run_batches(directory, count):
+    store = engine.HistoryStore(directory)
+    for _ in range(count):
+        batch = store.begin("/folder", [("a", "b", 0, 0)])
+        store.finish(batch, 1)
+
+
+def test_concurrent_processes_keep_every_batch(tmp_path):
+    # fork: the child only needs the module already imported here
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=run_batches, args=(str(tmp_path), 20)) for _ in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    assert [p.exitcode for p in processes] == [0] * 4
+    store = engine.HistoryStore(str(tmp_path))
+    assert len(store.batches) == 80
+    assert all(b["entries"] == 1 for b in store.batches)
+    assert not list(tmp_path.glob("*.plan"))
+
+
+def test_pop_forgets_the_batch(tmp_path):
+    store = engine.HistoryStore(str(tmp_path))
+    first, second = store.begin("/folder"), store.begin("/folder")
+    store.finish(first, 1)
+    store.finish(second, 2)
+
+    store.pop(second)
+
+    assert [b["id"] for b in engine.HistoryStore(str(tmp_path)).batches] == [first["id"]]
+
+
+def run_until_told(directory, started, stop):
+    store = engine.HistoryStore(directory)
+    batch = store.begin("/folder", [("a", "b", 0, 0)])
+    with open(store.journal_path(batch), "w") as f:
+        f.write('["/folder/b", "/folder/a"]\n')
+    started.set()
+    stop.wait(10)
+    store.finish(batch, 1)
+
+
+def test_batch_running_in_another_process_is_not_popped(tmp_path):
+    context = multiprocessing.get_context("fork")
+    started, stop = context.Event(), context.Event()
+    process = context.Process(target=run_until_told, args=(str(tmp_path), started, stop))
+    process.start()
+    try:
+        assert started.wait(10)
+        store = engine.HistoryStore(str(tmp_path))
+        batch = store.top()
+
+        assert store.running(batch)
+        assert not store.pop(batch)
+        assert store.load(batch)
+    finally:
+        stop.set()
+        process.join()
+
+    assert process.exitcode == 0
+    assert not store.running(batch)
+    assert [b["entries"] for b in store.refresh()] == [1]
+    assert store.pop(batch)
+    assert store.refresh() == []
@@ -0,0 +1,81 @@
+import json
+
+from massrenamer_engine import RenameJournal
+
+
+def write_journal(path, count, commit_interval=1):
+    with RenameJournal(str(path), commit_interval) as journal:
+        for i in range(count):
+            journal.append(f"/f/new{i}", f"/f/old{i}")
+
+
+def pairs(history):
+    return [tuple(entry[:2]) for entry in history]
+
+
+def test_read_returns_records_in_order(tmp_path):
+    write_journal(tmp_path / "journal", 3)
+
+    assert pairs(RenameJournal.read(str(tmp_path / "journal"))) == [
+        ("/f/new0", "/f/old0"), ("/f/new1", "/f/old1"), ("/f/new2", "/f/old2")]
+
+
+def test_torn_last_record_is_ignored(tmp_path):
+    path = tmp_path / "journal"
+    write_journal(path, 3)
+    data = path.read_bytes()
+    # A crash in the middle of the last write
+    path.write_bytes(data[:-7])
+
+    assert pairs(RenameJournal.read(str(path))) == [("/f/new0", "/f/old0"), ("/f/new1", "/f/old1")]
+
+
+def test_old_single_list_format_is_read(tmp_path):
+    path = tmp_path / "journal"
+    path.write_text(json.dumps([["/f/b", "/f/a"], ["/f/d", "/f/c"]]), encoding="utf-8")
+
+    assert pairs(RenameJournal.read(str(path))) == [("/f/b", "/f/a"), ("/f/d", "/f/c")]
+
+
+def test_group_commit_writes_every_record_on_close(tmp_path):
+    write_journal(tmp_path / "journal", 1000, commit_interval=256)
+
+    assert len(RenameJournal.read(str(tmp_path / "journal"))) == 1000
+
+
+def test_read_complete_stops_before_a_torn_record(tmp_path):
+    path = tmp_path / "journal"
+    write_journal(path, 3)
+    whole = path.read_bytes()
+    path.write_bytes(whole[:-7])
+
+    history, length = RenameJournal.read_complete(str(path))
+
+    assert pairs(history) == [("/f/new0", "/f/old0"), ("/f/new1", "/f/old1")]
+    assert whole[:length] == whole[:whole.index(b"\n", whole.index(b"new1")) + 1]
+
+
+def test_read_complete_skips_a_garbled_line_and_what_follows(tmp_path):
+    path = tmp_path / "journal"
+    write_journal(path, 1)
+    first = path.read_bytes()
+    path.write_bytes(first + b'["/f/new1", "/f/o\n["/f/new2", "/f/old2"]\n')
+
+    history, length = RenameJournal.read_complete(str(path))
+
+    assert pairs(history) == [("/f/new0", "/f/old0")]
+    assert length == len(first)
+
+
+def test_continued_journal_cuts_the_torn_record(tmp_path):
+    path = tmp_path / "journal"
+    write_journal(path, 2)
+    path.write_bytes(path.read_bytes() + b'["/f/torn')
+    _, length = RenameJournal.read_complete(str(path))
+
+    journal = RenameJournal(str(path)).open(keep=length)
+    journal.append("/f/new2", "/f/old2")
+    journal.close()
+
+    assert pairs(RenameJournal.read(str(path))) == [("/f/new0", "/f/old0"), ("/f/new1", "/f/old1"),
+                                                    ("/f/new2", "/f/old2")]
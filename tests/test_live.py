@@ -0,0 +1,62 @@
+import random
+
+import massrenamer_engine as engine
+
+ILLEGAL = ":?"
+
+
+def make_validator(existing=(), recursive=False):
+    return engine.LiveValidator(engine.Sanitizer(ILLEGAL, windows_rules=False), existing, recursive)
+
+
+def totals(validator):
+    return validator.names, validator.illegal_lines, validator.conflict_lines
+
+
+def test_counts_follow_line_edits():
+    live = make_validator(existing={"taken", "a"})
+    live.replace(0, 0, 1, ["a", "b", "c", ""])
+    live.replace(1, 0, 1, ["taken", "x:y", "dup", "dup"])
+
+    assert totals(live) == ((3, 4), 1, 3)
+    assert [live.line_problem(i) for i in range(4)] == [True, True, True, True]
+
+    # "dup" becomes unique, the taken name is freed by the batch itself
+    live.replace(1, 3, 1, ["other"])
+    live.replace(0, 0, 1, ["taken"])
+
+    assert totals(live) == ((3, 4), 1, 0)
+    assert live.mismatch
+
+
+def test_blank_lines_are_not_names():
+    live = make_validator()
+    live.replace(1, 0, 1, ["", "  ", "a", ""])
+
+    assert live.names == (0, 1)
+    assert not live.line_problem(0)
+
+
+def test_existing_names_are_ignored_in_recursive_mode():
+    live = make_validator(existing={"taken"}, recursive=True)
+    live.replace(1, 0, 1, ["taken", "dir:1/ok"])
+
+    # Only the last part of a path is checked for characters
+    assert totals(live) == ((0, 2), 0, 0)
+
+
+def test_random_edits_match_a_fresh_count():
+    rng = random.Random(0)
+    pool = ["a", "b", "c", "x:", "y?", "taken", ""]
+    live = make_validator(existing={"taken", "b"})
+    for _ in range(500):
+        column = rng.randrange(2)
+        lines = live.lines[column]
+        first = rng.randrange(len(lines) + 1)
+        removed = rng.randrange(min(3, len(lines) - first) + 1)
+        live.replace(column, first, removed, [rng.choice(pool) for _ in range(rng.randrange(3))])
+
+        fresh = make_validator(existing={"taken", "b"})
+        fresh.replace(0, 0, 1, list(live.lines[0]))
+        fresh.replace(1, 0, 1, list(live.lines[1]))
+        assert totals(live) == totals(fresh)
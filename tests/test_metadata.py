@@ -0,0 +1,160 @@
+import io
+import struct
+
+import pytest
+
+import massrenamer_engine as engine
+
+
+# --- Byte fixtures ---
+def tiff(order, ifd0, exif=None):
+    """A TIFF structure with ASCII tags: ifd0 and exif map tag numbers to strings."""
+    def ifd(tags, offset, extra):
+        # extra: (tag, value) LONG entries, such as the pointer to the EXIF IFD
+        entries, data = [], b""
+        data_offset = offset + 2 + 12 * (len(tags) + len(extra)) + 4
+        for tag, text in tags.items():
+            raw = text.encode("latin-1") + b"\0"
+            if len(raw) <= 4:
+                value = raw.ljust(4, b"\0")
+            else:
+                value = struct.pack(order + "I", data_offset + len(data))
+                data += raw
+            entries.append(struct.pack(order + "HHI", tag, 2, len(raw)) + value)
+        for tag, number in extra:
+            entries.append(struct.pack(order + "HHII", tag, 4, 1, number))
+        return struct.pack(order + "H", len(entries)) + b"".join(entries) + b"\0\0\0\0" + data
+
+    magic = b"II*\0" if order == "<" else b"MM\0*"
+    head = magic + struct.pack(order + "I", 8)
+    if exif is None:
+        return head + ifd(ifd0, 8, [])
+    # The EXIF IFD follows IFD0, whose size does not depend on the pointer's value
+    size0 = len(ifd(ifd0, 8, [(engine._EXIF_IFD, 0)]))
+    return head + ifd(ifd0, 8, [(engine._EXIF_IFD, 8 + size0)]) + ifd(exif, 8 + size0, [])
+
+def reader(data):
+    return lambda offset, size: data[offset:offset + size]
+
+def id3_frame(frame_id, text, encoding=0):
+    body = bytes([encoding]) + (text.encode("utf-16") if encoding == 1 else text.encode("latin-1"))
+    return frame_id.encode() + struct.pack(">I", len(body)) + b"\0\0" + body
+
+def id3v2(*frames, major=3):
+    data = b"".join(frames)
+    size = len(data)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3" + bytes([major, 0, 0]) + syncsafe + data
+
+def id3v1(title, artist, album, year, track=0):
+    def field(text, size):
+        return text.encode("latin-1").ljust(size, b"\0")
+    return (b"TAG" + field(title, 30) + field(artist, 30) + field(album, 30) + field(year, 4)
+            + b"\0" * 28 + bytes([0, track, 255]))
+
+def vorbis_comment(*entries, vendor=b"test"):
+    data = struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(entries))
+    for entry in entries:
+        raw = entry.encode("utf-8")
+        data += struct.pack("<I", len(raw)) + raw
+    return data
+
+def ogg_page(*packets):
+    lacing, body = [], b""
+    for packet in packets:
+        lacing += [255] * (len(packet) // 255) + [len(packet) % 255]
+        body += packet
+    return b"OggS" + b"\0" * 22 + bytes([len(lacing)]) + bytes(lacing) + body
+
+
+# --- EXIF ---
+@pytest.mark.parametrize("order", ["<", ">"])
+def test_parse_tiff_reads_camera_and_original_date(order):
+    data = tiff(order, {engine._EXIF_MAKE: "Canon", engine._EXIF_MODEL: "Canon EOS 5D",
+                        engine._EXIF_DATETIME: "2001:01:01 00:00:00"},
+                exif={engine._EXIF_ORIGINAL: "2020:05:04 10:11:12"})
+
+    assert engine._parse_tiff(reader(data)) == {"date": "2020-05-04T10:11:12", "camera": "Canon EOS 5D"}
+
+
+def test_parse_tiff_joins_make_and_model_and_skips_a_blank_date():
+    data = tiff("<", {engine._EXIF_MAKE: "NIKON", engine._EXIF_MODEL: "D90",
+                      engine._EXIF_DATETIME: "0000:00:00 00:00:00"})
+
+    assert engine._parse_tiff(reader(data)) == {"camera": "NIKON D90"}
+
+
+def test_parse_tiff_refuses_other_data():
+    assert engine._parse_tiff(reader(b"GIF89a\0\0\0\0")) == {}
+
+
+def test_read_metadata_finds_exif_in_a_jpeg(tmp_path):
+    exif = b"Exif\0\0" + tiff(">", {engine._EXIF_DATETIME: "2019:12:31 23:59:59"})
+    jpeg = (b"\xff\xd8" + b"\xff\xe0" + struct.pack(">H", 4) + b"JF"
+            + b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif + b"\xff\xda\0\2")
+    (tmp_path / "a.jpg").write_bytes(jpeg)
+
+    assert engine.read_metadata(str(tmp_path / "a.jpg")) == {"date": "2019-12-31T23:59:59"}
+
+
+# --- ID3 ---
+def test_read_id3_v23_frames():
+    data = id3v2(id3_frame("TIT2", "Song", encoding=1), id3_frame("TPE1", "Band"),
+                 id3_frame("TRCK", "3/12"), id3_frame("TYER", "1999"), id3_frame("TIT2", "Second title"))
+
+    assert engine._read_id3(io.BytesIO(data)) == {"title": "Song", "artist": "Band", "track": "3", "year": "1999"}
+
+
+def test_read_id3_v22_frames():
+    def frame(frame_id, text):
+        body = b"\0" + text.encode("latin-1")
+        return frame_id.encode() + len(body).to_bytes(3, "big") + body
+    data = id3v2(frame("TT2", "Old"), frame("TAL", "Album"), major=2)
+
+    assert engine._read_id3(io.BytesIO(data)) == {"title": "Old", "album": "Album"}
+
+
+def test_read_id3_falls_back_to_v1():
+    data = b"\0" * 200 + id3v1("Title", "Artist", "", "2004", track=7)
+
+    assert engine._read_id3(io.BytesIO(data)) == {"title": "Title", "artist": "Artist", "year": "2004",
+                                                  "track": "7"}
+
+
+# --- Vorbis comments: FLAC and Ogg ---
+def test_parse_vorbis_comment_keeps_the_first_value_of_each_key():
+    data = vorbis_comment("title=One", "TITLE=Two", "tracknumber=05/10", "DATE=2011-02-03", "comment=x")
+
+    assert engine._parse_vorbis_comment(data) == {"title": "One", "track": "05", "year": "2011"}
+
+
+def test_parse_vorbis_comment_cut_short_gives_what_it_holds():
+    data = vorbis_comment("ARTIST=Someone", "ALBUM=Record")
+    # The block ends inside the length of the second comment
+    cut = len(vorbis_comment("ARTIST=Someone")) + 2
+
+    assert engine._parse_vorbis_comment(data[:cut]) == {"artist": "Someone"}
+
+
+def test_read_flac_skips_to_the_comment_block():
+    comment = vorbis_comment("ALBUM=Record")
+    data = (b"fLaC" + bytes([0]) + (34).to_bytes(3, "big") + b"\0" * 34
+            + bytes([0x80 | 4]) + len(comment).to_bytes(3, "big") + comment)
+
+    assert engine._read_flac(io.BytesIO(data)) == {"album": "Record"}
+
+
+@pytest.mark.parametrize("magic", [b"\x03vorbis", b"OpusTags"])
+def test_read_ogg_reads_the_second_packet(magic):
+    comment = magic + vorbis_comment("ARTIST=Someone", "TITLE=" + "y" * 600)
+    # The comment packet goes on past a page: its first 510 bytes end in 255 lacing values
+    continued = b"OggS" + b"\0" * 22 + bytes([2, 255, 255]) + comment[:510]
+    data = ogg_page(b"\x01vorbis-identification") + continued + ogg_page(comment[510:])
+
+    assert engine._read_ogg(io.BytesIO(data)) == {"artist": "Someone", "title": "y" * 600}
+
+
+def test_read_ogg_refuses_other_streams():
+    data = ogg_page(b"\x80theora") + ogg_page(b"\x81theora-comments")
+
+    assert engine._read_ogg(io.BytesIO(data)) == {}
@@ -0,0 +1,38 @@
+import pytest
+
+from massrenamer_engine import plan_renames
+
+
+def run_plan(files, steps):
+    """Replays steps on {name: contents}, refusing any move onto an existing name as the app does."""
+    files = dict(files)
+    for src, dst, _, _ in steps:
+        assert dst not in files, f"{src} -> {dst} overwrites a file"
+        files[dst] = files.pop(src)
+    return files
+
+
+@pytest.mark.parametrize("origs, news", [
+    (["a", "b"], ["b", "a"]),
+    (["a", "b", "c"], ["b", "c", "a"]),
+    (["a", "b", "c"], ["b", "c", "d"]),
+    (["c", "b", "a"], ["d", "c", "b"]),
+    (["a", "b", "c", "d", "e"], ["b", "a", "d", "e", "c"]),
+])
+def test_swaps_rotations_and_chains_never_overwrite(origs, news):
+    files = {name: name for name in origs}
+
+    steps = plan_renames(origs, news)
+
+    assert run_plan(files, steps) == {n: o for o, n in zip(origs, news)}
+
+
+def test_each_cycle_uses_one_temporary_name():
+    steps = plan_renames(["a", "b", "c"], ["b", "c", "a"])
+
+    assert len(steps) == 4
+    assert [(o, n) for _, d, o, n in steps if d != n] == [("a", "b")]
+
+
+def test_identity_renames_are_dropped():
+    assert plan_renames(["a", "b"], ["a", "c"]) == [("b", "c", "b", "c")]
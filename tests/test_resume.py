@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+import massrenamer_engine as engine
+from test_execute import contents, make_tree
+
+# A rotation (run through a temporary name) and a chain
+ORIGS = ["a", "b", "c", "x", "y"]
+NEWS = ["b", "c", "a", "y", "z"]
+
+
+def interrupt(folder, journal, ran, kept):
+    """Runs the first ran steps of the batch, then keeps the first kept journal records, as a crash would.
+
+    Returns the plan as HistoryStore.claim() reads it back.
+    """
+    steps = engine.plan(ORIGS, NEWS)
+    plan = {"recursive": False, "steps": steps, "starts": engine.cycle_starts(folder, steps)}
+    snapshot = engine.take_snapshot(folder, ORIGS)
+    events = list(engine.execute(folder, steps[:ran], snapshot, journal))
+    assert all(status in ("renamed", "step") for status, *_ in events)
+    with open(journal) as f:
+        records = f.readlines()
+    with open(journal, "w") as f:
+        f.writelines(records[:kept])
+    return json.loads(json.dumps(plan))
+
+
+@pytest.mark.parametrize("ran", range(7))
+def test_resume_finishes_the_batch_whatever_the_journal_lost(tmp_path, ran):
+    for kept in range(ran + 1):
+        folder, journal = tmp_path / f"files{kept}", str(tmp_path / f"journal{kept}")
+        make_tree(folder, ORIGS)
+        before = contents(folder)
+        plan = interrupt(str(folder), journal, ran, kept)
+
+        check = engine.check_resume(str(folder), plan, journal, str(tmp_path / "config"))
+        assert not check.inconsistent
+        events = list(engine.execute(str(folder), check.steps, check.snapshot, journal, resume=check))
+
+        assert all(status in ("renamed", "step", "recovered") for status, *_ in events)
+        assert contents(folder) == {n: o for o, n in zip(ORIGS, NEWS)}
+        history = engine.load_history(journal)
+        assert len(history) == len(plan["steps"])
+        assert all(status == "undone" for status, *_ in engine.undo(history))
+        assert contents(folder) == before
+
+
+def test_step_whose_file_vanished_is_inconsistent(tmp_path):
+    folder, journal = tmp_path / "files", str(tmp_path / "journal")
+    make_tree(folder, ORIGS)
+    plan = interrupt(str(folder), journal, 0, 0)
+    os.remove(folder / "x")
+
+    check = engine.check_resume(str(folder), plan, journal, str(tmp_path / "config"))
+
+    assert [(step[2], reason) for step, reason in check.inconsistent] == [("x", "missing")]
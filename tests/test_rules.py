@@ -0,0 +1,90 @@
+import pytest
+
+import massrenamer_engine as engine
+
+
+def apply(text, names):
+    return engine.RulePipeline(text).apply(names)
+
+
+@pytest.mark.parametrize("text, names, expected", [
+    ("replace a b", ["banana.txt"], ["bbnbnb.txt"]),
+    ("replace A x i", ["Aa.a"], ["xx.a"]),
+    (r"regex (\d+)-(\d+) \2-\1", ["10-20.jpg"], ["20-10.jpg"]),
+    ("insert 0 pre_", ["a.txt"], ["pre_a.txt"]),
+    ("insert end _post", ["a.txt"], ["a_post.txt"]),
+    ("remove -2 5", ["abcdef.txt"], ["abcd.txt"]),
+    ("counter 1 1 3", ["a.txt", "b.txt"], ["a001.txt", "b002.txt"]),
+    ("counter 10 5 1 0", ["a", "b"], ["10a", "15b"]),
+    ("case upper", ["a.txt"], ["A.txt"]),
+    ("transliterate", ["Ærø ß.txt"], ["AEro ss.txt"]),
+    ('replace " " _', ["a b c.txt"], ["a_b_c.txt"]),
+])
+def test_each_rule_changes_the_stem(text, names, expected):
+    assert apply(text, names) == expected
+
+
+def test_rules_run_in_order_and_scope_switches_to_the_whole_name():
+    text = "\n".join(["# the stem in capitals, then the whole name", "case upper", "", "scope name", "replace .TXT .md",
+                      "replace .txt .md"])
+
+    assert apply(text, ["a.txt", ".hidden"]) == ["A.md", ".HIDDEN"]
+
+
+def test_only_the_last_component_of_a_path_changes():
+    assert apply("case upper", ["dir/sub/a.txt"]) == ["dir/sub/A.txt"]
+
+
+@pytest.mark.parametrize("text, key", [
+    ("explode", "rule_unknown"),
+    ("counter x", "rule_syntax"),
+    ("regex ( x", "rule_regex"),
+    (r"regex a \3", "rule_regex"),
+    ('replace "a b', "rule_syntax"),
+    ("scope everything", "rule_syntax"),
+])
+def test_bad_lines_report_their_number(text, key):
+    with pytest.raises(engine.EngineError) as caught:
+        engine.RulePipeline("case lower\n" + text)
+
+    assert caught.value.key == key
+    assert caught.value.params[0] == 2
+
+
+def test_empty_text_is_falsy():
+    assert not engine.RulePipeline("# nothing\n\n")
+
+
+# --- format ---
+def test_format_fills_tokens_and_leaves_missing_ones_empty():
+    pipeline = engine.RulePipeline('format "{artist} - {track:02d} {name}"')
+
+    assert pipeline("song.mp3", 0, {"artist": "Band", "track": 3}) == "Band - 03 song.mp3"
+    assert pipeline("song.mp3", 0, {}) == " -  song.mp3"
+
+
+@pytest.mark.parametrize("tags", [{"track": "A1"}, {"year": "c. 1"}, {"track": "A1", "year": 2000}])
+def test_format_spec_that_does_not_suit_a_tag_writes_it_as_missing(tags):
+    pipeline = engine.RulePipeline("format {track:02d}-{year:04d}-{name}")
+    expected = "-".join(f"{tags[k]:{spec}}" if isinstance(tags.get(k), int) else ""
+                        for k, spec in (("track", "02d"), ("year", "04d"))) + "-a"
+
+    assert pipeline("a.mp3", 0, tags) == expected + ".mp3"
+
+
+@pytest.mark.parametrize("template", ["{date.year}", "{title[0]}", "{colour}", "{track:q}", "{name:02d}"])
+def test_format_refuses_what_would_fail_on_some_files(template):
+    with pytest.raises(engine.EngineError) as caught:
+        engine.RulePipeline(f"format {template}")
+
+    assert caught.value.key in ("rule_field", "rule_syntax")
+
+
+@pytest.mark.parametrize("text", ["format {title}", "scope name\nformat {title}", "remove 0 1", r"regex ^\d+$ ''"])
+def test_a_name_left_empty_is_refused_with_its_line(text):
+    pipeline = engine.RulePipeline(text)
+
+    with pytest.raises(engine.EngineError) as caught:
+        pipeline.apply(["keep.txt", "1.txt"], [{"title": "Song"}, {}])
+
+    assert (caught.value.key, caught.value.params) == ("empty_name", (2, "1.txt"))
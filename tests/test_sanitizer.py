@@ -0,0 +1,53 @@
+import pytest
+
+import massrenamer_engine as engine
+
+NAMES = [
+    "fine.txt",
+    "a:b?.txt",                      # refused characters
+    "CON.txt", "nul", "com1.tar.gz",  # reserved device names
+    "CONSOLE.txt",                   # only starts like one
+    "trailing.", "space ",           # trailing dot and space
+    "x" * 300 + ".jpg",              # too long in characters
+    "é" * 200 + ".png",              # too long in bytes only
+    ":?*",                           # only refused characters
+]
+
+
+def test_check_finds_each_rule():
+    problems = engine.sanitizer_for().check(NAMES)
+
+    assert {":", "?", "*"} <= problems.chars
+    assert problems.reserved == [2, 3, 4]
+    assert problems.trailing == [6, 7]
+    assert problems.too_long == [8, 9]
+
+
+def test_clean_output_passes_check():
+    sanitizer = engine.sanitizer_for()
+    cleaned = sanitizer.clean(NAMES)
+
+    assert not sanitizer.check(cleaned)
+    assert cleaned[:8] == ["fine.txt", "ab.txt", "CON_.txt", "nul_", "com1_.tar.gz", "CONSOLE.txt",
+                           "trailing", "space"]
+    assert cleaned[8].endswith(".jpg") and len(cleaned[8].encode()) == engine.NAME_MAX
+    assert cleaned[9].endswith(".png") and len(cleaned[9].encode()) <= engine.NAME_MAX
+    assert cleaned[10] == "_"
+
+
+def test_linux_only_rules_keep_windows_names():
+    sanitizer = engine.sanitizer_for(windows=False, macos=False, ios=False, android=False)
+    names = ["CON.txt", "trailing.", "a:b"]
+
+    assert not sanitizer.check(names)
+    assert sanitizer.clean(names) == names
+
+
+@pytest.mark.parametrize("name", ["", "a/b"])
+def test_recursive_names_are_checked_by_their_last_part(name):
+    sanitizer = engine.sanitizer_for()
+    names = [f"dir:1/{name}x?", "CON/ok"]
+
+    assert sanitizer.check(names, recursive=True).chars == {"?"}
+    assert sanitizer.clean(names, recursive=True) == [f"dir:1/{name}x", "CON/ok"]
+    assert sanitizer.is_valid("CON/ok", recursive=True)
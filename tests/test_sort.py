@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import massrenamer_engine as engine
+
+
+def test_natural_key_compares_numbers_by_value():
+    names = ["img10.jpg", "IMG2.jpg", "img1.jpg", "img2b.jpg", "a100", "a20"]
+
+    assert sorted(names, key=engine.natural_key) == ["a20", "a100", "img1.jpg", "IMG2.jpg", "img2b.jpg",
+                                                     "img10.jpg"]
+
+
+def test_natural_key_handles_long_numbers_and_leading_zeros():
+    assert engine.natural_key("x007") == engine.natural_key("x7")
+    assert engine.natural_key("x99999999999999999999") > engine.natural_key("x100")
+    assert engine.natural_key("v1.10") > engine.natural_key("v1.9")
+
+
+@pytest.fixture
+def listing_folder(tmp_path):
+    # Sizes and times in the opposite order of the names
+    for i, name in enumerate(["c10", "b2", "a1"]):
+        with open(tmp_path / name, "w") as f:
+            f.write("x" * (i + 1))
+        os.utime(tmp_path / name, ns=(0, (i + 1) * 10**9))
+    return tmp_path
+
+
+@pytest.mark.parametrize("with_stats", [False, True])
+def test_listing_orders(listing_folder, with_stats):
+    stats = {} if with_stats else None
+    names = list(engine.iter_files(str(listing_folder), stats))
+    listing = engine.FolderListing(str(listing_folder), names, stats)
+
+    assert listing.sorted("name") == ["a1", "b2", "c10"]
+    assert listing.sorted("natural") == ["a1", "b2", "c10"]
+    assert listing.sorted("mtime") == ["c10", "b2", "a1"]
+    assert listing.sorted("size") == ["c10", "b2", "a1"]
+    # Each order is sorted once and kept
+    assert listing.sorted("size") is listing.sorted("size")
+
+
+def test_unknown_order_is_refused(listing_folder):
+    with pytest.raises(ValueError):
+        engine.FolderListing(str(listing_folder), ["a1"]).sorted("colour")